@@ -0,0 +1,84 @@
+"""Headless benchmark of chat_core.ChatEngine against the fake Gemini backend.
+
+Drives concurrent sessions straight through the engine (no Streamlit), so it
+measures the shared client, generation queue and cache on their own:
+
+    python bench/engine_bench.py --sessions 200 --concurrency 50
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from load_test import QUESTIONS, SRC, percentiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--persona", default="lyly")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20, help="sessions running at once")
+    parser.add_argument("--turns", type=int, default=3, help="chat turns per session")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="generation service stream limit")
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    os.environ.update({
+        "GEMINI_BACKEND": "fake",
+        "FAKE_GEMINI_FIRST_TOKEN_DELAY": str(args.first_token_delay),
+        "FAKE_GEMINI_TOKENS_PER_SECOND": str(args.tokens_per_second),
+        "CHAT_MAX_CONCURRENCY": str(args.max_concurrency),
+        "CHAT_MAX_QUEUE": str(args.sessions),
+        "CHAT_SESSION_RATE": "100000",
+        "CHAT_SESSION_BURST": "100000",
+        "CHAT_CACHE_SIZE": "0",
+    })
+    sys.path.insert(0, str(SRC))
+    from chat_core import PERSONAS, ChatEngine, ChatSession, StreamRenderer
+
+    engine = ChatEngine(PERSONAS[args.persona])
+    samples = {"ttft_ms": [], "e2e_ms": []}
+    lock = threading.Lock()
+
+    def run_session(index):
+        session = ChatSession(engine.persona)
+        for turn in range(args.turns):
+            question = f"{QUESTIONS[(index + turn) % len(QUESTIONS)]} (#{index}.{turn})"
+            renderer = StreamRenderer(lambda text, done: None)
+            for chunk in engine.stream(session, question):
+                renderer.feed(chunk.text)
+            session.add_assistant(renderer.finish())
+            stats = renderer.stats()
+            with lock:
+                samples["ttft_ms"].append(stats["ttft_ms"])
+                samples["e2e_ms"].append(stats["total_ms"])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(run_session, range(args.sessions)))
+    wall = time.perf_counter() - started
+
+    responses = len(samples["e2e_ms"])
+    report = {
+        "config": vars(args),
+        "responses": responses,
+        "wall_seconds": round(wall, 2),
+        "responses_per_second": round(responses / wall, 2),
+        "ttft_ms": percentiles(samples["ttft_ms"]),
+        "e2e_ms": percentiles(samples["e2e_ms"]),
+        "engine": engine.stats(),
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Headless load test for the Streamlit pages against the fake Gemini backend.
+
+Runs many simulated chat sessions concurrently through Streamlit's AppTest and
+prints a JSON report (latency percentiles, renders per response, memory per
+session) that can be saved and compared between runs. AppTest swaps global
+runtime state on every run, so concurrent sessions are spread over worker
+processes, each driving its share of sessions one at a time:
+
+    python bench/load_test.py --sessions 50 --concurrency 10 --output baseline.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+
+QUESTIONS = [
+    "Mình hay bị căng thẳng trước kỳ thi, phải làm sao?",
+    "Làm thế nào để ngủ ngon hơn khi đang ôn thi?",
+    "Mình cảm thấy bị bạn bè cô lập, mình nên làm gì?",
+    "Có cách nào để tập trung học tốt hơn không?",
+    "Mình hay cãi nhau với bố mẹ, làm sao để nói chuyện với bố mẹ?",
+]
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": round(ordered[-1], 1)}
+
+
+def rss_kb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def configure(args):
+    """Point the app at the fake backend, with no rate limiting and no cache"""
+    os.environ.update({
+        "GEMINI_BACKEND": "fake",
+        "FAKE_GEMINI_TOKENS_PER_SECOND": str(args.tokens_per_second),
+        "FAKE_GEMINI_CHUNK_CHARS": str(args.chunk_chars),
+        "FAKE_GEMINI_FIRST_TOKEN_DELAY": str(args.first_token_delay),
+        "FAKE_GEMINI_ANSWER_CHARS": str(args.answer_chars),
+        "FAKE_GEMINI_ERROR_RATE": str(args.error_rate),
+        "CHAT_SESSION_RATE": "100000",
+        "CHAT_SESSION_BURST": "100000",
+        "CHAT_CACHE_SIZE": "0",
+        "CHAT_DB_PATH": os.path.join(tempfile.mkdtemp(prefix="chat_bench_"), "chat.sqlite3"),
+    })
+    sys.path.insert(0, str(SRC))
+
+
+def run_worker(args, session_ids):
+    """Drive a share of the sessions in this process and return raw samples"""
+    configure(args)
+    from streamlit.testing.v1 import AppTest
+
+    results = {"e2e_ms": [], "ttft_ms": [], "renders": [], "errors": 0}
+    sessions = []
+    # Warm up imports and shared services so they are not billed to the first session
+    AppTest.from_file(args.app, default_timeout=args.timeout).run()
+    rss_before = rss_kb()
+    for index in session_ids:
+        at = AppTest.from_file(args.app, default_timeout=args.timeout)
+        at.run()
+        for turn in range(args.turns):
+            question = f"{QUESTIONS[(index + turn) % len(QUESTIONS)]} (#{index}.{turn})"
+            started = time.perf_counter()
+            at.chat_input[0].set_value(question).run()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            stats = at.session_state["render_stats"] if "render_stats" in at.session_state else None
+            if at.exception or stats is None:
+                results["errors"] += 1
+                continue
+            results["e2e_ms"].append(elapsed_ms)
+            if stats["ttft_ms"] is not None:
+                results["ttft_ms"].append(stats["ttft_ms"])
+            results["renders"].append(stats["renders"])
+        # Keep finished sessions alive so their memory is counted
+        sessions.append(at)
+    results["rss_growth_kb"] = rss_kb() - rss_before
+    results["sessions"] = len(sessions)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", default=str(SRC / "ui.py"), help="Streamlit page to drive")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=10, help="worker processes driving sessions in parallel")
+    parser.add_argument("--turns", type=int, default=3, help="chat turns per session")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds per script run")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--chunk-chars", type=int, default=24)
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    parser.add_argument("--answer-chars", type=int, default=600)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    shares = [list(range(i, args.sessions, args.concurrency)) for i in range(args.concurrency)]
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.concurrency) as pool:
+        outcomes = list(pool.map(run_worker, [args] * len(shares), shares))
+    wall = time.perf_counter() - started
+
+    results = {"e2e_ms": [], "ttft_ms": [], "renders": [], "errors": 0}
+    for outcome in outcomes:
+        for name in ("e2e_ms", "ttft_ms", "renders"):
+            results[name].extend(outcome[name])
+        results["errors"] += outcome["errors"]
+    sessions = sum(o["sessions"] for o in outcomes)
+    rss_growth = sum(o["rss_growth_kb"] for o in outcomes)
+
+    responses = len(results["e2e_ms"])
+    renders = sorted(results["renders"])
+    report = {
+        "config": vars(args),
+        "responses": responses,
+        "errors": results["errors"],
+        "wall_seconds": round(wall, 2),
+        "responses_per_second": round(responses / wall, 2) if wall else None,
+        "ttft_ms": percentiles(results["ttft_ms"]),
+        "e2e_ms": percentiles(results["e2e_ms"]),
+        "renders_per_response": {
+            "mean": round(sum(renders) / len(renders), 1) if renders else None,
+            "p95": percentiles(renders)["p95"],
+        },
+        "memory_per_session_kb": round(rss_growth / sessions, 1) if sessions else None,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Per-chunk cost of drawing a streamed LyLy answer (chat_core.markdown).
+
+Replays a long synthetic answer (paragraphs, lists, bold text, a code block)
+chunk by chunk and times building the message HTML after every chunk, as the
+page does on each redraw, three ways:
+
+    raw          the old f-string: content pasted into the HTML unescaped
+    full         escaped markdown conversion of the whole text on every chunk
+    incremental  IncrementalMarkdown, reparsing only the unfinished last block
+
+"raw" leaves the markdown parse to Streamlit's frontend, which also redoes it
+over the whole text on every redraw; it is the baseline cost of doing nothing.
+
+    python bench/markdown_bench.py --answers 20 --paragraphs 40
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+from load_test import SRC, percentiles
+from retrieval_bench import SYLLABLES
+
+
+def sentence(rng, words=14):
+    text = " ".join(rng.choice(SYLLABLES) for _ in range(rng.randint(words // 2, words * 3 // 2)))
+    if rng.random() < 0.3:
+        word = rng.choice(SYLLABLES)
+        text = text.replace(word, f"**{word}**", 1)
+    return text.capitalize() + "."
+
+
+def answer_text(rng, paragraphs):
+    blocks = []
+    for _ in range(paragraphs):
+        kind = rng.random()
+        if kind < 0.2:
+            blocks.append("\n".join(f"{n}. {sentence(rng, 8)}" for n in range(1, rng.randint(3, 6))))
+        elif kind < 0.35:
+            blocks.append("\n".join(f"- {sentence(rng, 6)}" for _ in range(rng.randint(2, 5))))
+        elif kind < 0.4:
+            blocks.append("```\n" + "\n".join(sentence(rng, 5) for _ in range(4)) + "\n```")
+        else:
+            blocks.append(" ".join(sentence(rng) for _ in range(rng.randint(2, 4))))
+    return "\n\n".join(blocks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--answers", type=int, default=20)
+    parser.add_argument("--paragraphs", type=int, default=30, help="blocks per answer")
+    parser.add_argument("--chunk-chars", type=int, default=24, help="characters per streamed chunk")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(SRC))
+    from chat_core.markdown import IncrementalMarkdown, markdown_html
+
+    def raw(text):
+        return f"<div class='chat-message-assistant'><p><strong>LyLy:</strong> {text}</p></div>"
+
+    def full(text):
+        return f"<div class='chat-message-assistant'>{markdown_html(text)}</div>"
+
+    rng = random.Random(args.seed)
+    answers = [answer_text(rng, args.paragraphs) for _ in range(args.answers)]
+    samples = {"raw": [], "full": [], "incremental": []}
+    totals = dict.fromkeys(samples, 0.0)
+    chunks = 0
+    for text in answers:
+        markdown = IncrementalMarkdown()
+
+        def incremental(text):
+            return f"<div class='chat-message-assistant'>{markdown.render(text)}</div>"
+
+        for name, draw in (("raw", raw), ("full", full), ("incremental", incremental)):
+            for end in range(args.chunk_chars, len(text) + args.chunk_chars, args.chunk_chars):
+                started = time.perf_counter()
+                draw(text[:end] + "▌")
+                elapsed_us = (time.perf_counter() - started) * 1e6
+                samples[name].append(elapsed_us)
+                totals[name] += elapsed_us
+        chunks += -(-len(text) // args.chunk_chars)
+        # The streamed result is exactly what a one-shot conversion gives
+        assert markdown.render(text) == markdown_html(text)
+
+    report = {
+        "config": vars(args),
+        "answer_chars": sum(len(text) for text in answers) // len(answers),
+        "chunks_per_answer": chunks // len(answers),
+        "per_chunk_us": {name: percentiles(values) for name, values in samples.items()},
+        "per_answer_ms": {name: round(total / len(answers) / 1000, 2) for name, total in totals.items()},
+    }
+    report["incremental_speedup_over_full"] = round(totals["full"] / totals["incremental"], 1)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
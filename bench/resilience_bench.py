@@ -0,0 +1,115 @@
+"""Tail-latency policies (chat_core.resilience) against the fake Gemini backend.
+
+Each scenario injects one kind of upstream trouble into the fake and runs the
+same requests through the generation service with the policy off and on,
+reporting latency percentiles, failures and the service's retry, hedge and
+breaker counters:
+
+    python bench/resilience_bench.py --requests 200 --concurrency 16
+
+Scenarios:
+    slow_tail  a share of responses start late        -> hedging
+    flaky      a share of requests fail up front      -> retries
+    stalled    every response starts very late        -> first-chunk deadline
+    outage     every request fails                    -> circuit breaker
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from load_test import SRC, percentiles
+
+OFF = dict(first_chunk_timeout=0, hedge_after=0, max_retries=0, breaker_failures=0)
+
+
+def scenarios(args):
+    on = dict(first_chunk_timeout=args.first_chunk_timeout, hedge_after=args.hedge_after, max_retries=2,
+              retry_base_delay=0.05, retry_max_delay=0.5, breaker_failures=5, breaker_cooldown=60)
+    return {
+        "slow_tail": (dict(slow_rate=0.1, slow_delay=args.slow_delay), OFF, dict(on, max_retries=0)),
+        "flaky": (dict(connect_error_rate=0.3), OFF, dict(on, breaker_failures=0)),
+        "stalled": (dict(slow_rate=1.0, slow_delay=args.slow_delay), OFF, dict(on, hedge_after=0, max_retries=0)),
+        "outage": (dict(connect_error_rate=1.0), OFF, on),
+    }
+
+
+def run(args, fake_overrides, policy_overrides):
+    from chat_core.fake import FakeGeminiClient, FakeSettings
+    from chat_core.metrics import NullMetrics
+    from chat_core.resilience import ResiliencePolicy
+    from chat_core.service import GenerationService
+
+    settings = FakeSettings(tokens_per_second=args.tokens_per_second, first_token_delay=args.first_token_delay,
+                            answer_chars=args.answer_chars, seed=args.seed, **fake_overrides)
+    client = FakeGeminiClient(settings)
+    service = GenerationService(client, max_concurrency=args.concurrency, max_queue=args.requests,
+                                session_rate=1e6, session_burst=1e6, metrics=NullMetrics(),
+                                policy=ResiliencePolicy(**policy_overrides))
+    samples = {"ttft_ms": [], "total_ms": [], "errors": {}}
+    lock = threading.Lock()
+
+    def one(i):
+        started = time.perf_counter()
+        ttft = None
+        try:
+            for _ in service.stream(f"bench-{i}", "gemini-2.0-flash", None, "hello"):
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+        except Exception as e:
+            with lock:
+                samples["errors"][type(e).__name__] = samples["errors"].get(type(e).__name__, 0) + 1
+            return
+        with lock:
+            samples["ttft_ms"].append(ttft * 1000)
+            samples["total_ms"].append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(one, range(args.requests)))
+    stats = service.stats()
+    return {
+        "wall_seconds": round(time.perf_counter() - started, 2),
+        "ok": len(samples["ttft_ms"]),
+        "errors": samples["errors"],
+        "ttft_ms": percentiles(samples["ttft_ms"]),
+        "total_ms": percentiles(samples["total_ms"]),
+        "upstream_requests": client.request_count,
+        **{k: stats[k] for k in ("retries", "hedges", "hedge_wins", "first_chunk_timeouts", "unavailable")},
+        "breaker": stats["breaker"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--tokens-per-second", type=float, default=400.0)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--answer-chars", type=int, default=300)
+    parser.add_argument("--slow-delay", type=float, default=3.0, help="first-token delay of slow responses")
+    parser.add_argument("--hedge-after", type=float, default=0.5)
+    parser.add_argument("--first-chunk-timeout", type=float, default=1.0)
+    parser.add_argument("--scenario", action="append", help="run only these scenarios")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(SRC))
+    report = {"config": vars(args), "scenarios": {}}
+    for name, (fake, off, on) in scenarios(args).items():
+        if args.scenario and name not in args.scenario:
+            continue
+        report["scenarios"][name] = {"policy_off": run(args, fake, off), "policy_on": run(args, fake, on)}
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Benchmark of the memory-mapped passage index (chat_core.retrieval).
+
+Generates a synthetic corpus, builds float16 and int8 indexes from it and
+reports build time, size on disk, open time and query latency:
+
+    python bench/retrieval_bench.py --docs 2000 --queries 500
+"""
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from load_test import QUESTIONS, SRC, percentiles
+
+SYLLABLES = (
+    "học sinh thầy cô bạn bè gia đình căng thẳng lo âu giấc ngủ kỳ thi tập trung "
+    "cảm xúc buồn vui chia sẻ lắng nghe tư vấn sức khỏe tâm lý trường lớp bài tập "
+    "thời gian nghỉ ngơi vận động ăn uống điện thoại mạng xã hội bắt nạt tự tin "
+    "mục tiêu kế hoạch thói quen áp lực điểm số ước mơ nghề nghiệp tình bạn xung đột"
+).split()
+
+
+def make_corpus(path, docs, paragraphs, rng):
+    for d in range(docs):
+        text = "\n\n".join(
+            " ".join(rng.choice(SYLLABLES) for _ in range(rng.randint(40, 120))) + "."
+            for _ in range(paragraphs)
+        )
+        (path / f"doc{d:05d}.txt").write_text(text, encoding="utf-8")
+
+
+def dir_size(path):
+    return sum(p.stat().st_size for p in path.iterdir())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--paragraphs", type=int, default=6, help="paragraphs per document")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--dim", type=int, default=4096)
+    parser.add_argument("-k", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(SRC))
+    from chat_core.retrieval import PassageIndex, build_index
+
+    rng = random.Random(args.seed)
+    queries = [rng.choice(QUESTIONS) if i % 2 else " ".join(rng.sample(SYLLABLES, 6))
+               for i in range(args.queries)]
+    report = {"config": vars(args), "indexes": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        docs_dir = Path(tmp) / "docs"
+        docs_dir.mkdir()
+        make_corpus(docs_dir, args.docs, args.paragraphs, rng)
+
+        results = {}
+        for dtype in ("float16", "int8"):
+            index_dir = Path(tmp) / dtype
+            started = time.perf_counter()
+            manifest = build_index(docs_dir, index_dir, dim=args.dim, dtype=dtype)
+            build_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            index = PassageIndex(index_dir)
+            open_ms = (time.perf_counter() - started) * 1000
+
+            latencies = []
+            results[dtype] = []
+            for query in queries:
+                started = time.perf_counter()
+                passages = index.search(query, args.k)
+                latencies.append((time.perf_counter() - started) * 1000)
+                results[dtype].append([p.text for p in passages])
+
+            report["indexes"][dtype] = {
+                "passages": manifest["count"],
+                "build_seconds": round(build_seconds, 2),
+                "size_mb": round(dir_size(index_dir) / 2**20, 2),
+                "open_ms": round(open_ms, 2),
+                "query_ms": percentiles(latencies),
+            }
+
+        # How often int8 quantisation returns the same top-k as float16
+        overlap = [len(set(a) & set(b)) / max(1, len(a)) for a, b in zip(results["float16"], results["int8"])]
+        report["int8_topk_overlap"] = round(sum(overlap) / len(overlap), 3)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Throughput benchmark of the crisis detector (chat_core.safety).
+
+Scans synthetic chat messages, a fraction of which contain crisis terms, plus
+one large document, and reports per-message latency and MB/s. It also scans
+everyday sentences that must not trigger the emergency message and exits
+non-zero if any does:
+
+    python bench/safety_bench.py --messages 20000 --document-mb 5
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+from load_test import QUESTIONS, SRC, percentiles
+from retrieval_bench import SYLLABLES
+
+# Hyperbole, idioms and ordinary questions that once matched a crisis term
+NOT_CRISIS = [
+    "Mình mệt muốn chết",
+    "Hôm nay nóng muốn chết",
+    "Bài kiểm tra khó muốn chết",
+    "Mẹ bảo mình treo cổ áo lên móc",
+    "Mình bị cắt tay áo khi may",
+    "Mình tự cắt tóc ở nhà",
+    "Mình muốn giết thời gian trong kỳ nghỉ",
+    "Mình bị khó thở khi lo lắng trước kỳ thi",
+    "Ngộ độc thực phẩm là gì?",
+    "Làm sao để tránh ngộ độc thực phẩm khi đi ăn ngoài?",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--words", type=int, default=40, help="average words per message")
+    parser.add_argument("--crisis-rate", type=float, default=0.05, help="fraction of messages containing a term")
+    parser.add_argument("--document-mb", type=float, default=2.0, help="size of the single large input")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(SRC))
+    from chat_core.safety import TermMatcher, load_terms, strip_diacritics
+
+    started = time.perf_counter()
+    terms = load_terms()
+    detector = TermMatcher(terms)
+    compile_ms = (time.perf_counter() - started) * 1000
+
+    rng = random.Random(args.seed)
+    messages = []
+    for _ in range(args.messages):
+        text = " ".join(rng.choice(SYLLABLES) for _ in range(rng.randint(args.words // 2, args.words * 3 // 2)))
+        if rng.random() < args.crisis_rate:
+            term = rng.choice(terms)[1]
+            text = f"{text} {term if rng.random() < 0.5 else strip_diacritics(term)} {rng.choice(QUESTIONS)}"
+        messages.append(text)
+
+    latencies = []
+    flagged = 0
+    started = time.perf_counter()
+    for text in messages:
+        t = time.perf_counter()
+        flagged += detector.scan(text) is not None
+        latencies.append((time.perf_counter() - t) * 1e6)
+    message_seconds = time.perf_counter() - started
+    message_mb = sum(len(m.encode("utf-8")) for m in messages) / 2**20
+
+    document = []
+    size = 0
+    while size < args.document_mb * 2**20:
+        document.append(rng.choice(messages))
+        size += len(document[-1].encode("utf-8")) + 1
+    document = "\n".join(document)
+    started = time.perf_counter()
+    detector.scan(document)
+    document_seconds = time.perf_counter() - started
+
+    false_alarms = {}
+    for text in NOT_CRISIS:
+        match = detector.scan(text)
+        if match is not None:
+            false_alarms[text] = match.categories
+
+    report = {
+        "config": vars(args),
+        "terms": detector.term_count,
+        "false_alarms": false_alarms,
+        "compile_ms": round(compile_ms, 2),
+        "messages": {
+            "count": len(messages),
+            "flagged": flagged,
+            "scan_us": percentiles(latencies),
+            "mb_per_second": round(message_mb / message_seconds, 2),
+        },
+        "document": {
+            "mb": round(size / 2**20, 2),
+            "seconds": round(document_seconds, 3),
+            "mb_per_second": round(size / 2**20 / document_seconds, 2),
+        },
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    if false_alarms:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
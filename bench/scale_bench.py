@@ -0,0 +1,130 @@
+"""Throughput of N Streamlit worker processes sharing state, against the fake Gemini backend.
+
+Simulates a load balancer without sticky sessions: every chat turn is a fresh
+page load (AppTest run) on whichever worker process picks it up, carrying only
+the `sid` query parameter, so a turn usually lands on a different worker than
+the one before. With a shared CHAT_STATE_URL each turn resumes the full
+conversation; without one, history is lost whenever the worker changes. The
+fake backend answers instantly by default, so the workers' own CPU (script
+runs, rendering, state round trips) is what is measured:
+
+    docker run --rm -p 6379:6379 redis:7
+    python bench/scale_bench.py --workers 1 2 4 --state-url redis://localhost:6379/0
+
+Reports responses per second for each worker count, the speed-up over the
+first count, and how many turns saw their conversation's full history.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from load_test import QUESTIONS, SRC, configure, percentiles
+
+
+def app_run(at):
+    """Run the page; AppTest swaps __main__ for the script, which would break unpickling the next task"""
+    main = sys.modules["__main__"]
+    try:
+        return at.run()
+    finally:
+        sys.modules["__main__"] = main
+
+
+def init_worker(args, prefix):
+    if args.state_url:
+        os.environ.update({"CHAT_STATE_URL": args.state_url, "CHAT_STATE_PREFIX": prefix})
+    configure(args)
+    from streamlit.testing.v1 import AppTest
+
+    # Warm up imports and shared services so they are not billed to the first turn
+    app_run(AppTest.from_file(args.app, default_timeout=args.timeout))
+
+
+def run_turn(args, index, turn, session_id):
+    """One page load answering one question; returns (session_id, elapsed_ms, resumed, ok)"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(args.app, default_timeout=args.timeout)
+    if session_id:
+        at.query_params["sid"] = session_id
+    app_run(at)
+    question = f"{QUESTIONS[(index + turn) % len(QUESTIONS)]} (#{index}.{turn})"
+    started = time.perf_counter()
+    app_run(at.chat_input[0].set_value(question))
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    chat = at.session_state["chat"] if "chat" in at.session_state else None
+    if at.exception or chat is None:
+        return session_id, elapsed_ms, False, False
+    # The question and answer of every earlier turn, plus this turn's pair
+    return chat.session_id, elapsed_ms, len(chat) == 2 * (turn + 1), True
+
+
+def run(args, workers):
+    prefix = f"scalebench:{uuid.uuid4().hex[:8]}:"
+    session_ids = [None] * args.sessions
+    samples = {"e2e_ms": [], "resumed": 0, "errors": 0}
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(args, prefix)) as pool:
+        # Start (and warm up) every worker before the clock starts
+        list(pool.map(time.sleep, [0.5] * workers))
+        setup_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        for turn in range(args.turns):
+            # Every session's next turn goes to whichever worker is free
+            indexes = range(args.sessions)
+            outcomes = pool.map(run_turn, [args] * args.sessions, indexes, [turn] * args.sessions, session_ids)
+            for index, (session_id, elapsed_ms, resumed, ok) in zip(indexes, outcomes):
+                if not ok:
+                    samples["errors"] += 1
+                    continue
+                session_ids[index] = session_id
+                samples["e2e_ms"].append(elapsed_ms)
+                samples["resumed"] += resumed
+        wall = time.perf_counter() - started
+    responses = len(samples["e2e_ms"])
+    return {
+        "workers": workers,
+        "responses": responses,
+        "errors": samples["errors"],
+        "wall_seconds": round(wall, 2),
+        "startup_seconds": round(setup_seconds, 2),
+        "responses_per_second": round(responses / wall, 2) if wall else None,
+        "e2e_ms": percentiles(samples["e2e_ms"]),
+        "turns_with_full_history": samples["resumed"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", default=str(SRC / "ui.py"), help="Streamlit page to drive (ui.py or fontend.py)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="worker counts to compare")
+    parser.add_argument("--state-url", default=os.getenv("CHAT_STATE_URL"),
+                        help="shared state for the workers (redis://...); unset, each worker keeps its own")
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--turns", type=int, default=3, help="chat turns (page loads) per session")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds per script run")
+    parser.add_argument("--tokens-per-second", type=float, default=1e6)
+    parser.add_argument("--chunk-chars", type=int, default=24)
+    parser.add_argument("--first-token-delay", type=float, default=0.0)
+    parser.add_argument("--answer-chars", type=int, default=600)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = {"config": vars(args), "cpu_count": os.cpu_count(), "runs": [run(args, n) for n in args.workers]}
+    base = report["runs"][0]["responses_per_second"]
+    for entry in report["runs"]:
+        entry["speedup"] = round(entry["responses_per_second"] / base, 2) if base else None
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Headless check: a page whose answer is superseded finishes its run cleanly.
+
+Two tabs on the same `?sid=` share one session ID, so a prompt sent from the
+second cancels the answer still streaming in the first. This drives the first
+tab through Streamlit's AppTest against a slow fake Gemini backend and sends
+the competing request for the same session from another thread mid-stream.
+The first tab's run must end without an exception and keep its partial answer
+with the stopped marker:
+
+    python bench/supersede_check.py --app src/fontend.py
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+
+from load_test import SRC, configure
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", default=str(SRC / "ui.py"), help="Streamlit page to drive (ui.py or fontend.py)")
+    parser.add_argument("--supersede-after", type=float, default=0.5, help="seconds into the first answer")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds per script run")
+    parser.add_argument("--tokens-per-second", type=float, default=20.0)
+    parser.add_argument("--chunk-chars", type=int, default=24)
+    parser.add_argument("--first-token-delay", type=float, default=0.1)
+    parser.add_argument("--answer-chars", type=int, default=600)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    configure(args)
+    from streamlit.testing.v1 import AppTest
+
+    from chat_core import get_generation_service
+
+    at = AppTest.from_file(args.app, default_timeout=args.timeout).run()
+    session = at.session_state["chat"]
+
+    def second_tab():
+        time.sleep(args.supersede_after)
+        stream = get_generation_service().stream(session.session_id, session.persona.model, None,
+                                                 "Câu hỏi từ tab thứ hai")
+        for _ in stream:
+            pass
+
+    competitor = threading.Thread(target=second_tab, daemon=True)
+    competitor.start()
+    started = time.perf_counter()
+    at.chat_input[0].set_value("Câu hỏi từ tab thứ nhất").run()
+    elapsed = time.perf_counter() - started
+    competitor.join(args.timeout)
+
+    answer = list(session.messages)[-1]
+    marker = session.persona.stopped_marker.strip()
+    report = {
+        "app": args.app,
+        "run_seconds": round(elapsed, 2),
+        "exception": [str(e.value) for e in at.exception],
+        "messages": len(session),
+        "answer_chars": len(answer.content),
+        "stopped": answer.role == "assistant" and answer.content.endswith(marker),
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    ok = not report["exception"] and report["stopped"] and elapsed < args.timeout
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
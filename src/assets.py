@@ -0,0 +1,46 @@
+"""Static page assets, read from src/static once per process.
+
+With `server.enableStaticServing` on, stylesheets and images are linked from
+`app/static/` so the browser fetches and caches them once instead of every
+rerun re-sending them; otherwise they are inlined as before.
+"""
+import base64
+from functools import cache
+from pathlib import Path
+
+import streamlit as st
+
+STATIC_DIR = Path(__file__).parent / "static"
+STATIC_URL = "app/static"
+
+
+@cache
+def read(name):
+    return (STATIC_DIR / name).read_text(encoding="utf-8")
+
+
+def _static_serving():
+    return st.get_option("server.enableStaticServing")
+
+
+@cache
+def _inline_style(name):
+    return f"<style>\n{read(name)}\n</style>"
+
+
+@cache
+def _inline_image(name, width):
+    data = base64.b64encode((STATIC_DIR / name).read_bytes()).decode("ascii")
+    return f"<img src='data:image/svg+xml;base64,{data}' width='{width}'>"
+
+
+def stylesheet(name):
+    if _static_serving():
+        return f"<link rel='stylesheet' href='{STATIC_URL}/{name}'>"
+    return _inline_style(name)
+
+
+def image(name, width):
+    if _static_serving():
+        return f"<img src='{STATIC_URL}/{name}' width='{width}'>"
+    return _inline_image(name, width)
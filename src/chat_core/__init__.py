@@ -0,0 +1,56 @@
+"""Shared chat logic for the Streamlit front ends.
+
+Nothing in this package imports Streamlit except `chat_core.resources`, so the
+engine can be driven and benchmarked headlessly.
+"""
+from .cache import ResponseCache, get_response_cache
+from .client import connection_stats, get_client
+from .context import ConversationContext
+from .engine import ChatEngine
+from .markdown import IncrementalMarkdown, markdown_html
+from .personas import LYLY, MEDIASSIST, PERSONAS, Persona
+from .prompt_cache import PromptCache, get_prompt_cache
+from .render import StreamRenderer
+from .resilience import ResiliencePolicy, UpstreamUnavailable
+from .retrieval import PassageIndex, Retriever, get_retriever
+from .service import GenerationCancelled, GenerationService, QueueFull, RateLimited, get_generation_service
+from .shared_state import LocalSharedState, RedisSharedState, SharedState, get_shared_state
+from .session import ChatSession, SessionRegistry, get_registry
+from .store import Message, MessageStore
+
+__all__ = [
+    "ChatEngine",
+    "ChatSession",
+    "ConversationContext",
+    "GenerationCancelled",
+    "GenerationService",
+    "IncrementalMarkdown",
+    "LocalSharedState",
+    "LYLY",
+    "MEDIASSIST",
+    "Message",
+    "MessageStore",
+    "PERSONAS",
+    "PassageIndex",
+    "Persona",
+    "PromptCache",
+    "QueueFull",
+    "RateLimited",
+    "ResiliencePolicy",
+    "ResponseCache",
+    "RedisSharedState",
+    "Retriever",
+    "SessionRegistry",
+    "SharedState",
+    "StreamRenderer",
+    "UpstreamUnavailable",
+    "connection_stats",
+    "get_client",
+    "get_generation_service",
+    "get_prompt_cache",
+    "get_registry",
+    "get_response_cache",
+    "get_retriever",
+    "get_shared_state",
+    "markdown_html",
+]
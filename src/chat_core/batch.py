@@ -0,0 +1,193 @@
+"""Run a JSONL question set through a persona, for QA and prompt regression checks.
+
+    cd src && python -m chat_core.batch questions.jsonl answers.jsonl --persona lyly
+    cd src && python -m chat_core.batch questions.jsonl answers.jsonl --model gemini-2.0-flash --concurrency 16
+    cd src && python -m chat_core.batch questions.jsonl answers.jsonl --fake
+
+Each input line is an object with a "question" and optionally an "id" (the
+line number otherwise) and a "history" of earlier {"role", "content"} turns.
+Questions go through the same ChatEngine as the pages: persona prompt,
+routing, retrieval, crisis handling and resilience policies, with the answer
+cache off so every question is really asked. At most `--concurrency` questions
+are in flight. Each result is appended to the output as soon as it finishes,
+with latency, token usage and the model, route and source that served it
+(see ChatEngine.stream), so an interrupted run picks up where it stopped:
+items already answered are skipped, failed ones are asked again and the last
+record for an id wins. A throughput summary is printed to stderr at the end.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import ResponseCache
+from .client import get_client
+from .engine import ChatEngine
+from .personas import PERSONAS
+from .resilience import ResiliencePolicy
+from .service import GenerationService
+from .session import ChatSession
+
+
+def read_items(path):
+    """Yield (id, item) for each question in a JSONL file"""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            yield str(item.get("id", line_number)), item
+
+
+def answered_ids(path):
+    """IDs with a successful record in an earlier run's output; drops a half-written last line"""
+    if not os.path.exists(path):
+        return set()
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    answered = set()
+    for line in data[:end].decode("utf-8").splitlines():
+        if line.strip():
+            record = json.loads(line)
+            if record.get("error"):
+                answered.discard(record["id"])
+            else:
+                answered.add(record["id"])
+    return answered
+
+
+def answer(engine, item_id, item, model=None, temperature=None):
+    """Ask one question and return its result record; runs on a worker thread"""
+    session = ChatSession(engine.persona)
+    for turn in item.get("history", ()):
+        if turn["role"] == "user":
+            session.add_user(turn["content"])
+        else:
+            session.add_assistant(turn["content"])
+    record = {"id": item_id, "question": item["question"], "persona": engine.persona.key, "requested_model": model,
+              "model": None, "route": None, "source": None}
+
+    def served(model, route, source):
+        record.update(model=model, route=route, source=source)
+
+    parts = []
+    usage = None
+    ttft = None
+    started = time.perf_counter()
+    try:
+        for chunk in engine.stream(session, item["question"], model=model, temperature=temperature, on_route=served):
+            if getattr(chunk, "text", None):
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+                parts.append(chunk.text)
+            usage = getattr(chunk, "usage_metadata", None) or usage
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record.update(
+        answer="".join(parts),
+        ttft_ms=round(ttft * 1000, 1) if ttft is not None else None,
+        latency_ms=round((time.perf_counter() - started) * 1000, 1),
+        prompt_tokens=getattr(usage, "prompt_token_count", None) or 0,
+        output_tokens=getattr(usage, "candidates_token_count", None) or 0,
+        cached_tokens=getattr(usage, "cached_content_token_count", None) or 0,
+    )
+    return record
+
+
+async def run_batch(engine, items, out, concurrency=8, model=None, temperature=None):
+    """Answer `items` with at most `concurrency` in flight, writing each record to `out` as it lands"""
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(concurrency)
+    records = []
+
+    async def one(item_id, item):
+        try:
+            record = await loop.run_in_executor(pool, answer, engine, item_id, item, model, temperature)
+        finally:
+            slots.release()
+        # Written from the loop thread, one whole line at a time
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+        records.append(record)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as pool:
+        tasks = []
+        for item_id, item in items:
+            # Read the input only as fast as slots free up
+            await slots.acquire()
+            tasks.append(asyncio.create_task(one(item_id, item)))
+        await asyncio.gather(*tasks)
+    return records
+
+
+def summary(records, wall_seconds, skipped=0):
+    ok = [r for r in records if not r.get("error")]
+    latencies = sorted(r["latency_ms"] for r in ok)
+    output_tokens = sum(r["output_tokens"] for r in ok)
+
+    def pick(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else None
+
+    return {
+        "answered": len(ok),
+        "failed": len(records) - len(ok),
+        "skipped": skipped,
+        "wall_seconds": round(wall_seconds, 2),
+        "items_per_second": round(len(records) / wall_seconds, 2) if wall_seconds else None,
+        "output_tokens_per_second": round(output_tokens / wall_seconds, 1) if wall_seconds else None,
+        "prompt_tokens": sum(r["prompt_tokens"] for r in ok),
+        "output_tokens": output_tokens,
+        "latency_ms": {"p50": pick(0.50), "p95": pick(0.95), "max": pick(1.0)},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a JSONL question set with one persona")
+    parser.add_argument("questions", help="JSONL file of {\"id\", \"question\", \"history\"} objects")
+    parser.add_argument("output", help="JSONL results file; appended to and resumed from if it exists")
+    parser.add_argument("--persona", choices=sorted(PERSONAS), default="lyly")
+    parser.add_argument("--model", help="model for every question (default: the router's choice)")
+    parser.add_argument("--temperature", type=float)
+    parser.add_argument("--concurrency", type=int, default=8, help="questions in flight at once")
+    parser.add_argument("--fake", action="store_true", help="use the local fake Gemini backend")
+    args = parser.parse_args(argv)
+
+    if args.fake:
+        os.environ["GEMINI_BACKEND"] = "fake"
+    # A service of our own: no per-session rate limit, and a queue as deep as the pool
+    service = GenerationService(get_client(), max_concurrency=args.concurrency, max_queue=args.concurrency,
+                                session_rate=1e6, session_burst=1e6, policy=ResiliencePolicy.from_env())
+    engine = ChatEngine(PERSONAS[args.persona], service=service, cache=ResponseCache(max_entries=0))
+
+    done = answered_ids(args.output)
+    skipped = 0
+
+    def pending():
+        nonlocal skipped
+        for item_id, item in read_items(args.questions):
+            if item_id in done:
+                skipped += 1
+            else:
+                yield item_id, item
+
+    started = time.perf_counter()
+    try:
+        with open(args.output, "a", encoding="utf-8") as out:
+            records = asyncio.run(run_batch(engine, pending(), out, args.concurrency, args.model, args.temperature))
+    except KeyboardInterrupt:
+        print(f"Interrupted; run the same command again to resume from {args.output}", file=sys.stderr)
+        sys.exit(130)
+    report = summary(records, time.perf_counter() - started, skipped)
+    print(json.dumps(report, indent=2), file=sys.stderr)
+    if report["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
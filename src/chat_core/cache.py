@@ -0,0 +1,258 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import numpy as np
+
+from .shared_state import get_shared_state
+
+NGRAM = 3
+VECTOR_DIM = 2048
+REPLAY_CHUNK_CHARS = 40
+# Expired rows are deleted from the SQLite tier at most this often, from put()
+PRUNE_INTERVAL = 60.0
+
+
+def normalize_question(text):
+    text = unicodedata.normalize("NFC", text).lower()
+    return " ".join(text.split()).strip(" ?!.,;:")
+
+
+def prompt_hash(system_prompt):
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def _scope(model, temperature, system_prompt):
+    return f"{model}|{temperature:.2f}|{prompt_hash(system_prompt)}"
+
+
+def _key(scope, normalized):
+    return hashlib.sha256(f"{scope}|{normalized}".encode("utf-8")).hexdigest()
+
+
+def ngram_vector(text, n=NGRAM, dim=VECTOR_DIM):
+    """L2-normalised hashed character n-gram vector"""
+    padded = f" {text} "
+    vector = np.zeros(dim, dtype=np.float32)
+    if len(padded) < n:
+        return vector
+    buckets = [zlib.crc32(padded[i:i + n].encode("utf-8")) % dim for i in range(len(padded) - n + 1)]
+    np.add.at(vector, buckets, 1.0)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def replay_stream(answer, chunk_chars=REPLAY_CHUNK_CHARS):
+    """Yield a cached answer as chunks shaped like generate_content_stream output"""
+    for start in range(0, len(answer), chunk_chars):
+        yield SimpleNamespace(text=answer[start:start + chunk_chars])
+
+
+class _SimilarityIndex:
+    """Fixed-size matrix of question vectors, one row per memory-tier entry"""
+
+    def __init__(self, capacity, dim=VECTOR_DIM):
+        self.matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self.scopes = np.full(capacity, -1, dtype=np.int64)
+        self.keys = [None] * capacity
+        self.slots = {}
+        self.free = list(range(capacity - 1, -1, -1))
+
+    def add(self, key, scope, vector):
+        if key in self.slots or not self.free:
+            return
+        slot = self.free.pop()
+        self.matrix[slot] = vector
+        self.scopes[slot] = hash(scope)
+        self.keys[slot] = key
+        self.slots[key] = slot
+
+    def remove(self, key):
+        slot = self.slots.pop(key, None)
+        if slot is None:
+            return
+        self.matrix[slot] = 0.0
+        self.scopes[slot] = -1
+        self.keys[slot] = None
+        self.free.append(slot)
+
+    def search(self, scope, vector, k=3):
+        """Top-k (key, score) pairs within the same scope"""
+        scores = self.matrix @ vector
+        scores[self.scopes != hash(scope)] = -1.0
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.keys[i], float(scores[i])) for i in top if scores[i] > 0]
+
+
+class ResponseCache:
+    """Answer cache keyed by normalised question, model, temperature and system prompt.
+
+    Tiers, checked in order: in-memory LRU with TTL, optional SQLite file,
+    optional shared state (chat_core.shared_state) seen by every worker, and
+    optional near-duplicate match on character n-gram vectors. Expired rows
+    are pruned from the SQLite file as new answers are stored.
+    """
+
+    def __init__(self, max_entries=512, ttl=3600, db_path=None, similarity_threshold=None, shared=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._index = _SimilarityIndex(max_entries) if similarity_threshold else None
+        self._db = None
+        self._pruned_at = 0.0
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, scope TEXT, question TEXT, answer TEXT, created_at REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)")
+            self._db.commit()
+        self.counters = {
+            "hits": 0, "memory_hits": 0, "disk_hits": 0, "shared_hits": 0, "similar_hits": 0,
+            "misses": 0, "evictions": 0, "expirations": 0, "pruned": 0,
+        }
+
+    def get(self, question, model, temperature, system_prompt):
+        scope = _scope(model, temperature, system_prompt)
+        normalized = normalize_question(question)
+        key = _key(scope, normalized)
+        now = time.time()
+        with self._lock:
+            answer = self._get_memory(key, now)
+            if answer is not None:
+                return self._hit("memory_hits", answer)
+
+            answer = self._get_disk(key, now)
+            if answer is not None:
+                self._put_memory(key, scope, normalized, answer, now)
+                return self._hit("disk_hits", answer)
+
+        if self.shared is not None:
+            # A network round trip, so made without holding the lock
+            answer = self.shared.get(f"answer:{key}")
+            if answer is not None:
+                with self._lock:
+                    self._put_memory(key, scope, normalized, answer, now)
+                    return self._hit("shared_hits", answer)
+
+        with self._lock:
+            if self._index is not None:
+                for similar_key, score in self._index.search(scope, ngram_vector(normalized)):
+                    if score < self.similarity_threshold:
+                        break
+                    answer = self._get_memory(similar_key, now)
+                    if answer is not None:
+                        return self._hit("similar_hits", answer)
+
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, question, model, temperature, system_prompt, answer):
+        scope = _scope(model, temperature, system_prompt)
+        normalized = normalize_question(question)
+        key = _key(scope, normalized)
+        now = time.time()
+        with self._lock:
+            self._put_memory(key, scope, normalized, answer, now)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                    (key, scope, normalized, answer, now),
+                )
+                if now - self._pruned_at >= PRUNE_INTERVAL:
+                    self._pruned_at = now
+                    pruned = self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+                    self.counters["pruned"] += pruned.rowcount
+                self._db.commit()
+        if self.shared is not None:
+            self.shared.set(f"answer:{key}", answer, ttl=self.ttl)
+
+    def _hit(self, tier, answer):
+        self.counters["hits"] += 1
+        self.counters[tier] += 1
+        return answer
+
+    def _get_memory(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, answer = entry
+        if expires_at < now:
+            self._drop(key)
+            self.counters["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return answer
+
+    def _get_disk(self, key, now):
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT answer FROM responses WHERE key = ? AND created_at >= ?", (key, now - self.ttl)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _put_memory(self, key, scope, normalized, answer, now):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        self._entries[key] = (now + self.ttl, answer)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.counters["evictions"] += 1
+        if self._index is not None:
+            self._index.add(key, scope, ngram_vector(normalized))
+
+    def _drop(self, key):
+        del self._entries[key]
+        if self._index is not None:
+            self._index.remove(key)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries))
+
+
+def cached_stream(cache, question, model, temperature, system_prompt, stream):
+    """Pass chunks through and store the full answer once the stream completes"""
+    parts = []
+    for chunk in stream:
+        if getattr(chunk, "text", None):
+            parts.append(chunk.text)
+        yield chunk
+    if parts:
+        cache.put(question, model, temperature, system_prompt, "".join(parts))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide response cache, configured from the environment"""
+    global _cache
+    if _cache is not None:
+        return _cache
+    with _cache_lock:
+        if _cache is None:
+            threshold = os.getenv("CHAT_CACHE_SIMILARITY")
+            _cache = ResponseCache(
+                max_entries=int(os.getenv("CHAT_CACHE_SIZE", "512")),
+                ttl=float(os.getenv("CHAT_CACHE_TTL", "3600")),
+                db_path=os.getenv("CHAT_CACHE_DB") or None,
+                similarity_threshold=float(threshold) if threshold else None,
+                shared=get_shared_state(),
+            )
+    return _cache
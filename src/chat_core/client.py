@@ -0,0 +1,147 @@
+import os
+import threading
+import weakref
+from dataclasses import dataclass, field
+
+import httpx
+from dotenv import load_dotenv
+from google import genai
+from google.genai import types
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _h2_available():
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+@dataclass(frozen=True)
+class ClientSettings:
+    """Connection pool settings for the shared Gemini client"""
+    api_key: str = None
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry: float = 30.0
+    timeout: float = 60.0
+    http2: bool = False
+
+    @classmethod
+    def from_env(cls):
+        load_dotenv()
+        http2 = os.getenv("GEMINI_HTTP2")
+        return cls(
+            api_key=os.getenv("GEMINI_API_KEY"),
+            max_connections=_env_int("GEMINI_POOL_SIZE", cls.max_connections),
+            max_keepalive_connections=_env_int("GEMINI_POOL_KEEPALIVE", cls.max_keepalive_connections),
+            keepalive_expiry=_env_float("GEMINI_POOL_KEEPALIVE_EXPIRY", cls.keepalive_expiry),
+            timeout=_env_float("GEMINI_TIMEOUT", cls.timeout),
+            # HTTP/2 needs the optional `h2` package, so only turn it on by default when present
+            http2=(http2 == "1") if http2 else _h2_available(),
+        )
+
+
+@dataclass
+class ConnectionStats:
+    """Counts how many upstream responses reused a pooled connection"""
+    requests: int = 0
+    new_connections: int = 0
+    reused_connections: int = 0
+    _seen: weakref.WeakSet = field(default_factory=weakref.WeakSet, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, response):
+        stream = response.extensions.get("network_stream")
+        with self._lock:
+            self.requests += 1
+            if stream is None:
+                return
+            if stream in self._seen:
+                self.reused_connections += 1
+            else:
+                self._seen.add(stream)
+                self.new_connections += 1
+
+    def as_dict(self):
+        with self._lock:
+            reuse_ratio = self.reused_connections / self.requests if self.requests else 0.0
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": self.reused_connections,
+                "reuse_ratio": round(reuse_ratio, 3),
+            }
+
+
+_client = None
+_settings = None
+_stats = ConnectionStats()
+_lock = threading.Lock()
+
+
+def _http_options(settings):
+    limits = httpx.Limits(
+        max_connections=settings.max_connections,
+        max_keepalive_connections=settings.max_keepalive_connections,
+        keepalive_expiry=settings.keepalive_expiry,
+    )
+
+    def on_response(response):
+        _stats.record(response)
+
+    async def on_response_async(response):
+        _stats.record(response)
+
+    return types.HttpOptions(
+        timeout=int(settings.timeout * 1000),
+        client_args={
+            "limits": limits,
+            "http2": settings.http2,
+            "event_hooks": {"response": [on_response]},
+        },
+        async_client_args={
+            "limits": limits,
+            "http2": settings.http2,
+            "event_hooks": {"response": [on_response_async]},
+        },
+    )
+
+
+def get_client(settings=None):
+    """Return the process-wide Gemini client, creating it on first use.
+
+    Set GEMINI_BACKEND=fake to use the local fake backend instead of the API.
+    """
+    global _client, _settings
+    if _client is not None:
+        return _client
+    with _lock:
+        if _client is None:
+            _settings = settings or ClientSettings.from_env()
+            if os.getenv("GEMINI_BACKEND") == "fake":
+                from .fake import FakeGeminiClient, FakeSettings
+                _client = FakeGeminiClient(FakeSettings.from_env())
+            else:
+                _client = genai.Client(api_key=_settings.api_key, http_options=_http_options(_settings))
+    return _client
+
+
+def pool_settings():
+    """Settings the shared client was built with (None before first use)"""
+    return _settings
+
+
+def connection_stats():
+    """Connection reuse counters for the shared client"""
+    return _stats.as_dict()
@@ -0,0 +1,134 @@
+import os
+from collections import deque
+
+from google.genai import types
+
+# Rough local estimate, good enough for budgeting without a count_tokens round trip
+CHARS_PER_TOKEN = 4
+DEFAULT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKENS", "6000"))
+# Fold turns that no longer fit into a short summary instead of dropping them
+SUMMARIZE = os.getenv("CHAT_CONTEXT_SUMMARY", "0") == "1"
+SUMMARY_CHARS_PER_TURN = 160
+SUMMARY_MAX_CHARS = 1200
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def brief_summary(previous, dropped):
+    """Cheap local summarizer: keep the opening of each dropped turn"""
+    lines = [previous] if previous else []
+    for role, text in dropped:
+        speaker = "User" if role == "user" else "Assistant"
+        snippet = " ".join(text.split())[:SUMMARY_CHARS_PER_TURN]
+        lines.append(f"{speaker}: {snippet}")
+    summary = "\n".join(lines)
+    # Keep the most recent part when the summary itself grows too long
+    return summary[-SUMMARY_MAX_CHARS:]
+
+
+class _Turn:
+    __slots__ = ("role", "text", "tokens", "content")
+
+    def __init__(self, role, text, tokens):
+        self.role = role
+        self.text = text
+        self.tokens = tokens
+        self.content = types.Content(role=role, parts=[types.Part(text=text)])
+
+
+class ConversationContext:
+    """Conversation history kept within a token budget.
+
+    Turns are appended incrementally and their token counts are cached, so
+    each new turn costs O(1) instead of re-flattening the whole history.
+    When the budget is exceeded the oldest turns are dropped, or folded into
+    a running summary when a summarizer is given.
+    """
+
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET, summarizer=None, count_tokens=estimate_tokens):
+        self.token_budget = token_budget
+        self.summarizer = summarizer
+        self.count_tokens = count_tokens
+        self.turns = deque()
+        self.total_tokens = 0
+        self.summary = ""
+        self.summary_tokens = 0
+        self.dropped_turns = 0
+
+    def __len__(self):
+        return len(self.turns)
+
+    @property
+    def is_opening(self):
+        """True while the only turn so far is the user's first message"""
+        return len(self.turns) == 1 and self.dropped_turns == 0
+
+    def add_user(self, text):
+        self._append("user", text)
+
+    def add_model(self, text):
+        self._append("model", text)
+
+    def clear(self):
+        self.turns.clear()
+        self.total_tokens = 0
+        self.summary = ""
+        self.summary_tokens = 0
+        self.dropped_turns = 0
+
+    def _append(self, role, text):
+        turn = _Turn(role, text, self.count_tokens(text))
+        self.turns.append(turn)
+        self.total_tokens += turn.tokens
+        self._enforce_budget()
+
+    def _enforce_budget(self):
+        while True:
+            dropped = []
+            # Always keep the latest turn, even if it alone is over budget. History
+            # must start with a user turn, also after an earlier drop left a model turn
+            while len(self.turns) > 1 and (self.total_tokens + self.summary_tokens > self.token_budget
+                                           or self.turns[0].role != "user"):
+                dropped.append(self._pop_oldest())
+                while self.turns and self.turns[0].role != "user" and len(self.turns) > 1:
+                    dropped.append(self._pop_oldest())
+            if not dropped or not self.summarizer:
+                break
+            self.summary = self.summarizer(self.summary, [(t.role, t.text) for t in dropped])
+            self.summary_tokens = self.count_tokens(self.summary)
+            # The new summary may push the total back over: fold in more turns
+            if self.total_tokens + self.summary_tokens <= self.token_budget or len(self.turns) <= 1:
+                break
+        # Nothing left to drop: keep the most recent part of the summary that fits
+        room = self.token_budget - self.total_tokens
+        while self.summary and self.summary_tokens > room:
+            self.summary = self.summary[len(self.summary) // 2 + 1:]
+            self.summary_tokens = self.count_tokens(self.summary) if self.summary else 0
+
+    def _pop_oldest(self):
+        turn = self.turns.popleft()
+        self.total_tokens -= turn.tokens
+        self.dropped_turns += 1
+        return turn
+
+    def contents(self):
+        """History as structured `contents` turns for generate_content"""
+        contents = []
+        if self.summary:
+            contents.append(types.Content(
+                role="user",
+                parts=[types.Part(text=f"Summary of the earlier conversation:\n{self.summary}")],
+            ))
+            contents.append(types.Content(role="model", parts=[types.Part(text="OK.")]))
+        contents.extend(turn.content for turn in self.turns)
+        return contents
+
+    def stats(self):
+        return {
+            "turns": len(self.turns),
+            "tokens": self.total_tokens + self.summary_tokens,
+            "token_budget": self.token_budget,
+            "dropped_turns": self.dropped_turns,
+        }
@@ -0,0 +1,305 @@
+import logging
+import os
+import time
+from functools import partial
+from types import SimpleNamespace
+
+from google.genai import types
+
+from .cache import cached_stream, get_response_cache, replay_stream
+from .client import connection_stats
+from .context import estimate_tokens
+from .metrics import get_metrics
+from .prefetch import get_follow_up_suggester, get_prefetcher
+from .prompt_cache import get_prompt_cache
+from .resilience import UpstreamUnavailable
+from .retrieval import get_retriever
+from .router import get_router
+from .safety import get_crisis_detector
+from .service import get_generation_service
+from .session import get_registry
+
+logger = logging.getLogger(__name__)
+
+
+def _ignore_route(model, route, source):
+    pass
+
+# "continue": after the crisis message, also stream the model's answer; "skip": show the message only
+CRISIS_MODE = os.getenv("CHAT_CRISIS_MODE", "continue")
+
+
+class ChatEngine:
+    """Generates streamed answers for one persona.
+
+    Opening questions are served from the shared response cache when
+    possible; everything else goes through the generation service. With a
+    retriever, the best passages from the persona's document index are sent
+    along with the question. Prompts that trip the crisis detector get the
+    persona's fixed emergency message straight away, before any upstream call.
+    The router picks the model per request and, with CHAT_ROUTING_REFUSE=on,
+    refuses explicit off-topic tasks locally. When upstream fails before any text is shown, or the circuit
+    breaker is open, a cached answer or the persona's degraded message is
+    served instead. With a prompt cache, requests reference the persona's
+    system prompt from a Gemini context cache instead of resending it.
+    After an answer, `follow_ups` suggests next questions and prefetches the
+    first few; asking one of them streams the prefetched answer.
+    """
+
+    def __init__(self, persona, service=None, cache=None, metrics=None, retriever=None, detector=None,
+                 router=None, prompt_cache=None, suggester=None, prefetcher=None):
+        self.persona = persona
+        self.service = service or get_generation_service()
+        self.cache = cache if cache is not None else get_response_cache()
+        self.metrics = metrics or get_metrics()
+        self.retriever = retriever if retriever is not None else get_retriever(persona.key)
+        self.detector = detector if detector is not None else get_crisis_detector()
+        self.router = router if router is not None else get_router()
+        self.prompt_cache = prompt_cache if prompt_cache is not None else get_prompt_cache()
+        self.suggester = suggester if suggester is not None else get_follow_up_suggester()
+        self.prefetcher = prefetcher if prefetcher is not None else get_prefetcher()
+
+    def config(self, temperature=None, max_output_tokens=None, cached_content=None):
+        persona = self.persona
+        return types.GenerateContentConfig(
+            # The API rejects an inline system instruction alongside a cache that holds one
+            system_instruction=None if cached_content else persona.system_prompt,
+            cached_content=cached_content,
+            temperature=persona.temperature if temperature is None else temperature,
+            top_p=persona.top_p,
+            top_k=persona.top_k,
+            max_output_tokens=max_output_tokens or persona.max_output_tokens,
+        )
+
+    def stream(self, session, prompt, model=None, temperature=None, heartbeat=None, on_route=None):
+        """Record the user's prompt and return an iterator of response chunks.
+
+        Without an explicit `model` the router picks the model and output
+        limit. `heartbeat` is called while waiting on upstream (see
+        GenerationService.stream). `on_route(model, route, source)` is told
+        what serves the answer: the model, the router's route name (None
+        without one) and the source as in the chat_* metrics ("model",
+        "cache", "prefetch", "crisis", "refused" or "fallback"); it is called
+        again with "fallback" if upstream fails before any text. Closing the
+        iterator cancels the upstream request. Raises RateLimited or QueueFull
+        when the request cannot be accepted.
+        """
+        persona = self.persona
+        temperature = persona.temperature if temperature is None else temperature
+        started_at = time.perf_counter()
+        on_route = on_route or _ignore_route
+        session.add_user(prompt)
+
+        if self.prefetcher is not None:
+            # Any prompt ends the session's prefetches; a suggested question reuses its answer
+            prefetched = self.prefetcher.take(session.session_id, prompt, heartbeat)
+            if prefetched is not None:
+                model = model or persona.model
+                on_route(model, None, "prefetch")
+                response = self._with_fallback(prefetched, prompt, model, temperature, partial(on_route, model, None))
+                return self.metrics.observe_stream(response, persona.key, model, source="prefetch",
+                                                   started_at=started_at)
+
+        match = self.detector.scan(prompt) if self.detector is not None else None
+        if match is not None:
+            on_route(model or persona.model, None, "crisis")
+            return self._crisis_stream(session, prompt, model or persona.model, temperature, match, started_at,
+                                       heartbeat)
+
+        decision = self.router.route(persona, session, prompt, model) if self.router is not None else None
+        route = decision.route.name if decision is not None else None
+        max_output_tokens = None
+        if decision is not None:
+            if route == "refuse":
+                self.router.count_refusal()
+                on_route(persona.model, route, "refused")
+                return self.metrics.observe_stream(replay_stream(persona.off_topic_message), persona.key,
+                                                   persona.model, source="refused", started_at=started_at)
+            if model is None:
+                model, max_output_tokens = decision.model, decision.max_output_tokens
+        model = model or persona.model
+
+        # Opening questions don't depend on earlier turns, so they can be answered from the shared cache
+        standalone = session.context.is_opening
+        if standalone:
+            cached_answer = self.cache.get(prompt, model, temperature, persona.system_prompt)
+            if cached_answer is not None:
+                on_route(model, route, "cache")
+                return self.metrics.observe_stream(replay_stream(cached_answer), persona.key, model,
+                                                   source="cache", started_at=started_at)
+
+        try:
+            response = self._generate(session.session_id, model, self.contents(session, prompt), temperature,
+                                      max_output_tokens, heartbeat)
+        except UpstreamUnavailable as e:
+            self.metrics.record_error(e, persona.key, model)
+            on_route(model, route, "fallback")
+            return self.metrics.observe_stream(replay_stream(self.fallback_answer(prompt, model, temperature)),
+                                               persona.key, model, source="fallback", started_at=started_at)
+        except Exception as e:
+            self.metrics.record_error(e, persona.key, model)
+            raise
+        on_route(model, route, "model")
+        if standalone:
+            response = cached_stream(self.cache, prompt, model, temperature, persona.system_prompt, response)
+        if decision is not None:
+            response = self.router.track(decision, persona.key, response)
+        response = self._with_fallback(response, prompt, model, temperature, partial(on_route, model, route))
+        return self.metrics.observe_stream(response, persona.key, model, started_at=started_at)
+
+    def _generate(self, session_id, model, contents, temperature, max_output_tokens=None, heartbeat=None):
+        """Queue the upstream request, referencing the cached system prompt when one is ready"""
+        cached_content = self.prompt_cache.lookup(self.persona, model) if self.prompt_cache is not None else None
+        request = dict(session_id=session_id, model=model, contents=contents, heartbeat=heartbeat)
+        response = self.service.stream(config=self.config(temperature, max_output_tokens, cached_content), **request)
+        if cached_content is None:
+            return response
+        return self._inline_on_cache_miss(response, cached_content, request, temperature, max_output_tokens)
+
+    def _inline_on_cache_miss(self, response, cached_content, request, temperature, max_output_tokens):
+        """Pass `response` through; if upstream no longer knows the cache, resend with the prompt inline"""
+        shown = False
+        try:
+            for chunk in response:
+                shown = shown or bool(getattr(chunk, "text", None))
+                yield chunk
+            return
+        except Exception as e:
+            # Expired or deleted caches come back as 400/403/404 before any output
+            if shown or getattr(e, "code", None) not in (400, 403, 404):
+                raise
+            logger.warning("Context cache %s rejected, resending the prompt inline: %s", cached_content, e)
+            self.prompt_cache.invalidate(self.persona, request["model"], cached_content)
+        finally:
+            close = getattr(response, "close", None)
+            if close is not None:
+                close()
+        yield from self.service.stream(config=self.config(temperature, max_output_tokens), **request)
+
+    def fallback_answer(self, prompt, model, temperature):
+        """A cached answer to a matching question, else the persona's degraded message"""
+        persona = self.persona
+        for candidate in dict.fromkeys((model, persona.model)):
+            answer = self.cache.get(prompt, candidate, temperature, persona.system_prompt)
+            if answer is not None:
+                self.metrics.inc("chat_fallbacks_total", kind="cached", persona=persona.key)
+                return answer
+        self.metrics.inc("chat_fallbacks_total", kind="canned", persona=persona.key)
+        return persona.degraded_message
+
+    def _with_fallback(self, response, prompt, model, temperature, on_source=None):
+        """Pass `response` through; if it fails before any text, serve the fallback answer instead"""
+        shown = False
+        try:
+            for chunk in response:
+                shown = shown or bool(getattr(chunk, "text", None))
+                yield chunk
+        except Exception as e:
+            if shown:
+                raise
+            # Retries and hedging already ran in the service, so this is a real outage for this request
+            self.metrics.record_error(e, self.persona.key, model)
+            logger.warning("Serving fallback answer after upstream failure: %r", e)
+            if on_source is not None:
+                on_source("fallback")
+            yield from replay_stream(self.fallback_answer(prompt, model, temperature))
+        finally:
+            close = getattr(response, "close", None)
+            if close is not None:
+                close()
+
+    def _crisis_stream(self, session, prompt, model, temperature, match, started_at, heartbeat=None):
+        persona = self.persona
+        session.flag(match.categories)
+        for category in match.categories:
+            self.metrics.inc("chat_crisis_total", persona=persona.key, category=category)
+        logger.warning("Crisis terms (%s) in session %s", ", ".join(match.categories), session.session_id)
+
+        response = None
+        if CRISIS_MODE == "continue":
+            # Started now so the model works while the notice is on screen
+            try:
+                response = self._generate(session.session_id, model, self.contents(session, prompt), temperature,
+                                          heartbeat=heartbeat)
+            except Exception as e:
+                self.metrics.record_error(e, persona.key, model)
+        stream = _after_notice(persona.crisis_message, response)
+        return self.metrics.observe_stream(stream, persona.key, model, source="crisis", started_at=started_at)
+
+    def follow_ups(self, session, prompt, answer, model=None, temperature=None):
+        """Suggested next questions after `answer`; the first few are answered in the background"""
+        persona = self.persona
+        # No cheerful suggestions right after a crisis message
+        if self.suggester is None or session.recently_flagged():
+            return []
+        asked = {message.content for message in session.messages if message.role == "user"}
+        questions = self.suggester.suggest(persona, prompt, answer, asked)
+        if self.prefetcher is None:
+            return questions
+        model = model or persona.model
+        temperature = persona.temperature if temperature is None else temperature
+        history_tokens = session.context.stats()["tokens"] + estimate_tokens(persona.system_prompt)
+        for slot, question in enumerate(questions[:self.prefetcher.per_answer]):
+            contents = self.contents(session, question, pending=True)
+            # A key per slot, so prefetches neither supersede the session's own stream nor each other
+            open_stream = partial(self._generate, f"{session.session_id}:prefetch:{slot}", model, contents,
+                                  temperature)
+            self.prefetcher.start(session.session_id, persona, question, open_stream,
+                                  history_tokens + estimate_tokens(question), persona.max_output_tokens)
+        return questions
+
+    def contents(self, session, prompt, pending=False):
+        """The session's history, with reference passages placed just before the question.
+
+        `pending` means `prompt` isn't in the history yet, as for a prefetched follow-up.
+        """
+        contents = session.context.contents()
+        if pending:
+            contents.append(types.Content(role="user", parts=[types.Part(text=prompt)]))
+        reference = self.retriever.reference_text(prompt) if self.retriever is not None else ""
+        if reference:
+            # Sent with this request only, so passages never pile up in the history
+            contents[-1:-1] = [
+                types.Content(role="user", parts=[types.Part(text=reference)]),
+                types.Content(role="model", parts=[types.Part(text="OK.")]),
+            ]
+        return contents
+
+    def stats(self):
+        """Counters from the shared connection pool, generation queue, cache and sessions"""
+        stats = {
+            "connections": connection_stats(),
+            "generation": self.service.stats(),
+            "cache": self.cache.stats(),
+            "sessions": get_registry().memory_report(),
+        }
+        if self.retriever is not None:
+            stats["retrieval"] = self.retriever.stats()
+        if self.router is not None:
+            stats["routing"] = self.router.stats()
+        if self.prompt_cache is not None:
+            stats["prompt_cache"] = self.prompt_cache.stats()
+        if self.prefetcher is not None:
+            stats["prefetch"] = self.prefetcher.stats()
+        return stats
+
+
+def _after_notice(notice, response):
+    """The notice, then the model's answer if there is one; upstream errors only end the stream"""
+    yield from replay_stream(notice)
+    if response is None:
+        return
+    separated = False
+    try:
+        for chunk in response:
+            if not separated and getattr(chunk, "text", None):
+                yield SimpleNamespace(text="\n\n")
+                separated = True
+            yield chunk
+    except Exception:
+        # The notice is already on screen; don't let a failed follow-up replace it
+        logger.exception("Model answer after the crisis message failed")
+    finally:
+        close = getattr(response, "close", None)
+        if close is not None:
+            close()
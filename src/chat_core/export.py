@@ -0,0 +1,113 @@
+"""Stream anonymized transcripts out of the conversation store.
+
+Rows are read from the database cursor and written as they arrive, so memory
+use stays flat however many conversations are stored:
+
+    cd src && python -m chat_core.export transcripts.jsonl
+    cd src && python -m chat_core.export transcripts.parquet --format parquet
+    cd src && python -m chat_core.export transcripts.jsonl --state-url redis://localhost:6379/0
+"""
+import argparse
+import hashlib
+import json
+import re
+import sys
+
+from .persistence import DEFAULT_DB_PATH, SharedConversationStore, SQLiteConversationStore
+from .shared_state import open_shared_state
+
+PARQUET_BATCH_ROWS = 10_000
+
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_PHONE = re.compile(r"(?<!\d)(?:\+?84|0)(?:[\s.-]?\d){8,10}(?!\d)")
+
+
+def anonymize_text(text):
+    text = _EMAIL.sub("[email]", text)
+    return _PHONE.sub("[phone]", text)
+
+
+def anonymize_id(session_id, salt):
+    return hashlib.sha256(f"{salt}:{session_id}".encode("utf-8")).hexdigest()[:16]
+
+
+def iter_records(store, salt="", anonymize=True):
+    for session_id, persona, seq, role, content, created_at in store.iter_all():
+        if anonymize:
+            session_id = anonymize_id(session_id, salt)
+            content = anonymize_text(content)
+        yield {
+            "session": session_id,
+            "persona": persona,
+            "seq": seq,
+            "role": role,
+            "content": content,
+            "created_at": created_at,
+        }
+
+
+def write_jsonl(records, out):
+    count = 0
+    for record in records:
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+def write_parquet(records, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("session", pa.string()),
+        ("persona", pa.string()),
+        ("seq", pa.int64()),
+        ("role", pa.string()),
+        ("content", pa.string()),
+        ("created_at", pa.float64()),
+    ])
+    count = 0
+    batch = []
+    with pq.ParquetWriter(path, schema) as writer:
+        for record in records:
+            batch.append(record)
+            if len(batch) >= PARQUET_BATCH_ROWS:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            count += len(batch)
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export stored chat transcripts")
+    parser.add_argument("output", help="output file, or - for stdout (jsonl only)")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="SQLite conversation store")
+    parser.add_argument("--state-url", help="read from this shared state (CHAT_STATE_URL) instead of SQLite")
+    parser.add_argument("--salt", default="", help="salt for hashing session IDs")
+    parser.add_argument("--raw", action="store_true", help="keep session IDs and contact details as stored")
+    args = parser.parse_args(argv)
+
+    if args.state_url:
+        store = SharedConversationStore(open_shared_state(args.state_url))
+    else:
+        store = SQLiteConversationStore(args.db)
+    records = iter_records(store, salt=args.salt, anonymize=not args.raw)
+    try:
+        if args.format == "parquet":
+            count = write_parquet(records, args.output)
+        elif args.output == "-":
+            count = write_jsonl(records, sys.stdout)
+        else:
+            with open(args.output, "w", encoding="utf-8") as out:
+                count = write_jsonl(records, out)
+    finally:
+        store.close()
+    print(f"Exported {count} messages", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import asyncio
+import itertools
+import os
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+SAMPLE_ANSWER = (
+    "Cảm giác lo lắng trước kỳ thi là điều rất bình thường. Bạn có thể thử chia nhỏ việc ôn tập, "
+    "ngủ đủ giấc, hít thở sâu khi thấy căng thẳng và chia sẻ với thầy cô hoặc cha mẹ. "
+    "Nếu cảm giác này kéo dài và ảnh hưởng tới sinh hoạt, hãy tìm tới chuyên gia tâm lý của trường nhé. "
+)
+
+
+class FakeUpstreamError(Exception):
+    """Injected upstream failure, carrying an HTTP-like status code"""
+
+    def __init__(self, code=503, message="fake upstream error"):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+@dataclass
+class FakeSettings:
+    """Timing and failure knobs for the fake Gemini backend"""
+    tokens_per_second: float = 200.0
+    chunk_chars: int = 24
+    first_token_delay: float = 0.3
+    answer_chars: int = 600
+    error_rate: float = 0.0
+    # Failures before the first chunk, like a refused connection or a 503 up front
+    connect_error_rate: float = 0.0
+    # Share of responses whose first token takes `slow_delay` instead
+    slow_rate: float = 0.0
+    slow_delay: float = 5.0
+    # Whether caches.create succeeds; off behaves like a model without context caching
+    caching: bool = True
+    # caches.create rejects smaller inputs, as the API does
+    cache_min_tokens: int = 1024
+    seed: int = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            tokens_per_second=float(os.getenv("FAKE_GEMINI_TOKENS_PER_SECOND", cls.tokens_per_second)),
+            chunk_chars=int(os.getenv("FAKE_GEMINI_CHUNK_CHARS", cls.chunk_chars)),
+            first_token_delay=float(os.getenv("FAKE_GEMINI_FIRST_TOKEN_DELAY", cls.first_token_delay)),
+            answer_chars=int(os.getenv("FAKE_GEMINI_ANSWER_CHARS", cls.answer_chars)),
+            error_rate=float(os.getenv("FAKE_GEMINI_ERROR_RATE", cls.error_rate)),
+            connect_error_rate=float(os.getenv("FAKE_GEMINI_CONNECT_ERROR_RATE", cls.connect_error_rate)),
+            slow_rate=float(os.getenv("FAKE_GEMINI_SLOW_RATE", cls.slow_rate)),
+            slow_delay=float(os.getenv("FAKE_GEMINI_SLOW_DELAY", cls.slow_delay)),
+            caching=os.getenv("FAKE_GEMINI_CACHING", "1") != "0",
+            cache_min_tokens=int(os.getenv("FAKE_GEMINI_CACHE_MIN_TOKENS", cls.cache_min_tokens)),
+        )
+
+
+def _answer(chars):
+    repeats = chars // len(SAMPLE_ANSWER) + 1
+    return (SAMPLE_ANSWER * repeats)[:chars]
+
+
+def _usage(prompt_tokens, output_tokens, cached_tokens=0):
+    return SimpleNamespace(
+        prompt_token_count=prompt_tokens,
+        cached_content_token_count=cached_tokens or None,
+        candidates_token_count=output_tokens,
+        total_token_count=prompt_tokens + output_tokens,
+    )
+
+
+def _text_tokens(text):
+    return len(text) // 4 + 1
+
+
+def _prompt_tokens(contents):
+    if isinstance(contents, str):
+        return _text_tokens(contents)
+    total = 0
+    for content in contents or []:
+        for part in getattr(content, "parts", None) or []:
+            total += len(getattr(part, "text", "") or "") // 4 + 1
+    return total
+
+
+class _Plan:
+    """Precomputed chunks and delays for one fake response"""
+
+    def __init__(self, settings, rng, contents, system_tokens=0, cached_tokens=0):
+        self.fail = rng.random() < settings.error_rate
+        self.fail_connect = rng.random() < settings.connect_error_rate
+        text = _answer(settings.answer_chars)
+        step = settings.chunk_chars
+        self.chunks = [text[i:i + step] for i in range(0, len(text), step)]
+        # Roughly four characters per token
+        self.chunk_delay = (step / 4) / settings.tokens_per_second if settings.tokens_per_second else 0.0
+        slow = rng.random() < settings.slow_rate
+        self.first_token_delay = settings.slow_delay if slow else settings.first_token_delay
+        # As in the API, the prompt count includes tokens served from a context cache
+        self.prompt_tokens = _prompt_tokens(contents) + system_tokens + cached_tokens
+        self.cached_tokens = cached_tokens
+        self.output_tokens = len(text) // 4 + 1
+
+    def chunk(self, i):
+        last = i == len(self.chunks) - 1
+        usage = _usage(self.prompt_tokens, self.output_tokens, self.cached_tokens) if last else None
+        return SimpleNamespace(text=self.chunks[i], usage_metadata=usage)
+
+
+class _FakeModels:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def generate_content_stream(self, model, contents, config=None):
+        plan = self._backend._plan(model, contents, config)
+        if plan.fail_connect:
+            raise FakeUpstreamError()
+        time.sleep(plan.first_token_delay)
+        for i in range(len(plan.chunks)):
+            if i:
+                time.sleep(plan.chunk_delay)
+            if plan.fail and i == len(plan.chunks) // 2:
+                raise FakeUpstreamError()
+            yield plan.chunk(i)
+
+
+class _FakeAsyncModels:
+    def __init__(self, backend):
+        self._backend = backend
+
+    async def generate_content_stream(self, model, contents, config=None):
+        plan = self._backend._plan(model, contents, config)
+        if plan.fail_connect:
+            raise FakeUpstreamError()
+
+        async def stream():
+            await asyncio.sleep(plan.first_token_delay)
+            for i in range(len(plan.chunks)):
+                if i:
+                    await asyncio.sleep(plan.chunk_delay)
+                if plan.fail and i == len(plan.chunks) // 2:
+                    raise FakeUpstreamError()
+                yield plan.chunk(i)
+
+        return stream()
+
+
+def _ttl_seconds(ttl):
+    return float(str(ttl).rstrip("s"))
+
+
+class _FakeCaches:
+    """Context caches: create, update (TTL only), get and delete"""
+
+    def __init__(self, backend):
+        self._backend = backend
+        self._items = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.created = 0
+        self.updated = 0
+
+    def create(self, model, config):
+        if not self._backend.settings.caching:
+            raise FakeUpstreamError(400, f"context caching is not supported for {model}")
+        tokens = _text_tokens(config.system_instruction or "") + _prompt_tokens(config.contents)
+        minimum = self._backend.settings.cache_min_tokens
+        if tokens < minimum:
+            raise FakeUpstreamError(400, f"cached content is too small: {tokens} tokens, the minimum is {minimum}")
+        name = f"cachedContents/fake-{next(self._ids)}"
+        item = SimpleNamespace(name=name, model=model, display_name=config.display_name,
+                               expire_at=time.time() + _ttl_seconds(config.ttl),
+                               usage_metadata=SimpleNamespace(total_token_count=tokens))
+        with self._lock:
+            self._items[name] = item
+            self.created += 1
+        return item
+
+    def update(self, name, config):
+        item = self.get(name)
+        with self._lock:
+            item.expire_at = time.time() + _ttl_seconds(config.ttl)
+            self.updated += 1
+        return item
+
+    def get(self, name):
+        with self._lock:
+            item = self._items.get(name)
+            if item is None or item.expire_at <= time.time():
+                self._items.pop(name, None)
+                raise FakeUpstreamError(404, f"{name} not found")
+            return item
+
+    def delete(self, name):
+        with self._lock:
+            self._items.pop(name, None)
+
+
+class FakeGeminiClient:
+    """Local stand-in for genai.Client covering the streaming calls the app makes"""
+
+    def __init__(self, settings=None):
+        self.settings = settings or FakeSettings()
+        # Most recent requests, for inspection from benchmarks
+        self.requests = deque(maxlen=1000)
+        self.request_count = 0
+        self._rng = random.Random(self.settings.seed)
+        self.models = _FakeModels(self)
+        self.caches = _FakeCaches(self)
+        self.aio = SimpleNamespace(models=_FakeAsyncModels(self))
+
+    def _plan(self, model, contents, config):
+        self.request_count += 1
+        cached_content = getattr(config, "cached_content", None)
+        self.requests.append({"model": model, "config": config, "contents": contents,
+                              "cached_content": cached_content, "at": time.time()})
+        system_instruction = getattr(config, "system_instruction", None)
+        system_tokens = _text_tokens(system_instruction) if isinstance(system_instruction, str) else 0
+        cached_tokens = 0
+        if cached_content:
+            # Raises 404 like the API once the cache has expired or been deleted
+            cached_tokens = self.caches.get(cached_content).usage_metadata.total_token_count
+        return _Plan(self.settings, self._rng, contents, system_tokens, cached_tokens)
@@ -0,0 +1,42 @@
+"""Build or query the passage index used to ground answers.
+
+    cd src && python -m chat_core.ingest build ../docs/lyly indexes/lyly
+    cd src && python -m chat_core.ingest search indexes/lyly "mất ngủ trước kỳ thi"
+
+Point CHAT_RETRIEVAL_DIR at the parent folder (`indexes` above); each persona
+uses the index named after its key.
+"""
+import argparse
+import time
+
+from .retrieval import DEFAULT_CHUNK_CHARS, DEFAULT_DIM, DEFAULT_TOP_K, PassageIndex, build_index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query a passage index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="index every .txt/.md file under a folder")
+    build.add_argument("docs_dir")
+    build.add_argument("index_dir")
+    build.add_argument("--dim", type=int, default=DEFAULT_DIM)
+    build.add_argument("--dtype", choices=["float16", "int8"], default="float16")
+    build.add_argument("--chunk-chars", type=int, default=DEFAULT_CHUNK_CHARS)
+    search = commands.add_parser("search", help="print the best passages for a query")
+    search.add_argument("index_dir")
+    search.add_argument("query")
+    search.add_argument("-k", type=int, default=DEFAULT_TOP_K)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        started = time.perf_counter()
+        manifest = build_index(args.docs_dir, args.index_dir, dim=args.dim, dtype=args.dtype,
+                               chunk_chars=args.chunk_chars)
+        print(f"Indexed {manifest['count']} passages from {len(manifest['sources'])} files "
+              f"in {time.perf_counter() - started:.1f}s")
+    else:
+        for passage in PassageIndex(args.index_dir).search(args.query, args.k):
+            print(f"{passage.score:.3f}  {passage.source}\n{passage.text}\n")
+
+
+if __name__ == "__main__":
+    main()
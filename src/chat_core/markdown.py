@@ -0,0 +1,211 @@
+"""Escaped markdown-to-HTML for messages drawn with unsafe_allow_html.
+
+Covers what shows up in chat answers: paragraphs with line breaks, headings,
+bullet and numbered lists (nested by indentation), block quotes, fenced code,
+rules, and inline bold, italics, code and http(s)/mailto links. Every piece of
+text is HTML-escaped before any markup is added, so nothing a student or the
+model writes can inject tags, styles or scripts.
+
+`IncrementalMarkdown` converts a text that keeps growing, as while an answer
+streams in. Blocks end at blank lines outside code fences; a block is
+converted once, when the next one starts, and each update only reparses the
+unfinished last block. The HTML never contains a newline, so Streamlit's own
+markdown pass leaves it as a single raw HTML block.
+"""
+import re
+from html import escape
+
+_FENCE = re.compile(r"^ {0,3}(`{3,}|~{3,})\s*([\w+-]*)")
+_HEADING = re.compile(r"^ {0,3}(#{1,6})\s+(.*?)(?:\s+#+)?\s*$")
+_RULE = re.compile(r"^ {0,3}([-*_])(?:\s*\1){2,}\s*$")
+_QUOTE = re.compile(r"^ {0,3}> ?(.*)$")
+_ITEM = re.compile(r"^(\s*)([-*+]|\d{1,9}[.)])\s+(.*)$")
+
+_CODE_SPAN = re.compile(r"`([^`\n]+)`")
+_LINK = re.compile(r"\[([^\]\n]+)\]\(((?:https?://|mailto:)[^\s)]+)\)")
+_BOLD_ITALIC = re.compile(r"\*\*\*(?=\S)(.+?)(?<=\S)\*\*\*")
+_BOLD = re.compile(r"\*\*(?=\S)(.+?)(?<=\S)\*\*|__(?=\S)(.+?)(?<=\S)__")
+_ITALIC = re.compile(r"(?<![\w*])\*(?=[^\s*])(.+?)(?<=[^\s*])\*(?![\w*])|(?<!\w)_(?=\S)(.+?)(?<=\S)_(?!\w)")
+
+# Headings are drawn smaller than the page's own: "#" becomes <h3>
+_HEADING_OFFSET = 2
+
+
+def _emphasis(escaped):
+    escaped = _BOLD_ITALIC.sub(r"<strong><em>\1</em></strong>", escaped)
+    escaped = _BOLD.sub(lambda m: f"<strong>{m.group(1) or m.group(2)}</strong>", escaped)
+    return _ITALIC.sub(lambda m: f"<em>{m.group(1) or m.group(2)}</em>", escaped)
+
+
+def _text(text):
+    """Escape and apply bold and italics; link targets are kept out of the emphasis rules"""
+    out = []
+    last = 0
+    for m in _LINK.finditer(text):
+        out.append(_emphasis(escape(text[last:m.start()])))
+        href = escape(m.group(2), quote=True)
+        out.append(f'<a href="{href}" target="_blank" rel="noopener noreferrer">{_emphasis(escape(m.group(1)))}</a>')
+        last = m.end()
+    out.append(_emphasis(escape(text[last:])))
+    return "".join(out)
+
+
+def inline_html(text):
+    """One line or paragraph of inline markdown as escaped HTML"""
+    # Code spans split the text first: nothing inside them is markup
+    parts = _CODE_SPAN.split(text)
+    return "".join(f"<code>{escape(part)}</code>" if i % 2 else _text(part) for i, part in enumerate(parts))
+
+
+def _starts_block(line):
+    return bool(_FENCE.match(line) or _HEADING.match(line) or _RULE.match(line) or _QUOTE.match(line)
+                or _ITEM.match(line))
+
+
+def _indent(line):
+    return len(line) - len(line.lstrip())
+
+
+def _list_html(lines, i):
+    """The list starting at lines[i] and the index after it"""
+    first = _ITEM.match(lines[i])
+    base = len(first.group(1))
+    ordered = first.group(2)[0].isdigit()
+    items = []
+    while i < len(lines):
+        m = _ITEM.match(lines[i])
+        if m is None or len(m.group(1)) != base or m.group(2)[0].isdigit() != ordered:
+            break
+        offset = m.start(3)
+        body = [m.group(3)]
+        i += 1
+        # Deeper-indented lines, and plain lines that simply wrap, belong to this item
+        while i < len(lines):
+            line = lines[i]
+            nested = _ITEM.match(line)
+            if nested is not None and len(nested.group(1)) <= base:
+                break
+            if nested is None and _indent(line) <= base and _starts_block(line):
+                break
+            body.append(line[min(_indent(line), offset):])
+            i += 1
+        html = _blocks_html(body)
+        # Tight lists: a single paragraph is drawn without its <p>
+        if html.startswith("<p>") and html.endswith("</p>") and html.count("<p>") == 1:
+            html = html[3:-4]
+        items.append(f"<li>{html}</li>")
+    tag = "ol" if ordered else "ul"
+    start = int(first.group(2)[:-1]) if ordered else 1
+    attrs = f' start="{start}"' if start != 1 else ""
+    return f"<{tag}{attrs}>{''.join(items)}</{tag}>", i
+
+
+def _blocks_html(lines):
+    out = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if not line.strip():
+            i += 1
+            continue
+        fence = _FENCE.match(line)
+        if fence is not None:
+            marker = fence.group(1)
+            code = []
+            i += 1
+            while i < len(lines) and not lines[i].strip().startswith(marker):
+                code.append(escape(lines[i]))
+                i += 1
+            i += 1
+            language = f' class="language-{fence.group(2)}"' if fence.group(2) else ""
+            # Newlines as entities keep blank code lines from ending the HTML block
+            out.append(f"<pre><code{language}>{'&#10;'.join(code)}</code></pre>")
+            continue
+        heading = _HEADING.match(line)
+        if heading is not None:
+            level = min(6, len(heading.group(1)) + _HEADING_OFFSET)
+            out.append(f"<h{level}>{inline_html(heading.group(2))}</h{level}>")
+            i += 1
+            continue
+        if _RULE.match(line):
+            out.append("<hr>")
+            i += 1
+            continue
+        if _QUOTE.match(line):
+            quoted = []
+            while i < len(lines) and _QUOTE.match(lines[i]):
+                quoted.append(_QUOTE.match(lines[i]).group(1))
+                i += 1
+            out.append(f"<blockquote>{_blocks_html(quoted)}</blockquote>")
+            continue
+        if _ITEM.match(line):
+            html, i = _list_html(lines, i)
+            out.append(html)
+            continue
+        paragraph = [line.strip()]
+        i += 1
+        while i < len(lines) and lines[i].strip() and not _starts_block(lines[i]):
+            paragraph.append(lines[i].strip())
+            i += 1
+        out.append(f"<p>{'<br>'.join(inline_html(part) for part in paragraph)}</p>")
+    return "".join(out)
+
+
+def block_end(text, pos):
+    """End of the block starting at `pos`: just past the first blank line after some content,
+    outside code fences. None while the block may still grow."""
+    marker = None
+    seen = False
+    start = pos
+    while True:
+        newline = text.find("\n", start)
+        if newline < 0:
+            return None
+        line = text[start:newline]
+        if marker is not None:
+            if line.strip().startswith(marker):
+                marker = None
+        elif not line.strip():
+            if seen:
+                return newline + 1
+        else:
+            seen = True
+            fence = _FENCE.match(line)
+            if fence is not None:
+                marker = fence.group(1)
+        start = newline + 1
+
+
+class IncrementalMarkdown:
+    """Converts a growing text, reparsing only the last, unfinished block"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._stable_text = ""
+        self._stable_html = ""
+        self.blocks = 0
+
+    def render(self, text):
+        if not text.startswith(self._stable_text):
+            # Not a continuation of the previous text
+            self.reset()
+        pos = len(self._stable_text)
+        parts = []
+        while True:
+            end = block_end(text, pos)
+            if end is None:
+                break
+            parts.append(_blocks_html(text[pos:end].split("\n")))
+            pos = end
+        if parts:
+            self._stable_text = text[:pos]
+            self._stable_html += "".join(parts)
+            self.blocks += len(parts)
+        return self._stable_html + _blocks_html(text[pos:].split("\n"))
+
+
+def markdown_html(text):
+    """A whole message as escaped HTML"""
+    return IncrementalMarkdown().render(text)
@@ -0,0 +1,301 @@
+"""Generation and rendering metrics in Prometheus text format, plus optional
+OpenTelemetry spans.
+
+Metrics are off unless one of CHAT_METRICS_PORT (serve /metrics over HTTP),
+CHAT_METRICS_FILE (rewrite a textfile-collector file) or CHAT_OTEL (emit
+spans) is set. When off, `get_metrics()` returns a no-op recorder and
+`observe_stream` hands the stream back untouched.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+_GAP_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+_DURATION_BUCKETS = (0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    "chat_streams_total": ("counter", "Answer streams by outcome (completed, failed, cancelled)", None),
+    "chat_errors_total": ("counter", "Generation errors by exception class", None),
+    "chat_time_to_first_chunk_seconds": ("histogram", "Request start to first answer chunk", _LATENCY_BUCKETS),
+    "chat_inter_chunk_gap_seconds": ("histogram", "Time between consecutive answer chunks", _GAP_BUCKETS),
+    "chat_stream_duration_seconds": ("histogram", "Request start to last answer chunk", _DURATION_BUCKETS),
+    "chat_prompt_tokens_total": ("counter", "Prompt tokens reported in usage metadata", None),
+    "chat_output_tokens_total": ("counter", "Output tokens reported in usage metadata", None),
+    "chat_cached_prompt_tokens_total": ("counter", "Prompt tokens served from a context cache", None),
+    "chat_queue_wait_seconds": ("histogram", "Time a request waited for a free generation slot", _LATENCY_BUCKETS),
+    "chat_upstream_events_total": ("counter", "Retries, hedges, first-chunk timeouts and breaker rejections", None),
+    "chat_fallbacks_total": ("counter", "Answers served locally because upstream failed, by kind (cached, canned)", None),
+    "chat_cancelled_streams_total": ("counter", "Streams stopped before completion, by reason (closed, superseded)", None),
+    "chat_cancelled_output_tokens_total": ("counter", "Output tokens left ungenerated by cancelled streams (upper bound)", None),
+    "chat_prefetch_total": ("counter", "Prefetched follow-up answers by outcome (used, discarded, failed, skipped)", None),
+    "chat_prefetch_tokens_total": ("counter", "Tokens spent on prefetched answers, by outcome (used, wasted)", None),
+    "chat_crisis_total": ("counter", "Prompts that matched the crisis term list, by category", None),
+    "chat_renders_total": ("counter", "Placeholder redraws while answers streamed", None),
+    "chat_render_seconds_total": ("counter", "Time spent redrawing streamed answers", None),
+}
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Metrics:
+    """Thread-safe counters and histograms keyed by name and label values"""
+
+    enabled = True
+
+    def __init__(self, tracer=None):
+        self.tracer = tracer
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = _Histogram(METRICS[name][2])
+            histogram.observe(value)
+
+    def observe_stream(self, stream, persona, model, source="model", started_at=None):
+        """Pass chunks through, recording latency, gaps, token usage and the outcome"""
+        return self._observe_stream(stream, persona, model, source, started_at or time.perf_counter())
+
+    def _observe_stream(self, stream, persona, model, source, started_at):
+        labels = {"persona": persona, "model": model}
+        span = self._start_span(persona, model, source)
+        last_chunk_at = None
+        chunks = 0
+        usage = None
+        outcome = "completed"
+        try:
+            for chunk in stream:
+                now = time.perf_counter()
+                if last_chunk_at is None:
+                    self.observe("chat_time_to_first_chunk_seconds", now - started_at, source=source, **labels)
+                else:
+                    self.observe("chat_inter_chunk_gap_seconds", now - last_chunk_at, source=source, **labels)
+                last_chunk_at = now
+                chunks += 1
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                yield chunk
+        except Exception as e:
+            outcome = "failed"
+            self.inc("chat_errors_total", error=type(e).__name__, **labels)
+            if span is not None:
+                span.record_exception(e)
+            raise
+        except BaseException:
+            # Closed early, cancelled by a newer prompt or interrupted by a rerun
+            outcome = "cancelled"
+            raise
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+            ended_at = last_chunk_at or time.perf_counter()
+            self.observe("chat_stream_duration_seconds", ended_at - started_at, source=source, **labels)
+            self.inc("chat_streams_total", outcome=outcome, source=source, **labels)
+            prompt_tokens = getattr(usage, "prompt_token_count", None) or 0
+            output_tokens = getattr(usage, "candidates_token_count", None) or 0
+            cached_tokens = getattr(usage, "cached_content_token_count", None) or 0
+            if prompt_tokens:
+                self.inc("chat_prompt_tokens_total", prompt_tokens, **labels)
+            if cached_tokens:
+                self.inc("chat_cached_prompt_tokens_total", cached_tokens, **labels)
+            if output_tokens:
+                self.inc("chat_output_tokens_total", output_tokens, **labels)
+            if span is not None:
+                self._end_span(span, outcome, chunks, prompt_tokens, output_tokens)
+
+    def record_error(self, error, persona, model):
+        self.inc("chat_errors_total", error=type(error).__name__, persona=persona, model=model)
+
+    def record_render(self, persona, stats):
+        """Record a StreamRenderer's redraw count and time"""
+        self.inc("chat_renders_total", stats["renders"], persona=persona)
+        self.inc("chat_render_seconds_total", stats["render_ms"] / 1000, persona=persona)
+
+    def _start_span(self, persona, model, source):
+        if self.tracer is None:
+            return None
+        return self.tracer.start_span("chat.generate", attributes={
+            "chat.persona": persona, "chat.model": model, "chat.source": source,
+        })
+
+    def _end_span(self, span, outcome, chunks, prompt_tokens, output_tokens):
+        from opentelemetry.trace import Status, StatusCode
+
+        span.set_attribute("chat.outcome", outcome)
+        span.set_attribute("chat.chunks", chunks)
+        span.set_attribute("chat.prompt_tokens", prompt_tokens)
+        span.set_attribute("chat.output_tokens", output_tokens)
+        if outcome == "failed":
+            span.set_status(Status(StatusCode.ERROR))
+        span.end()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            items = sorted(
+                (key, value if not isinstance(value, _Histogram) else
+                 (list(value.counts), value.sum, value.count))
+                for key, value in self._values.items()
+            )
+        lines = []
+        current = None
+        for (name, labels), value in items:
+            kind, help_text, buckets = METRICS[name]
+            if name != current:
+                current = name
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip((*buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+class NullMetrics:
+    """Recorder used when metrics are off; every call is a no-op"""
+
+    enabled = False
+
+    def inc(self, name, value=1, **labels):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def observe_stream(self, stream, persona, model, source="model", started_at=None):
+        return stream
+
+    def record_error(self, error, persona, model):
+        pass
+
+    def record_render(self, persona, stats):
+        pass
+
+    def render(self):
+        return ""
+
+
+def serve_metrics(metrics, port, host="0.0.0.0"):
+    """Serve `metrics.render()` at /metrics from a daemon thread"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def write_metrics_file(metrics, path):
+    # Write-then-rename so a scraper never sees a half-written file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(metrics.render())
+    os.replace(tmp_path, path)
+
+
+def _file_writer(metrics, path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write_metrics_file(metrics, path)
+        except OSError:
+            logger.exception("Could not write metrics to %s", path)
+
+
+def _otel_tracer():
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logger.warning("CHAT_OTEL is set but opentelemetry-api is not installed; spans are disabled")
+        return None
+    return trace.get_tracer("chat_core")
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Return the process-wide metrics recorder, configured from the environment"""
+    global _metrics
+    if _metrics is not None:
+        return _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            port = os.getenv("CHAT_METRICS_PORT")
+            path = os.getenv("CHAT_METRICS_FILE")
+            otel = os.getenv("CHAT_OTEL") == "1"
+            if not (port or path or otel):
+                _metrics = NullMetrics()
+                return _metrics
+            metrics = Metrics(tracer=_otel_tracer() if otel else None)
+            if port:
+                try:
+                    serve_metrics(metrics, int(port))
+                except OSError:
+                    # Another worker on this host already serves the port
+                    logger.warning("Metrics port %s is in use; not serving /metrics from this process", port)
+            if path:
+                interval = float(os.getenv("CHAT_METRICS_INTERVAL", "15"))
+                threading.Thread(target=_file_writer, args=(metrics, path, interval),
+                                 name="metrics-file", daemon=True).start()
+                atexit.register(write_metrics_file, metrics, path)
+            _metrics = metrics
+    return _metrics
@@ -0,0 +1,302 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from .shared_state import get_shared_state
+from .store import Message
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.getenv("CHAT_DB_PATH", "chat_history.sqlite3")
+RESUME_MESSAGES = int(os.getenv("CHAT_RESUME_MESSAGES", "20"))
+WRITE_BATCH_SIZE = 64
+WRITE_BATCH_SECONDS = 0.2
+# Tries for a batch hitting a busy or locked database, with a doubling pause in between
+WRITE_ATTEMPTS = 3
+WRITE_RETRY_SECONDS = 0.1
+PAGE_SIZE = 200
+
+_STOP = object()
+# The next seq is assigned in the same statement, under the write lock
+_INSERT = ("INSERT INTO messages SELECT ?, COALESCE(MAX(seq) + 1, 0), ?, ?, ?, ? FROM messages"
+           " WHERE session_id = ?")
+
+
+class ConversationStore:
+    """Interface for durable transcript storage.
+
+    Messages are addressed by (session_id, seq), where seq is the message's
+    0-based position in the session's transcript. The store assigns seq on
+    append, so two live copies of a session (a duplicated tab, or a worker
+    that resumed it too) add their turns after each other's instead of
+    overwriting them.
+    """
+
+    def append(self, session_id, persona, role, content):
+        raise NotImplementedError
+
+    def count(self, session_id):
+        raise NotImplementedError
+
+    def load_range(self, session_id, start, stop):
+        """Messages with start <= seq < stop, oldest first"""
+        raise NotImplementedError
+
+    def iter_messages(self, session_id, start=0, stop=None):
+        """Yield a session's messages in pages, oldest first"""
+        stop = self.count(session_id) if stop is None else stop
+        for page_start in range(start, stop, PAGE_SIZE):
+            yield from self.load_range(session_id, page_start, min(stop, page_start + PAGE_SIZE))
+
+    def iter_all(self):
+        """Yield (session_id, persona, seq, role, content, created_at) rows for every stored message"""
+        raise NotImplementedError
+
+    def delete_session(self, session_id):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteConversationStore(ConversationStore):
+    """SQLite transcript store in WAL mode.
+
+    Appends are queued and written in batches by a background thread, so the
+    request path never waits on disk. Reads use a connection per thread and
+    wait only for the queued writes of the session they read.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._writes = queue.Queue()
+        # Queued, not yet committed appends per session
+        self._pending = {}
+        self._pending_changed = threading.Condition()
+        db = self._connect()
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                persona TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            ) WITHOUT ROWID;
+        """)
+        self._writer = threading.Thread(target=self._write_loop, name="conversation-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def append(self, session_id, persona, role, content):
+        with self._pending_changed:
+            self._pending[session_id] = self._pending.get(session_id, 0) + 1
+        self._writes.put((session_id, persona, role, content, time.time(), session_id))
+
+    def _write_loop(self):
+        db = self._connect()
+        while True:
+            item = self._writes.get()
+            batch = [item]
+            deadline = time.monotonic() + WRITE_BATCH_SECONDS
+            # Collect whatever else arrives shortly after, up to one batch
+            while item is not _STOP and len(batch) < WRITE_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._writes.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(item)
+            rows = [row for row in batch if row is not _STOP]
+            try:
+                if rows:
+                    self._write_rows(db, rows)
+            finally:
+                # Whatever happened to the batch, readers waiting on it must not wait forever
+                self._written(rows)
+                for _ in batch:
+                    self._writes.task_done()
+            if _STOP in batch:
+                db.close()
+                return
+
+    def _write_rows(self, db, rows):
+        """Commit `rows`, retrying a busy database; a batch that still fails is written row by row,
+        and rows that fail on their own are logged and dropped"""
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                self._insert(db, rows)
+                return
+            except sqlite3.OperationalError as e:
+                # Locked by another worker, or the disk is full
+                error = e
+                time.sleep(WRITE_RETRY_SECONDS * 2 ** attempt)
+            except sqlite3.Error as e:
+                error = e
+                break
+        if len(rows) == 1:
+            session_id, persona, role = rows[0][:3]
+            logger.error("Dropped a %s message of session %s (%s): %s", role, session_id, persona, error)
+            return
+        logger.warning("Writing %d messages failed, retrying one by one: %s", len(rows), error)
+        for row in rows:
+            try:
+                self._insert(db, [row])
+            except sqlite3.Error as e:
+                logger.error("Dropped a %s message of session %s (%s): %s", row[2], row[0], row[1], e)
+
+    @staticmethod
+    def _insert(db, rows):
+        with db:
+            # The write lock up front keeps seq numbering race-free across processes too
+            db.execute("BEGIN IMMEDIATE")
+            db.executemany(_INSERT, rows)
+
+    def _written(self, rows):
+        with self._pending_changed:
+            for row in rows:
+                left = self._pending[row[0]] - 1
+                if left:
+                    self._pending[row[0]] = left
+                else:
+                    del self._pending[row[0]]
+            self._pending_changed.notify_all()
+
+    def flush(self):
+        """Block until every queued write is on disk"""
+        self._writes.join()
+
+    def _flush_session(self, session_id):
+        """Block until the session's queued writes are on disk"""
+        with self._pending_changed:
+            self._pending_changed.wait_for(lambda: session_id not in self._pending)
+
+    def close(self):
+        self._writes.put(_STOP)
+        self._writer.join()
+
+    def count(self, session_id):
+        # Reads must see this session's appends still waiting in the write queue
+        self._flush_session(session_id)
+        row = self._connect().execute(
+            "SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0]
+
+    def load_range(self, session_id, start, stop):
+        self._flush_session(session_id)
+        rows = self._connect().execute(
+            "SELECT role, content FROM messages WHERE session_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+            (session_id, start, stop),
+        )
+        return [Message(role, content) for role, content in rows]
+
+    def iter_all(self):
+        # A dedicated connection: the cursor is consumed lazily, row by row
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            yield from db.execute(
+                "SELECT session_id, persona, seq, role, content, created_at FROM messages ORDER BY session_id, seq"
+            )
+        finally:
+            db.close()
+
+    def delete_session(self, session_id):
+        # Queued deletes would race the writer, so make pending appends land first
+        self.flush()
+        db = self._connect()
+        with db:
+            db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+
+
+class SharedConversationStore(ConversationStore):
+    """Transcripts in the shared state (see chat_core.shared_state), readable by every worker.
+
+    Each session is a list of JSON messages, so seq is the list position; a
+    set of session IDs backs `iter_all`. Appends go straight to the server:
+    a session may continue on another worker right after this request.
+    """
+
+    SESSIONS_KEY = "sessions"
+
+    def __init__(self, state):
+        self.state = state
+
+    @staticmethod
+    def _key(session_id):
+        return f"history:{session_id}"
+
+    def append(self, session_id, persona, role, content):
+        row = json.dumps({"p": persona, "r": role, "c": content, "t": time.time()}, ensure_ascii=False)
+        if self.state.rpush(self._key(session_id), row) == 1:
+            self.state.sadd(self.SESSIONS_KEY, session_id)
+
+    def count(self, session_id):
+        return self.state.llen(self._key(session_id))
+
+    def load_range(self, session_id, start, stop):
+        rows = (json.loads(row) for row in self.state.lrange(self._key(session_id), start, stop))
+        return [Message(row["r"], row["c"]) for row in rows]
+
+    def iter_all(self):
+        for session_id in sorted(self.state.smembers(self.SESSIONS_KEY)):
+            total = self.count(session_id)
+            for page_start in range(0, total, PAGE_SIZE):
+                rows = self.state.lrange(self._key(session_id), page_start, min(total, page_start + PAGE_SIZE))
+                for seq, row in enumerate(map(json.loads, rows), page_start):
+                    yield session_id, row["p"], seq, row["r"], row["c"], row["t"]
+
+    def delete_session(self, session_id):
+        self.state.delete(self._key(session_id))
+        self.state.srem(self.SESSIONS_KEY, session_id)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store():
+    """Return the process-wide transcript store, or None when CHAT_PERSISTENCE=none.
+
+    The default backend is "shared" when CHAT_STATE_URL is set, else "sqlite".
+    """
+    global _store
+    if _store is not None:
+        return _store
+    state = get_shared_state()
+    backend = os.getenv("CHAT_PERSISTENCE", "shared" if state is not None else "sqlite")
+    if backend == "none":
+        return None
+    with _store_lock:
+        if _store is None:
+            if backend == "sqlite":
+                _store = SQLiteConversationStore()
+            elif backend == "shared":
+                if state is None:
+                    raise ValueError("CHAT_PERSISTENCE=shared needs CHAT_STATE_URL")
+                _store = SharedConversationStore(state)
+            else:
+                raise ValueError(f"Unknown CHAT_PERSISTENCE backend: {backend}")
+    return _store
@@ -0,0 +1,141 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Persona:
+    """A chatbot personality: system prompt, generation defaults and UI texts"""
+    key: str
+    name: str
+    system_prompt: str
+    model: str = "gemini-2.0-flash"
+    temperature: float = 0.3
+    top_p: float = 0.95
+    top_k: int = 40
+    max_output_tokens: int = 1024
+    rate_limited_message: str = "Please wait about {retry_after:.0f} seconds and try again."
+    busy_message: str = "The assistant is busy. Please try again in a few minutes."
+    error_message: str = "I'm sorry, I couldn't generate a response. Please try again."
+    # Appended to an answer that was stopped or interrupted before it finished
+    stopped_marker: str = "\n\n_(answer stopped)_"
+    # Shown under an answer cut off by an upstream error after some of it was on screen
+    interrupted_message: str = "The answer was cut off by a connection problem. Please ask again."
+    # Served when upstream is failing and no cached answer fits the question
+    degraded_message: str = (
+        "The assistant is having trouble reaching its language model right now, so it can't give a full "
+        "answer. Please try again in a minute. For urgent health concerns, contact a doctor or call 115."
+    )
+    # Local answer to clearly off-topic questions; None sends them to the model as usual
+    off_topic_message: str = None
+    # Shown at once, before any model output, when the crisis detector fires
+    crisis_message: str = (
+        "If you or someone else is in danger right now, call 115 (emergency medical services) "
+        "or 113 (police), or go to the nearest hospital. You don't have to handle this alone."
+    )
+    # (topic, question) suggestions offered after an answer; topics are the categories of
+    # data/follow_up_terms.txt, and "" marks questions that fit any conversation
+    follow_ups: tuple = ()
+
+
+MEDIASSIST = Persona(
+    key="mediassist",
+    name="MediAssist",
+    system_prompt="""
+You are MediAssist, a helpful medical assistant chatbot designed to provide general medical information and guidance.
+Follow these principles:
+
+1. Provide accurate, evidence-based medical information from reliable sources.
+2. Always maintain a professional, empathetic tone in your responses.
+3. For any specific symptoms or health concerns, remind users to consult with a qualified healthcare professional.
+4. Never provide specific diagnoses, treatment plans, or prescriptions.
+5. Clarify when information is general and not tailored to individual circumstances.
+6. Be transparent about limitations of AI-based medical assistance.
+7. Focus on educational content about medical conditions, general wellness, and preventive care.
+8. When discussing medications, only provide general information about common uses and side effects.
+9. For emergency situations, always advise users to contact emergency services immediately.
+10. Respect medical privacy and maintain a respectful approach to all health topics.
+11. Response the answer with VietNamese language.
+""",
+    rate_limited_message="You're sending questions too quickly. Please wait about {retry_after:.0f} seconds and try again.",
+    busy_message="MediAssist is busy answering other users. Please try again in a few minutes.",
+    degraded_message=(
+        "MediAssist tạm thời không kết nối được tới mô hình nên chưa thể trả lời chi tiết. "
+        "Vui lòng thử lại sau ít phút. Nếu có vấn đề sức khỏe khẩn cấp, hãy liên hệ bác sĩ hoặc gọi 115."
+    ),
+    crisis_message=(
+        "**This may be an emergency.** Please call **115** (emergency medical services) now or go to "
+        "the nearest hospital. If someone may hurt themselves or others, also call **113** (police). "
+        "Do not wait for an online answer."
+    ),
+    follow_ups=(
+        ("fever", "When should I see a doctor about a fever?"),
+        ("fever", "How can I ease a cough or sore throat at home?"),
+        ("pain", "Which warning signs with this pain need urgent care?"),
+        ("pain", "Is it safe to take paracetamol for this?"),
+        ("sleep", "How many hours of sleep do I need?"),
+        ("diet", "What does a balanced daily diet look like?"),
+        ("stress", "How does stress affect physical health?"),
+        ("", "What symptoms mean I should see a doctor?"),
+        ("", "How can I prevent this from happening again?"),
+        ("", "Can you explain that more simply?"),
+    ),
+)
+
+LYLY = Persona(
+    key="lyly",
+    name="LyLy",
+    system_prompt="""
+You are LyLy, a friendly and empathetic school psychological counseling assistant developed by students from Thống Nhất Secondary and High School.
+
+Follow these principles:
+    1. Cung cấp thông tin và lời khuyên về tâm lý học đường một cách chính xác, dựa trên cơ sở khoa học và nguồn tài liệu đáng tin cậy.
+    2. Luôn giữ giọng điệu thân thiện, lắng nghe và đồng cảm trong mọi phản hồi.
+    3. Với các vấn đề tâm lý phức tạp hoặc khẩn cấp, hãy luôn nhắc nhở người dùng tìm đến chuyên gia tâm lý hoặc người lớn đáng tin cậy để được hỗ trợ trực tiếp.
+    4. Không chẩn đoán hay đưa ra kế hoạch trị liệu cá nhân hóa.
+    5. Luôn làm rõ rằng thông tin chỉ mang tính chất tham khảo chung, không thay thế cho tư vấn chuyên môn.
+    6. Minh bạch về giới hạn của một trợ lý AI trong lĩnh vực tâm lý học đường.
+    7. Tập trung vào việc giáo dục về sức khỏe tâm thần, kỹ năng sống, ứng phó cảm xúc, và xây dựng mối quan hệ tích cực.
+    8. Khi nói đến vấn đề liên quan đến cảm xúc, stress, hoặc áp lực học tập, chỉ cung cấp thông tin và hướng dẫn chung.
+    9. Trong trường hợp khẩn cấp (ví dụ: có dấu hiệu nguy cơ tự làm hại bản thân hoặc người khác), hãy luôn khuyên người dùng liên hệ ngay với thầy cô, cha mẹ, hoặc các dịch vụ hỗ trợ khẩn cấp.
+    10. Tôn trọng sự riêng tư và luôn thể hiện sự tôn trọng với tất cả vấn đề liên quan đến tâm lý học sinh.
+    11. Tất cả phản hồi đều bằng tiếng Việt.
+    12. Trong trường hợp người dùng hỏi các câu hỏi không có liên quan gì về y tế hãy từ chối trả lời theo hướng: tôi là một trợ lý được phát triển để trả lời các thông tin về y tế. Tôi không thể cung cấp bất kỳ thông tin nào liên quan tới các lĩnh vực khác ngoài chuyên môn.
+""",
+    rate_limited_message="Bạn gửi câu hỏi hơi nhanh, vui lòng đợi khoảng {retry_after:.0f} giây rồi thử lại nhé.",
+    busy_message="LyLy đang trả lời nhiều bạn cùng lúc, vui lòng thử lại sau ít phút nhé.",
+    error_message="Xin lỗi, mình không thể tạo phản hồi lúc này. Vui lòng thử lại sau nhé.",
+    # LyLy's messages are drawn as HTML, so no markdown here
+    stopped_marker=" … (đã dừng)",
+    interrupted_message="Câu trả lời bị gián đoạn do lỗi kết nối. Bạn hỏi lại giúp mình nhé.",
+    degraded_message=(
+        "LyLy đang gặp sự cố kết nối nên chưa trả lời chi tiết được, bạn thử lại sau ít phút nhé. "
+        "Trong lúc chờ, bạn có thể chia sẻ với thầy cô, bố mẹ hoặc một người lớn bạn tin tưởng. "
+        "Nếu cần hỗ trợ gấp, hãy gọi 111 (miễn phí, 24/7)."
+    ),
+    # Rule 12 of the system prompt, answered without a round trip
+    off_topic_message=(
+        "Mình là một trợ lý được phát triển để trả lời các thông tin về y tế và tâm lý học đường. "
+        "Mình không thể cung cấp thông tin liên quan tới các lĩnh vực khác ngoài chuyên môn."
+    ),
+    crisis_message=(
+        "Mình rất lo cho bạn. Nếu bạn đang nghĩ đến việc làm hại bản thân hoặc đang gặp nguy hiểm, "
+        "hãy gọi ngay 111 (Tổng đài quốc gia bảo vệ trẻ em, miễn phí, 24/7) hoặc 115 (cấp cứu), "
+        "và nói với thầy cô, bố mẹ hoặc một người lớn bạn tin tưởng ngay bây giờ. Bạn không phải một mình "
+        "đối mặt với chuyện này."
+    ),
+    follow_ups=(
+        ("exam", "Làm sao để lập kế hoạch ôn thi hợp lý?"),
+        ("exam", "Mình nên làm gì ngay trước giờ thi để bớt hồi hộp?"),
+        ("stress", "Có bài tập thở nào giúp bình tĩnh lại không?"),
+        ("stress", "Khi nào mình nên tìm tới thầy cô tư vấn?"),
+        ("sleep", "Làm sao để ngủ đủ giấc khi bài vở nhiều?"),
+        ("friends", "Mình nên nói gì khi muốn làm lành với bạn?"),
+        ("friends", "Nếu bị bắt nạt thì mình nên báo với ai?"),
+        ("family", "Làm sao để nói chuyện với bố mẹ mà không cãi nhau?"),
+        ("study", "Có mẹo nào giúp tập trung khi học không?"),
+        ("", "Bạn có thể giải thích rõ hơn được không?"),
+        ("", "Mình có thể bắt đầu từ việc nhỏ nào hôm nay?"),
+        ("", "Khi nào mình nên tìm tới thầy cô tư vấn?"),
+    ),
+)
+
+PERSONAS = {persona.key: persona for persona in (MEDIASSIST, LYLY)}
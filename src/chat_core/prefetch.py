@@ -0,0 +1,306 @@
+"""Suggested follow-up questions, with their answers generated before the click.
+
+After each answer the student is offered a few follow-up questions, picked
+locally from the persona's `follow_ups` by the topics found in the question
+and the answer (data/follow_up_terms.txt). The first CHAT_PREFETCH of them are
+asked straight away in the background, so clicking one streams an answer that
+is already there, or well under way. Prefetching has a strict budget: at most
+CHAT_PREFETCH_CONCURRENCY streams at once, and CHAT_PREFETCH_TOKENS_PER_MINUTE
+tokens per process, reserved up front (prompt plus the full output limit) and
+refunded once the real count is known. A prefetch that doesn't fit is skipped.
+Any other prompt from the session cancels its prefetches.
+
+`stats()` reports the hit rate (settled prefetches that were used) and the
+share of prefetched tokens that were thrown away; both are also exported as
+chat_prefetch_* metrics.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .context import CHARS_PER_TOKEN
+from .metrics import get_metrics
+from .safety import TermMatcher
+from .service import HEARTBEAT_SECONDS, GenerationCancelled
+
+DEFAULT_TERMS_PATH = os.getenv("CHAT_FOLLOW_UP_TERMS") or str(Path(__file__).parent / "data" / "follow_up_terms.txt")
+DEFAULT_SUGGESTIONS = int(os.getenv("CHAT_FOLLOW_UPS", "3"))
+DEFAULT_PER_ANSWER = int(os.getenv("CHAT_PREFETCH", "2"))
+DEFAULT_CONCURRENCY = int(os.getenv("CHAT_PREFETCH_CONCURRENCY", "2"))
+DEFAULT_TOKENS_PER_MINUTE = float(os.getenv("CHAT_PREFETCH_TOKENS_PER_MINUTE", "20000"))
+# A session's unclaimed prefetches are dropped after this long
+PREFETCH_TTL = 600.0
+
+
+class FollowUpSuggester:
+    """Picks follow-up questions from a persona's `follow_ups` by topic"""
+
+    def __init__(self, topics, limit=DEFAULT_SUGGESTIONS):
+        self.topics = topics
+        self.limit = limit
+
+    def suggest(self, persona, prompt, answer, asked=()):
+        """Up to `limit` questions: topics of the prompt first, then of the answer, then general ones"""
+        topics = []
+        for text in (prompt, answer):
+            match = self.topics.scan(text)
+            if match is not None:
+                topics.extend(category for category in match.categories if category not in topics)
+        topics.append("")
+        picked = []
+        for topic in topics:
+            for question_topic, question in persona.follow_ups:
+                if question_topic == topic and question not in asked and question not in picked:
+                    picked.append(question)
+        return picked[:self.limit]
+
+
+class _Abandoned(Exception):
+    """Raised from the heartbeat to stop a prefetch nobody wants any more"""
+
+
+class _TokenBudget:
+    """Tokens per minute, reserved before a prefetch starts; callers hold the prefetcher's lock"""
+
+    def __init__(self, per_minute, clock):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.clock = clock
+        self.updated_at = clock()
+
+    def reserve(self, tokens):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens < tokens:
+            return False
+        self.tokens -= tokens
+        return True
+
+    def refund(self, tokens):
+        self.tokens = min(self.capacity, self.tokens + tokens)
+
+
+class _Prefetch:
+    __slots__ = ("persona", "reserved", "prompt_tokens", "created_at", "chunks", "chars", "usage", "sent", "done",
+                 "error", "cancelled", "outcome", "settled", "future")
+
+    def __init__(self, persona, reserved, prompt_tokens, created_at):
+        self.persona = persona
+        self.reserved = reserved
+        self.prompt_tokens = prompt_tokens
+        self.created_at = created_at
+        self.chunks = []
+        self.chars = 0
+        self.usage = None
+        self.sent = False
+        self.done = False
+        self.error = None
+        self.cancelled = False
+        self.outcome = None
+        self.settled = False
+        self.future = None
+
+    def tokens(self):
+        """Tokens this prefetch cost: usage metadata when it arrived, else an estimate"""
+        if not self.sent:
+            return 0
+        prompt = getattr(self.usage, "prompt_token_count", None) or self.prompt_tokens
+        output = getattr(self.usage, "candidates_token_count", None) or self.chars // CHARS_PER_TOKEN
+        return prompt + output
+
+
+class Prefetcher:
+    """Runs speculative answers for suggested questions and hands them over when one is asked"""
+
+    def __init__(self, max_concurrency=DEFAULT_CONCURRENCY, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+                 per_answer=DEFAULT_PER_ANSWER, metrics=None, clock=time.monotonic):
+        self.per_answer = per_answer
+        self.metrics = metrics or get_metrics()
+        self.clock = clock
+        self._budget = _TokenBudget(tokens_per_minute, clock)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="prefetch")
+        self._sessions = {}
+        self._cond = threading.Condition()
+        self.counters = {"started": 0, "used": 0, "discarded": 0, "failed": 0, "skipped": 0,
+                         "tokens_used": 0, "tokens_wasted": 0}
+
+    def start(self, session_id, persona, question, open_stream, prompt_tokens, max_output_tokens):
+        """Answer `question` in the background; False when the token budget doesn't allow it.
+
+        `open_stream(heartbeat=...)` starts the upstream request and returns its chunk iterator.
+        """
+        now = self.clock()
+        with self._cond:
+            self._expire(now)
+            entries = self._sessions.setdefault(session_id, {})
+            if question in entries:
+                return True
+            reserved = prompt_tokens + max_output_tokens
+            if not self._budget.reserve(reserved):
+                self.counters["skipped"] += 1
+                self.metrics.inc("chat_prefetch_total", outcome="skipped", persona=persona.key)
+                return False
+            prefetch = entries[question] = _Prefetch(persona.key, reserved, prompt_tokens, now)
+            self.counters["started"] += 1
+        prefetch.future = self._pool.submit(self._run, prefetch, open_stream)
+        return True
+
+    def _run(self, prefetch, open_stream):
+        stream = None
+        try:
+            if prefetch.cancelled:
+                return
+            prefetch.sent = True
+            stream = open_stream(heartbeat=lambda: self._check(prefetch))
+            for chunk in stream:
+                with self._cond:
+                    prefetch.chunks.append(chunk)
+                    prefetch.chars += len(getattr(chunk, "text", None) or "")
+                    prefetch.usage = getattr(chunk, "usage_metadata", None) or prefetch.usage
+                    self._cond.notify_all()
+                if prefetch.cancelled:
+                    break
+        except (Exception, GenerationCancelled) as e:
+            if not prefetch.cancelled:
+                prefetch.error = e
+        finally:
+            if stream is not None:
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+            with self._cond:
+                prefetch.done = True
+                self._budget.refund(max(0, prefetch.reserved - prefetch.tokens()))
+                self._cond.notify_all()
+                self._settle(prefetch)
+
+    @staticmethod
+    def _check(prefetch):
+        if prefetch.cancelled:
+            raise _Abandoned()
+
+    def take(self, session_id, question, heartbeat=None):
+        """The prefetched answer to `question` as a chunk iterator, or None.
+
+        Either way the session's other prefetches are cancelled. An answer still
+        being generated is streamed as it arrives; `heartbeat` is called while
+        waiting, as in GenerationService.stream.
+        """
+        with self._cond:
+            entries = self._sessions.pop(session_id, None)
+            if not entries:
+                return None
+            prefetch = entries.pop(question, None)
+            for other in entries.values():
+                self._cancel(other)
+            if prefetch is None:
+                return None
+            if prefetch.error is not None:
+                self._cancel(prefetch)
+                return None
+            prefetch.outcome = "used"
+            self._settle(prefetch)
+        return self._replay(prefetch, heartbeat)
+
+    def discard(self, session_id):
+        """Cancel every prefetch for the session"""
+        with self._cond:
+            for prefetch in self._sessions.pop(session_id, {}).values():
+                self._cancel(prefetch)
+
+    def _replay(self, prefetch, heartbeat=None):
+        seen = 0
+        try:
+            while True:
+                with self._cond:
+                    if seen >= len(prefetch.chunks) and not prefetch.done:
+                        self._cond.wait(HEARTBEAT_SECONDS)
+                    chunks = prefetch.chunks[seen:]
+                    finished = prefetch.done and seen + len(chunks) == len(prefetch.chunks)
+                    error = prefetch.error
+                if not chunks and not finished and heartbeat is not None:
+                    heartbeat()
+                seen += len(chunks)
+                yield from chunks
+                if finished:
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            # Stopped by the reader: let the upstream request go too
+            prefetch.cancelled = True
+
+    def _cancel(self, prefetch):
+        prefetch.cancelled = True
+        prefetch.outcome = prefetch.outcome or "discarded"
+        if prefetch.future is not None and prefetch.future.cancel():
+            # Never started: nothing was sent, so the whole reservation comes back
+            prefetch.done = True
+            self._budget.refund(prefetch.reserved)
+        self._settle(prefetch)
+
+    def _settle(self, prefetch):
+        """Count a prefetch once its outcome is known and it has finished"""
+        if prefetch.settled or not prefetch.done or prefetch.outcome is None:
+            return
+        prefetch.settled = True
+        outcome = "failed" if prefetch.error is not None and prefetch.outcome != "used" else prefetch.outcome
+        tokens = prefetch.tokens()
+        spent = "used" if outcome == "used" else "wasted"
+        self.counters[outcome] += 1
+        self.counters[f"tokens_{spent}"] += tokens
+        self.metrics.inc("chat_prefetch_total", outcome=outcome, persona=prefetch.persona)
+        if tokens:
+            self.metrics.inc("chat_prefetch_tokens_total", tokens, outcome=spent, persona=prefetch.persona)
+
+    def _expire(self, now):
+        for session_id, entries in list(self._sessions.items()):
+            if all(now - p.created_at > PREFETCH_TTL for p in entries.values()):
+                for prefetch in entries.values():
+                    self._cancel(prefetch)
+                del self._sessions[session_id]
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self.counters)
+            stats["pending"] = sum(len(entries) for entries in self._sessions.values())
+        settled = stats["used"] + stats["discarded"] + stats["failed"]
+        spent = stats["tokens_used"] + stats["tokens_wasted"]
+        stats["hit_rate"] = round(stats["used"] / settled, 3) if settled else None
+        stats["wasted_token_ratio"] = round(stats["tokens_wasted"] / spent, 3) if spent else None
+        return stats
+
+
+_suggester = None
+_prefetcher = None
+_lock = threading.Lock()
+
+
+def get_follow_up_suggester():
+    """Return the process-wide suggester, or None when CHAT_FOLLOW_UPS=0"""
+    global _suggester
+    if DEFAULT_SUGGESTIONS <= 0:
+        return None
+    if _suggester is not None:
+        return _suggester
+    with _lock:
+        if _suggester is None:
+            _suggester = FollowUpSuggester(TermMatcher.from_file(DEFAULT_TERMS_PATH))
+    return _suggester
+
+
+def get_prefetcher():
+    """Return the process-wide prefetcher, or None when CHAT_PREFETCH=0"""
+    global _prefetcher
+    if DEFAULT_PER_ANSWER <= 0:
+        return None
+    if _prefetcher is not None:
+        return _prefetcher
+    with _lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher()
+    return _prefetcher
@@ -0,0 +1,34 @@
+import os
+import sys
+import time
+
+
+class RerunProfiler:
+    """Splits one script run into timed phases.
+
+    Call `mark(name)` at the end of each phase; `report()` prints the phase
+    timings on one line. Disabled profilers do nothing.
+    """
+
+    def __init__(self, enabled=None, label="rerun", out=sys.stdout):
+        self.enabled = os.getenv("CHAT_PROFILE") == "1" if enabled is None else enabled
+        self.label = label
+        self.out = out
+        self.phases = []
+        self.started_at = self._last = time.perf_counter()
+
+    def mark(self, name):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    def report(self):
+        if not self.enabled:
+            return None
+        total = time.perf_counter() - self.started_at
+        timings = {"total_ms": round(total * 1000, 2)}
+        timings.update((f"{name}_ms", round(seconds * 1000, 2)) for name, seconds in self.phases)
+        print(f"[{self.label}] " + " ".join(f"{k}={v}" for k, v in timings.items()), file=self.out, flush=True)
+        return timings
@@ -0,0 +1,226 @@
+"""Gemini context caching for the personas' system prompts.
+
+With CHAT_PROMPT_CACHE=1 each (persona, model) pair used by the process gets
+one cached-content resource holding its system prompt. Requests then
+reference it by name instead of resending the prompt, so its tokens are
+billed at the cached rate and skip prefill. Resources are created and kept
+alive by a background thread: a cache still in use is extended before its TTL
+runs out, an unused one is left to expire. Until a cache is ready, or when
+the model doesn't support caching, requests carry the prompt inline as
+before.
+
+Gemini refuses explicit caches below a minimum input size, which depends on
+the model (MIN_CACHE_TOKENS; CHAT_PROMPT_CACHE_MIN_TOKENS overrides it for
+every model). A system prompt estimated below it is never sent to
+`caches.create`: it is simply served inline, without retries or warnings.
+"""
+import logging
+import os
+import threading
+import time
+
+from google.genai import types
+
+from .client import get_client
+from .context import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = float(os.getenv("CHAT_PROMPT_CACHE_TTL", "3600"))
+DEFAULT_REFRESH_MARGIN = float(os.getenv("CHAT_PROMPT_CACHE_REFRESH", "300"))
+# After a failed create, wait this long before trying that (persona, model) again
+DEFAULT_RETRY_AFTER = float(os.getenv("CHAT_PROMPT_CACHE_RETRY", "600"))
+# Stop referencing a cache this close to its expiry, in case the refresh is late
+EXPIRY_SLACK = 30.0
+# Smallest input, in tokens, the API accepts for an explicit cache
+MIN_CACHE_TOKENS = {
+    "gemini-2.0-flash-lite": 4096,
+    "gemini-2.0-flash": 4096,
+    "gemini-2.5-flash": 1024,
+    "gemini-2.5-pro": 2048,
+}
+DEFAULT_MIN_TOKENS = 4096
+_MIN_TOKENS_OVERRIDE = os.getenv("CHAT_PROMPT_CACHE_MIN_TOKENS")
+
+
+def min_cache_tokens(model):
+    if _MIN_TOKENS_OVERRIDE:
+        return int(_MIN_TOKENS_OVERRIDE)
+    return MIN_CACHE_TOKENS.get(model, DEFAULT_MIN_TOKENS)
+
+
+class _Entry:
+    __slots__ = ("system_prompt", "cacheable", "name", "expires_at", "refreshed_at", "attempted_at", "retry_at",
+                 "last_used", "busy")
+
+    def __init__(self, system_prompt, cacheable=True):
+        self.system_prompt = system_prompt
+        self.cacheable = cacheable
+        self.name = None
+        self.expires_at = 0.0
+        self.refreshed_at = 0.0
+        self.attempted_at = -1.0
+        self.retry_at = 0.0
+        self.last_used = 0.0
+        self.busy = False
+
+
+class PromptCache:
+    """Maps (persona, model) to a live cached-content name, maintained in the background"""
+
+    def __init__(self, client, ttl=DEFAULT_TTL, refresh_margin=DEFAULT_REFRESH_MARGIN,
+                 retry_after=DEFAULT_RETRY_AFTER, min_tokens=min_cache_tokens, clock=time.monotonic):
+        self.client = client
+        self.min_tokens = min_tokens
+        self.ttl = ttl
+        self.refresh_margin = min(refresh_margin, ttl / 2)
+        self.retry_after = retry_after
+        self.clock = clock
+        self._entries = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self.counters = {"hits": 0, "misses": 0, "too_small": 0, "created": 0, "refreshed": 0, "failed": 0,
+                         "invalidated": 0}
+
+    def lookup(self, persona, model):
+        """The cache name to reference for this request, or None to send the prompt inline"""
+        key = (persona.key, model)
+        now = self.clock()
+        with self._cond:
+            entry = self._entries.get(key)
+            if entry is None or entry.system_prompt != persona.system_prompt:
+                cacheable = estimate_tokens(persona.system_prompt) >= self.min_tokens(model)
+                entry = self._entries[key] = _Entry(persona.system_prompt, cacheable)
+            if not entry.cacheable:
+                self.counters["too_small"] += 1
+                return None
+            entry.last_used = now
+            if entry.name is not None and entry.expires_at - now > EXPIRY_SLACK:
+                self.counters["hits"] += 1
+                return entry.name
+            self.counters["misses"] += 1
+            # A refresh in flight still owns the name: it extends or replaces it
+            if not entry.busy:
+                entry.name = None
+                if entry.retry_at <= now:
+                    self._wake()
+            return None
+
+    def invalidate(self, persona, model, name):
+        """Forget `name` after upstream rejected it; a new cache is created in the background"""
+        with self._cond:
+            entry = self._entries.get((persona.key, model))
+            if entry is None or entry.name != name:
+                return
+            entry.name = None
+            entry.retry_at = 0.0
+            self.counters["invalidated"] += 1
+            self._wake()
+
+    def _wake(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="prompt-cache", daemon=True)
+            self._thread.start()
+        self._cond.notify()
+
+    def _due(self, now):
+        """Work that is due now and the seconds until the next scheduled item"""
+        due = []
+        wait = None
+        for key, entry in self._entries.items():
+            if entry.busy:
+                continue
+            if entry.name is None:
+                # Only (re)create caches someone has asked for since the last attempt
+                at = entry.retry_at if entry.last_used > entry.attempted_at else None
+            else:
+                at = entry.expires_at - self.refresh_margin
+                if at <= now and entry.last_used <= entry.refreshed_at:
+                    continue  # unused since the last refresh: let it expire
+            if at is None:
+                continue
+            if at <= now:
+                entry.busy = True
+                due.append((key, entry))
+            else:
+                wait = at - now if wait is None else min(wait, at - now)
+        return due, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                due, wait = self._due(self.clock())
+                if not due:
+                    self._cond.wait(wait)
+                    continue
+            for key, entry in due:
+                try:
+                    if entry.name is None:
+                        self._create(key, entry)
+                    else:
+                        self._refresh(key, entry)
+                finally:
+                    with self._cond:
+                        entry.busy = False
+
+    def _create(self, key, entry):
+        persona_key, model = key
+        started_at = self.clock()
+        with self._cond:
+            entry.attempted_at = started_at
+        try:
+            cached = self.client.caches.create(model=model, config=types.CreateCachedContentConfig(
+                system_instruction=entry.system_prompt,
+                ttl=f"{int(self.ttl)}s",
+                display_name=f"{persona_key}-system-prompt",
+            ))
+        except Exception as e:
+            logger.warning("Context cache for %s on %s unavailable, sending the prompt inline: %s",
+                           persona_key, model, e)
+            with self._cond:
+                entry.retry_at = started_at + self.retry_after
+                self.counters["failed"] += 1
+            return
+        with self._cond:
+            entry.name = cached.name
+            entry.expires_at = started_at + self.ttl
+            entry.refreshed_at = started_at
+            self.counters["created"] += 1
+
+    def _refresh(self, key, entry):
+        started_at = self.clock()
+        try:
+            self.client.caches.update(name=entry.name, config=types.UpdateCachedContentConfig(ttl=f"{int(self.ttl)}s"))
+        except Exception as e:
+            logger.warning("Refreshing context cache %s failed, creating a new one: %s", entry.name, e)
+            with self._cond:
+                entry.name = None
+            self._create(key, entry)
+            return
+        with self._cond:
+            entry.expires_at = started_at + self.ttl
+            entry.refreshed_at = started_at
+            self.counters["refreshed"] += 1
+
+    def stats(self):
+        with self._cond:
+            now = self.clock()
+            live = sum(1 for e in self._entries.values() if e.name is not None and e.expires_at > now)
+            return dict(self.counters, live_caches=live)
+
+
+_prompt_cache = None
+_prompt_cache_lock = threading.Lock()
+
+
+def get_prompt_cache():
+    """Return the process-wide prompt cache, or None unless CHAT_PROMPT_CACHE=1"""
+    global _prompt_cache
+    if os.getenv("CHAT_PROMPT_CACHE", "0") != "1":
+        return None
+    if _prompt_cache is not None:
+        return _prompt_cache
+    with _prompt_cache_lock:
+        if _prompt_cache is None:
+            _prompt_cache = PromptCache(get_client())
+    return _prompt_cache
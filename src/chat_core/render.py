@@ -0,0 +1,81 @@
+import os
+import time
+
+DEFAULT_MAX_FPS = float(os.getenv("CHAT_RENDER_FPS", "8"))
+DEFAULT_FLUSH_CHARS = int(os.getenv("CHAT_RENDER_FLUSH_CHARS", "400"))
+
+
+class StreamRenderer:
+    """Buffers streamed chunks and redraws the placeholder at a bounded rate.
+
+    `render(text, done)` is called at most `max_fps` times per second, or
+    earlier once `flush_chars` new characters are pending, and once more with
+    `done=True` for the final text.
+    """
+
+    def __init__(self, render, max_fps=DEFAULT_MAX_FPS, flush_chars=DEFAULT_FLUSH_CHARS,
+                 started_at=None, clock=time.perf_counter):
+        self.render = render
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.flush_chars = flush_chars
+        self.clock = clock
+        # Pass the request start time so TTFT includes the upstream wait
+        self.started_at = started_at if started_at is not None else clock()
+        self.first_chunk_at = None
+        self.finished_at = None
+        self.last_flush_at = None
+        self.text = ""
+        self.chunks = 0
+        self.renders = 0
+        self.render_seconds = 0.0
+        self._pending = []
+        self._pending_chars = 0
+
+    def feed(self, chunk_text):
+        if not chunk_text:
+            return
+        now = self.clock()
+        if self.first_chunk_at is None:
+            self.first_chunk_at = now
+        self.chunks += 1
+        self._pending.append(chunk_text)
+        self._pending_chars += len(chunk_text)
+        # Show the first token straight away, then throttle
+        if (self.last_flush_at is None
+                or now - self.last_flush_at >= self.min_interval
+                or self._pending_chars >= self.flush_chars):
+            self._flush(False)
+
+    def partial(self):
+        """Everything received so far, including chunks not drawn yet"""
+        return self.text + "".join(self._pending)
+
+    def finish(self):
+        """Render the complete text once and return it"""
+        self._flush(True)
+        self.finished_at = self.clock()
+        return self.text
+
+    def _flush(self, done):
+        if self._pending:
+            self.text += "".join(self._pending)
+            self._pending.clear()
+            self._pending_chars = 0
+        start = self.clock()
+        self.render(self.text, done)
+        end = self.clock()
+        self.last_flush_at = end
+        self.renders += 1
+        self.render_seconds += end - start
+
+    def stats(self):
+        end = self.finished_at if self.finished_at is not None else self.clock()
+        ttft = self.first_chunk_at - self.started_at if self.first_chunk_at is not None else None
+        return {
+            "ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+            "total_ms": round((end - self.started_at) * 1000, 1),
+            "render_ms": round(self.render_seconds * 1000, 1),
+            "chunks": self.chunks,
+            "renders": self.renders,
+            "chars": len(self.text),
+        }
@@ -0,0 +1,209 @@
+"""Tail-latency policies applied by the generation service around each upstream stream.
+
+- first-chunk deadline: an attempt that has produced nothing after
+  `first_chunk_timeout` seconds is abandoned and counts as a retryable failure
+- hedging: if the first chunk is still missing after `hedge_after` seconds a
+  second identical request is started; whichever yields first is kept and the
+  other is cancelled
+- retries: retryable errors (429, 5xx, timeouts, dropped connections) are
+  retried with capped exponential backoff and full jitter, but only until the
+  first chunk has been handed to the caller
+- circuit breaker: after `breaker_failures` consecutive failed requests new
+  requests fail fast with UpstreamUnavailable for `breaker_cooldown` seconds,
+  then a single probe decides whether to close it again
+
+All of them can be exercised against the fake backend, see
+bench/resilience_bench.py.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+RETRYABLE_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class UpstreamUnavailable(Exception):
+    """Raised without calling upstream while the circuit breaker is open"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"upstream unavailable, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class FirstChunkTimeout(TimeoutError):
+    """No chunk arrived within the first-chunk deadline"""
+
+
+def is_retryable(error):
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_CODES
+    # httpx transport errors (connect, read, remote protocol) carry no status code
+    return type(error).__module__.startswith("httpx") and type(error).__name__.endswith(("Error", "Timeout"))
+
+
+@dataclass(frozen=True)
+class ResiliencePolicy:
+    first_chunk_timeout: float = 20.0  # 0 disables the deadline
+    hedge_after: float = 6.0  # 0 disables hedging
+    max_retries: int = 2
+    retry_base_delay: float = 0.5
+    retry_max_delay: float = 4.0
+    breaker_failures: int = 5  # 0 disables the breaker
+    breaker_cooldown: float = 30.0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            first_chunk_timeout=float(os.getenv("CHAT_FIRST_CHUNK_TIMEOUT", cls.first_chunk_timeout)),
+            hedge_after=float(os.getenv("CHAT_HEDGE_AFTER", cls.hedge_after)),
+            max_retries=int(os.getenv("CHAT_MAX_RETRIES", cls.max_retries)),
+            retry_base_delay=float(os.getenv("CHAT_RETRY_BASE_DELAY", cls.retry_base_delay)),
+            retry_max_delay=float(os.getenv("CHAT_RETRY_MAX_DELAY", cls.retry_max_delay)),
+            breaker_failures=int(os.getenv("CHAT_BREAKER_FAILURES", cls.breaker_failures)),
+            breaker_cooldown=float(os.getenv("CHAT_BREAKER_COOLDOWN", cls.breaker_cooldown)),
+        )
+
+    def backoff(self, attempt, rng=random):
+        """Full-jitter delay before retry number `attempt` (1-based)"""
+        return rng.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker shared by every request in the process.
+
+    closed: requests pass. open: requests are rejected until the cooldown
+    has passed. half_open: one probe request passes; its outcome closes or
+    re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold, cooldown, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probe_at = None
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        """Seconds until requests are let through again, 0 when they are now"""
+        with self._lock:
+            if self.state != "open":
+                return 0.0
+            return max(0.0, self.opened_at + self.cooldown - self.clock())
+
+    def allow(self):
+        """Whether a request may go upstream now; a half-open breaker lets one through"""
+        if not self.failure_threshold:
+            return True
+        with self._lock:
+            now = self.clock()
+            if self.state == "open" and now - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                self._probe_at = None
+            if self.state == "closed":
+                return True
+            # A probe that never reported back (cancelled by its caller) is replaced after a cooldown
+            if self.state == "half_open" and (self._probe_at is None or now - self._probe_at >= self.cooldown):
+                self._probe_at = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probe_at = None
+
+    def record_failure(self):
+        if not self.failure_threshold:
+            return
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.trips += 1
+                self.state = "open"
+                self.opened_at = self.clock()
+                self._probe_at = None
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures, "trips": self.trips}
+
+
+async def _first_chunk(open_stream):
+    """Start a stream and wait for its first chunk; returns (stream, chunk), chunk None if empty"""
+    stream = await open_stream()
+    try:
+        chunk = await stream.__anext__()
+    except StopAsyncIteration:
+        return stream, None
+    except BaseException:
+        await _close(stream)
+        raise
+    return stream, chunk
+
+
+async def _close(stream):
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except Exception:
+            pass
+
+
+async def first_chunk(open_stream, policy, record):
+    """Run one attempt, hedged if it is slow; returns (stream, first chunk) of the winner.
+
+    `record(event)` is called for "hedges", "hedge_wins" and "first_chunk_timeouts".
+    """
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    deadline = started_at + policy.first_chunk_timeout if policy.first_chunk_timeout else None
+    hedge_at = started_at + policy.hedge_after if policy.hedge_after else None
+    attempts = [loop.create_task(_first_chunk(open_stream))]
+    hedge = None
+    error = None
+    try:
+        while attempts:
+            wake_at = [t for t in (deadline, hedge_at) if t is not None]
+            timeout = max(0.0, min(wake_at) - loop.time()) if wake_at else None
+            done, _ = await asyncio.wait(attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                attempts.remove(task)
+                if task.exception() is None:
+                    if task is hedge:
+                        record("hedge_wins")
+                    return task.result()
+                error = task.exception()
+            now = loop.time()
+            if deadline is not None and now >= deadline:
+                record("first_chunk_timeouts")
+                raise FirstChunkTimeout(f"no chunk within {policy.first_chunk_timeout:.1f}s")
+            if hedge_at is not None and now >= hedge_at:
+                hedge_at = None
+                if attempts:
+                    # Still waiting on the original: race an identical second request against it
+                    record("hedges")
+                    hedge = loop.create_task(_first_chunk(open_stream))
+                    attempts.append(hedge)
+        raise error
+    finally:
+        for task in attempts:
+            task.cancel()
+        for task in attempts:
+            try:
+                stream, _ = await task
+            except BaseException:
+                continue
+            await _close(stream)
@@ -0,0 +1,157 @@
+"""Streamlit glue shared by the pages.
+
+`load_engine` is cached with st.cache_resource, so every session and rerun
+in a process reuses the same engine, client, queue and cache.
+"""
+import logging
+import os
+import time
+
+import streamlit as st
+
+from .engine import ChatEngine
+from .metrics import get_metrics
+from .personas import PERSONAS
+from .render import StreamRenderer
+from .service import GenerationCancelled, QueueFull, RateLimited
+from .persistence import get_conversation_store
+from .session import ChatSession, get_registry
+
+logger = logging.getLogger(__name__)
+
+# Process-wide counters (every session's totals, flagged sessions, RSS) are for operators only
+SHOW_DIAGNOSTICS = os.getenv("CHAT_DIAGNOSTICS") == "1"
+OLDER_PAGE_SIZE = 20
+MESSAGE_HTML_CACHE_SIZE = 512
+
+
+@st.cache_resource(show_spinner=False)
+def load_engine(persona_key):
+    return ChatEngine(PERSONAS[persona_key])
+
+
+def get_session(engine):
+    """This browser session's chat, created on first use"""
+    # Cheap check on every rerun; hibernates other sessions that went idle
+    get_registry().maybe_evict()
+    if "chat" not in st.session_state:
+        archive = get_conversation_store()
+        session_id = st.query_params.get("sid")
+        # A duplicated tab, or a reload while the old session is alive, shares the live session
+        chat = get_registry().get(session_id) if session_id else None
+        if chat is not None and chat.persona.key != engine.persona.key:
+            chat = None
+        if chat is None:
+            if archive is not None and session_id and archive.count(session_id):
+                chat = ChatSession.resume(engine.persona, session_id, archive)
+            else:
+                chat = ChatSession(engine.persona, archive=archive)
+        st.session_state.chat = chat
+        # Keep the ID in the URL so a reload or server restart resumes the conversation
+        st.query_params["sid"] = chat.session_id
+    return st.session_state.chat
+
+
+def older_messages(session, label):
+    """Earlier messages paged in on request, plus a button to load another page"""
+    shown = st.session_state.get("older_shown", 0)
+    if shown < session.store.spilled and st.button(label):
+        shown = st.session_state.older_shown = shown + OLDER_PAGE_SIZE
+    return session.older_messages(shown) if shown else []
+
+
+def message_html(message, format_message):
+    """`format_message(message)`, kept per browser session so redraws reuse it"""
+    html = st.session_state.setdefault("message_html", {}).get((message.role, message.content))
+    if html is None:
+        html = remember_message_html(message, format_message(message))
+    return html
+
+
+def remember_message_html(message, html):
+    """Keep `html` as the message's drawn form, e.g. the last frame of a streamed answer"""
+    cache = st.session_state.setdefault("message_html", {})
+    if len(cache) >= MESSAGE_HTML_CACHE_SIZE:
+        del cache[next(iter(cache))]
+    cache[(message.role, message.content)] = html
+    return html
+
+
+def follow_up_chips(questions):
+    """A button per suggested question; a click queues it as the next prompt and returns True"""
+    if not questions:
+        return False
+    for column, (index, question) in zip(st.columns(len(questions)), enumerate(questions)):
+        if column.button(question, key=f"follow_up_{index}", use_container_width=True):
+            st.session_state.pending_prompt = question
+            st.session_state.follow_ups = ()
+            return True
+    return False
+
+
+def stream_response(engine, session, prompt, model=None, temperature=None):
+    """Start a streamed answer, showing a notice instead when it can't be accepted"""
+    persona = engine.persona
+    # Blanking an invisible placeholder while upstream is quiet gives Streamlit a
+    # point to deliver a stop click, new prompt or closed tab, before the first chunk too
+    beat = st.empty()
+    try:
+        return engine.stream(session, prompt, model=model, temperature=temperature, heartbeat=beat.empty)
+    except RateLimited as e:
+        st.warning(persona.rate_limited_message.format(retry_after=e.retry_after))
+    except QueueFull:
+        st.warning(persona.busy_message)
+    except Exception as e:
+        st.error(f"Error generating response: {e}")
+    return None
+
+
+def render_stream(session, response_stream, render, started_at=None):
+    """Draw a response stream through `render(text, done)` and record the answer.
+
+    If the run is interrupted (stop button, newer prompt, closed tab) or the
+    stream fails midway, the upstream request is cancelled and the partial
+    answer is kept with the persona's stopped marker. A newer prompt or a
+    failure ends the answer there and returns the partial text; only
+    Streamlit's own stop and rerun exceptions are raised again.
+    """
+    # Chunks are buffered and redrawn a few times per second instead of once per chunk
+    renderer = StreamRenderer(render, started_at=started_at or time.perf_counter())
+    try:
+        for chunk in response_stream:
+            if hasattr(chunk, 'text') and chunk.text:
+                renderer.feed(chunk.text)
+    except GenerationCancelled:
+        # Superseded by a newer prompt for the same session, e.g. from a duplicated tab. This run
+        # goes on, and Streamlit only handles Exception, so end the answer here instead of raising
+        partial = _stopped(session, renderer, response_stream)
+        render(partial, True)
+        return partial
+    except Exception as e:
+        # Failed after text was on screen (earlier failures get the fallback answer); keep what arrived
+        logger.warning("Answer for session %s failed midway: %r", session.session_id, e)
+        partial = _stopped(session, renderer, response_stream)
+        render(partial, True)
+        st.warning(session.persona.interrupted_message)
+        return partial
+    except BaseException:
+        # No Streamlit calls here: the script may be stopping; the next run draws it from history
+        _stopped(session, renderer, response_stream)
+        raise
+
+    # Final response without cursor
+    full_response = renderer.finish()
+    st.session_state.render_stats = renderer.stats()
+    get_metrics().record_render(session.persona.key, st.session_state.render_stats)
+    session.add_assistant(full_response)
+    return full_response
+
+
+def _stopped(session, renderer, response_stream):
+    """Cancel the upstream request and record the partial answer with the stopped marker"""
+    close = getattr(response_stream, "close", None)
+    if close is not None:
+        close()
+    partial = (renderer.partial().rstrip() + session.persona.stopped_marker).strip()
+    session.add_assistant(partial)
+    return partial
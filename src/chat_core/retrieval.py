@@ -0,0 +1,267 @@
+"""Offline passage index for grounding answers in vetted documents.
+
+Documents are split into passages and embedded with a hashing vectorizer
+(word unigrams and bigrams, idf-weighted), so no model download is needed.
+Vectors are stored as a float16 or int8 .npy matrix that is memory-mapped on
+load, which makes opening an index instant whatever its size. Indexes are
+built with `python -m chat_core.ingest`.
+"""
+import json
+import mmap
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from .context import estimate_tokens
+
+DEFAULT_DIM = 4096
+DEFAULT_CHUNK_CHARS = 800
+SEARCH_BLOCK_ROWS = 16384
+DOCUMENT_SUFFIXES = (".txt", ".md")
+INDEX_VERSION = 1
+
+DEFAULT_INDEX_DIR = os.getenv("CHAT_RETRIEVAL_DIR")
+DEFAULT_TOP_K = int(os.getenv("CHAT_RETRIEVAL_TOP_K", "4"))
+DEFAULT_TOKEN_BUDGET = int(os.getenv("CHAT_RETRIEVAL_TOKENS", "800"))
+DEFAULT_MIN_SCORE = float(os.getenv("CHAT_RETRIEVAL_MIN_SCORE", "0.15"))
+
+_WORD = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+
+def _terms(text):
+    words = _WORD.findall(unicodedata.normalize("NFC", text).lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def _buckets(text, dim):
+    terms = _terms(text)
+    return np.fromiter((zlib.crc32(t.encode("utf-8")) % dim for t in terms), dtype=np.int64, count=len(terms))
+
+
+def _weigh(buckets, idf):
+    """Sublinear tf * idf, L2-normalised"""
+    vector = np.log1p(np.bincount(buckets, minlength=len(idf)).astype(np.float32)) * idf
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def split_passages(text, max_chars=DEFAULT_CHUNK_CHARS):
+    """Pack paragraphs into passages of at most `max_chars`, splitting long ones by sentence"""
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = " ".join(paragraph.split())
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in _SENTENCE_END.split(paragraph):
+            pieces.extend(sentence[i:i + max_chars] for i in range(0, len(sentence), max_chars))
+
+    passages = []
+    current = ""
+    for piece in filter(None, pieces):
+        if current and len(current) + 1 + len(piece) > max_chars:
+            passages.append(current)
+            current = piece
+        else:
+            current = f"{current}\n{piece}" if current else piece
+    if current:
+        passages.append(current)
+    return passages
+
+
+def build_index(docs_dir, index_dir, dim=DEFAULT_DIM, dtype="float16", chunk_chars=DEFAULT_CHUNK_CHARS):
+    """Chunk every .txt/.md file under `docs_dir` and write the index to `index_dir`"""
+    if dtype not in ("float16", "int8"):
+        raise ValueError(f"unsupported dtype {dtype!r}")
+    docs_dir, index_dir = Path(docs_dir), Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    sources = sorted(p for p in docs_dir.rglob("*") if p.suffix.lower() in DOCUMENT_SUFFIXES and p.is_file())
+
+    offsets = [0]
+    source_ids = []
+    buckets = []
+    with open(index_dir / "passages.bin", "wb") as blob:
+        for source_id, path in enumerate(sources):
+            for passage in split_passages(path.read_text(encoding="utf-8"), chunk_chars):
+                data = passage.encode("utf-8")
+                blob.write(data)
+                offsets.append(offsets[-1] + len(data))
+                source_ids.append(source_id)
+                buckets.append(_buckets(passage, dim))
+
+    count = len(buckets)
+    df = np.zeros(dim, dtype=np.float32)
+    for row in buckets:
+        df[np.unique(row)] += 1
+    idf = (np.log((1 + count) / (1 + df)) + 1).astype(np.float32)
+
+    vectors = np.lib.format.open_memmap(index_dir / "vectors.npy", mode="w+", dtype=dtype, shape=(count, dim))
+    scales = np.ones(count, dtype=np.float32)
+    for i, row in enumerate(buckets):
+        vector = _weigh(row, idf)
+        if dtype == "int8":
+            # Per-row scale keeps each passage's full int8 range
+            peak = float(np.abs(vector).max()) or 1.0
+            scales[i] = peak / 127
+            vector = np.rint(vector / scales[i])
+        vectors[i] = vector
+    vectors.flush()
+    del vectors
+
+    np.save(index_dir / "idf.npy", idf)
+    np.save(index_dir / "scales.npy", scales)
+    np.save(index_dir / "offsets.npy", np.asarray(offsets, dtype=np.int64))
+    np.save(index_dir / "source_ids.npy", np.asarray(source_ids, dtype=np.int32))
+    manifest = {
+        "version": INDEX_VERSION,
+        "dim": dim,
+        "dtype": dtype,
+        "count": count,
+        "chunk_chars": chunk_chars,
+        "sources": [str(p.relative_to(docs_dir)) for p in sources],
+        "built_at": time.time(),
+    }
+    (index_dir / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    return manifest
+
+
+class Passage:
+    __slots__ = ("text", "source", "score")
+
+    def __init__(self, text, source, score):
+        self.text = text
+        self.source = source
+        self.score = score
+
+    def __repr__(self):
+        return f"Passage({self.source!r}, {self.score:.3f}, {self.text[:40]!r})"
+
+
+class PassageIndex:
+    """Read-only view of an index built by `build_index`; nothing is loaded until searched"""
+
+    def __init__(self, index_dir):
+        index_dir = Path(index_dir)
+        self.manifest = json.loads((index_dir / "manifest.json").read_text(encoding="utf-8"))
+        if self.manifest["version"] != INDEX_VERSION:
+            raise ValueError(f"index at {index_dir} has version {self.manifest['version']}, expected {INDEX_VERSION}")
+        self.sources = self.manifest["sources"]
+        self.vectors = np.load(index_dir / "vectors.npy", mmap_mode="r")
+        self.scales = np.load(index_dir / "scales.npy", mmap_mode="r")
+        self.idf = np.load(index_dir / "idf.npy")
+        self.offsets = np.load(index_dir / "offsets.npy", mmap_mode="r")
+        self.source_ids = np.load(index_dir / "source_ids.npy", mmap_mode="r")
+        self._blob = None
+        if self.offsets[-1]:
+            with open(index_dir / "passages.bin", "rb") as f:
+                self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._quantized = self.vectors.dtype == np.int8
+
+    def __len__(self):
+        return self.manifest["count"]
+
+    def embed(self, text):
+        return _weigh(_buckets(text, self.manifest["dim"]), self.idf)
+
+    def scores(self, query_vector):
+        """Cosine score of every passage, computed in blocks to bound temporary memory"""
+        # A query touches only a few dozen buckets; the other columns add nothing
+        columns = np.flatnonzero(query_vector)
+        weights = query_vector[columns]
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SEARCH_BLOCK_ROWS):
+            block = self.vectors[start:start + SEARCH_BLOCK_ROWS, columns]
+            scores[start:start + len(block)] = block.astype(np.float32) @ weights
+        if self._quantized:
+            scores *= self.scales
+        return scores
+
+    def search(self, query, k=DEFAULT_TOP_K, min_score=0.0):
+        """Best `k` passages for `query`, highest score first"""
+        if not len(self):
+            return []
+        query_vector = self.embed(query)
+        if not query_vector.any():
+            return []
+        scores = self.scores(query_vector)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [self.passage(i, float(scores[i])) for i in top if scores[i] > min_score]
+
+    def passage(self, i, score=0.0):
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return Passage(self._blob[start:end].decode("utf-8"), self.sources[self.source_ids[i]], score)
+
+
+class Retriever:
+    """Picks the passages to ground one request, within a token budget"""
+
+    def __init__(self, index, k=DEFAULT_TOP_K, token_budget=DEFAULT_TOKEN_BUDGET,
+                 min_score=DEFAULT_MIN_SCORE, count_tokens=estimate_tokens):
+        self.index = index
+        self.k = k
+        self.token_budget = token_budget
+        self.min_score = min_score
+        self.count_tokens = count_tokens
+        self._lock = threading.Lock()
+        self.counters = {"queries": 0, "grounded": 0, "passages": 0, "search_ms": 0.0}
+
+    def retrieve(self, query):
+        started = time.perf_counter()
+        chosen = []
+        used = 0
+        for passage in self.index.search(query, self.k, self.min_score):
+            tokens = self.count_tokens(passage.text)
+            if used + tokens > self.token_budget:
+                continue
+            chosen.append(passage)
+            used += tokens
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.counters["queries"] += 1
+            self.counters["grounded"] += bool(chosen)
+            self.counters["passages"] += len(chosen)
+            self.counters["search_ms"] += elapsed
+        return chosen
+
+    def reference_text(self, query):
+        """Passages formatted for the prompt, or "" when nothing relevant was found"""
+        passages = self.retrieve(query)
+        if not passages:
+            return ""
+        body = "\n\n".join(f"[{i}] ({p.source})\n{p.text}" for i, p in enumerate(passages, 1))
+        return f"Reference material from vetted sources; use it where relevant:\n\n{body}"
+
+    def stats(self):
+        with self._lock:
+            queries = self.counters["queries"]
+            return {
+                "passages_indexed": len(self.index),
+                "queries": queries,
+                "grounded": self.counters["grounded"],
+                "passages_injected": self.counters["passages"],
+                "avg_search_ms": round(self.counters["search_ms"] / queries, 2) if queries else 0.0,
+            }
+
+
+_retrievers = {}
+_retrievers_lock = threading.Lock()
+
+
+def get_retriever(persona_key, index_dir=DEFAULT_INDEX_DIR):
+    """Retriever over `<CHAT_RETRIEVAL_DIR>/<persona_key>`, or None when there is no such index"""
+    if not index_dir:
+        return None
+    with _retrievers_lock:
+        if persona_key not in _retrievers:
+            path = Path(index_dir) / persona_key
+            _retrievers[persona_key] = Retriever(PassageIndex(path)) if (path / "manifest.json").exists() else None
+        return _retrievers[persona_key]
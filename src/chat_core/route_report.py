@@ -0,0 +1,58 @@
+"""Offline comparison of routes from a CHAT_ROUTING=shadow log.
+
+    cd src && python -m chat_core.route_report data/routing_shadow.jsonl
+
+For each route the router would have picked: request count, observed latency
+on the served route, and the estimated cost as served versus as routed.
+Shadowed refusals also count their distinct prompts, and list them when they
+were logged with CHAT_ROUTING_LOG_PROMPTS=1, to check for false positives
+before turning on CHAT_ROUTING_REFUSE.
+"""
+import argparse
+import json
+
+from .router import DEFAULT_LOG_PATH, estimate_cost
+
+
+def shadow_report(records):
+    """Per shadow route: requests, observed latency and cost, and cost had the route been served"""
+    report = {}
+    for record in records:
+        row = report.setdefault(record["shadow_route"], {
+            "requests": 0, "ttft_ms": 0.0, "total_ms": 0.0, "served_cost_usd": 0.0, "routed_cost_usd": 0.0,
+        })
+        row["requests"] += 1
+        row["ttft_ms"] += record["ttft_ms"]
+        row["total_ms"] += record["total_ms"]
+        if "prompt_hash" in record:
+            row.setdefault("prompt_hashes", set()).add(record["prompt_hash"])
+        if "prompt" in record:
+            row.setdefault("prompts", []).append(record["prompt"])
+        row["served_cost_usd"] += estimate_cost(record["served_model"], record["prompt_tokens"], record["output_tokens"])
+        if record["shadow_route"] != "refuse":
+            # Same tokens on the routed model, clipped to its output cap
+            cap = record["shadow_max_output_tokens"] or record["output_tokens"]
+            model = record["shadow_model"] or record["served_model"]
+            row["routed_cost_usd"] += estimate_cost(model, record["prompt_tokens"], min(record["output_tokens"], cap))
+    for row in report.values():
+        row["avg_ttft_ms"] = round(row.pop("ttft_ms") / row["requests"], 1)
+        row["avg_total_ms"] = round(row.pop("total_ms") / row["requests"], 1)
+        row["served_cost_usd"] = round(row["served_cost_usd"], 6)
+        row["routed_cost_usd"] = round(row["routed_cost_usd"], 6)
+        if "prompt_hashes" in row:
+            row["distinct_prompts"] = len(row.pop("prompt_hashes"))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare served and shadow routes from a shadow routing log")
+    parser.add_argument("log", nargs="?", default=DEFAULT_LOG_PATH)
+    args = parser.parse_args(argv)
+
+    with open(args.log, encoding="utf-8") as f:
+        records = (json.loads(line) for line in f if line.strip())
+        print(json.dumps(shadow_report(records), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
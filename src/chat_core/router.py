@@ -0,0 +1,242 @@
+"""Per-request model routing from cheap local features.
+
+Each prompt is sorted into a route before any upstream call:
+
+- ``refuse``: an explicit off-topic task for a persona with an
+  `off_topic_message` (LyLy's rule 12); answered locally, nothing is sent
+  upstream. Only with CHAT_ROUTING_REFUSE=on and no model picked explicitly;
+  by default refusals are shadowed: the question is answered as usual and the
+  refusal is logged with a hash of the prompt (the anonymized prompt itself
+  with CHAT_ROUTING_LOG_PROMPTS=1), so false positives can be reviewed
+- ``light``: short greetings and thanks; a smaller model and output cap
+- ``deep``: long messages, long conversations, recently flagged sessions or heavy
+  topics; a more capable model and a larger output cap
+- ``standard``: everything else; the persona's own model and settings
+
+With CHAT_ROUTING=shadow every request is served on the standard route and the
+route that would have been picked is appended to CHAT_ROUTING_LOG, together
+with the observed latency and token usage. `python -m chat_core.route_report`
+compares the routes offline from that file.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from .export import anonymize_text
+from .safety import TermMatcher, words
+
+DEFAULT_TOPIC_TERMS = os.getenv("CHAT_ROUTING_TERMS") or str(Path(__file__).parent / "data" / "topic_terms.txt")
+DEFAULT_MODE = os.getenv("CHAT_ROUTING", "on")
+DEFAULT_REFUSE_MODE = os.getenv("CHAT_ROUTING_REFUSE", "shadow")
+DEFAULT_LOG_PATH = os.getenv("CHAT_ROUTING_LOG") or os.path.join(os.getenv("CHAT_DATA_DIR", "data"), "routing_shadow.jsonl")
+# Student prompts stay out of the log unless asked for; a hash still counts repeats
+LOG_PROMPTS = os.getenv("CHAT_ROUTING_LOG_PROMPTS") == "1"
+
+LIGHT_MAX_WORDS = 8
+DEEP_MIN_WORDS = 120
+DEEP_HISTORY_TURNS = 6
+DEEP_HISTORY_MIN_WORDS = 25
+
+# USD per million (input, output) tokens, used for cost estimates only
+PRICES = {
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),
+}
+
+
+def estimate_cost(model, prompt_tokens, output_tokens):
+    price_in, price_out = PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * price_in + output_tokens * price_out) / 1e6
+
+
+@dataclass(frozen=True)
+class Route:
+    name: str
+    model: str = None  # None: the persona's model
+    max_output_tokens: int = None  # None: the persona's limit
+
+
+ROUTES = {
+    "refuse": Route("refuse"),
+    "light": Route("light", os.getenv("CHAT_ROUTE_LIGHT_MODEL", "gemini-2.0-flash-lite"), 256),
+    "standard": Route("standard"),
+    "deep": Route("deep", os.getenv("CHAT_ROUTE_DEEP_MODEL", "gemini-2.5-flash"), 2048),
+}
+
+
+@dataclass(frozen=True)
+class Decision:
+    route: Route
+    model: str
+    max_output_tokens: int
+    features: dict
+    shadow_route: Route = None  # shadow mode: the route that would have been served
+    prompt: str = None  # kept for shadowed refusals, to review them in the log
+
+
+class _RouteStats:
+    __slots__ = ("requests", "ttft", "total", "prompt_tokens", "output_tokens", "cost")
+
+    def __init__(self):
+        self.requests = 0
+        self.ttft = 0.0
+        self.total = 0.0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+
+    def as_dict(self):
+        n = self.requests or 1
+        return {
+            "requests": self.requests,
+            "avg_ttft_ms": round(self.ttft / n * 1000, 1),
+            "avg_total_ms": round(self.total / n * 1000, 1),
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+            "est_cost_usd": round(self.cost, 6),
+        }
+
+
+class ModelRouter:
+    """Chooses the route for each request and keeps per-route latency and cost"""
+
+    def __init__(self, topics, mode=DEFAULT_MODE, log_path=DEFAULT_LOG_PATH, refuse_mode=DEFAULT_REFUSE_MODE):
+        if mode not in ("on", "shadow"):
+            raise ValueError(f"unknown routing mode {mode!r}")
+        if refuse_mode not in ("on", "shadow"):
+            raise ValueError(f"unknown refusal mode {refuse_mode!r}")
+        self.topics = topics
+        self.mode = mode
+        self.refuse_mode = refuse_mode
+        self.log_path = log_path
+        self._stats = {name: _RouteStats() for name in ROUTES}
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+
+    def features(self, session, prompt):
+        match = self.topics.scan(prompt)
+        categories = match.categories if match is not None else []
+        return {
+            "words": len(words(prompt)),
+            "history_turns": len(session.context),
+            "topics": categories,
+            "flagged": session.recently_flagged(),
+        }
+
+    def classify(self, persona, features, refuse=True):
+        topics = features["topics"]
+        if (refuse and persona.off_topic_message and "off_topic" in topics and "on_topic" not in topics
+                and "complex" not in topics):
+            return ROUTES["refuse"]
+        if (features["flagged"] or "complex" in topics or features["words"] >= DEEP_MIN_WORDS
+                or (features["history_turns"] >= DEEP_HISTORY_TURNS and features["words"] >= DEEP_HISTORY_MIN_WORDS)):
+            return ROUTES["deep"]
+        if "greeting" in topics and "on_topic" not in topics and features["words"] <= LIGHT_MAX_WORDS:
+            return ROUTES["light"]
+        return ROUTES["standard"]
+
+    def route(self, persona, session, prompt, model=None):
+        """The decision for `prompt`; `model` is one the user picked, which is never refused"""
+        features = self.features(session, prompt)
+        route = self.classify(persona, features)
+        shadow_route = None
+        if self.mode == "shadow":
+            route, shadow_route = ROUTES["standard"], route
+        elif route.name == "refuse" and (self.refuse_mode == "shadow" or model is not None):
+            route, shadow_route = self.classify(persona, features, refuse=False), route
+        return Decision(
+            route=route,
+            model=route.model or persona.model,
+            max_output_tokens=route.max_output_tokens or persona.max_output_tokens,
+            features=features,
+            shadow_route=shadow_route,
+            prompt=prompt if shadow_route is not None and shadow_route.name == "refuse" else None,
+        )
+
+    def track(self, decision, persona_key, stream):
+        """Pass chunks through and add latency, tokens and cost to the route's stats"""
+        started_at = time.perf_counter()
+        first_chunk_at = None
+        usage = None
+        try:
+            for chunk in stream:
+                if first_chunk_at is None:
+                    first_chunk_at = time.perf_counter()
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                yield chunk
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+            ended_at = time.perf_counter()
+            prompt_tokens = getattr(usage, "prompt_token_count", None) or 0
+            output_tokens = getattr(usage, "candidates_token_count", None) or 0
+            ttft = (first_chunk_at or ended_at) - started_at
+            with self._lock:
+                stats = self._stats[decision.route.name]
+                stats.requests += 1
+                stats.ttft += ttft
+                stats.total += ended_at - started_at
+                stats.prompt_tokens += prompt_tokens
+                stats.output_tokens += output_tokens
+                stats.cost += estimate_cost(decision.model, prompt_tokens, output_tokens)
+            if decision.shadow_route is not None:
+                self._log_shadow(decision, persona_key, ttft, ended_at - started_at, prompt_tokens, output_tokens)
+
+    def count_refusal(self):
+        with self._lock:
+            self._stats["refuse"].requests += 1
+
+    def _log_shadow(self, decision, persona_key, ttft, total, prompt_tokens, output_tokens):
+        record = {
+            "at": time.time(),
+            "persona": persona_key,
+            "served_route": decision.route.name,
+            "served_model": decision.model,
+            "shadow_route": decision.shadow_route.name,
+            "shadow_model": decision.shadow_route.model,
+            "shadow_max_output_tokens": decision.shadow_route.max_output_tokens,
+            "features": decision.features,
+            "ttft_ms": round(ttft * 1000, 1),
+            "total_ms": round(total * 1000, 1),
+            "prompt_tokens": prompt_tokens,
+            "output_tokens": output_tokens,
+        }
+        if decision.prompt is not None:
+            record["prompt_hash"] = hashlib.sha256(decision.prompt.encode("utf-8")).hexdigest()[:16]
+            if LOG_PROMPTS:
+                record["prompt"] = anonymize_text(decision.prompt)
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        directory = os.path.dirname(self.log_path)
+        with self._log_lock:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def stats(self):
+        with self._lock:
+            return {"mode": self.mode, "refuse_mode": self.refuse_mode, **{name: stats.as_dict() for name, stats in self._stats.items()}}
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """Return the process-wide router, or None when CHAT_ROUTING=off"""
+    global _router
+    if DEFAULT_MODE == "off":
+        return None
+    if _router is not None:
+        return _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter(TermMatcher.from_file(DEFAULT_TOPIC_TERMS))
+    return _router
@@ -0,0 +1,145 @@
+"""Local crisis detection, run on every prompt before anything is sent upstream.
+
+Terms come from a plain-text list (data/crisis_terms.txt by default) and are
+compiled into an Aho-Corasick automaton over words, so one pass over the
+message finds every term regardless of how many there are. Text and terms are
+lower-cased and NFC-normalised; each term is also added without diacritics to
+catch unaccented typing. `TermMatcher` is generic and also drives the topic
+checks in `chat_core.router`.
+"""
+import os
+import re
+import threading
+import unicodedata
+from pathlib import Path
+
+DEFAULT_TERMS_PATH = os.getenv("CHAT_CRISIS_TERMS") or str(Path(__file__).parent / "data" / "crisis_terms.txt")
+
+_WORD = re.compile(r"\w+")
+
+
+def strip_diacritics(text):
+    decomposed = unicodedata.normalize("NFD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return stripped.replace("đ", "d").replace("Đ", "D")
+
+
+def words(text):
+    return _WORD.findall(unicodedata.normalize("NFC", text).lower())
+
+
+def load_terms(path=DEFAULT_TERMS_PATH):
+    """(category, term, fold) triples from a term list file"""
+    terms = []
+    category = "crisis"
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            category = line[1:-1].strip()
+            continue
+        exact = line.startswith("=")
+        terms.append((category, line.lstrip("=").strip(), not exact))
+    return terms
+
+
+class TermMatch:
+    __slots__ = ("categories", "terms")
+
+    def __init__(self, categories, terms):
+        self.categories = categories
+        self.terms = terms
+
+    def __repr__(self):
+        return f"TermMatch({self.categories!r}, {self.terms!r})"
+
+
+class TermMatcher:
+    """Aho-Corasick matcher over word sequences.
+
+    States are ints; `_goto[state]` maps a word to the next state and
+    `_fail[state]` is the longest proper suffix that is also a term prefix.
+    `_output[state]` lists the (category, term) pairs ending at that state,
+    already merged along failure links.
+    """
+
+    def __init__(self, terms):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+        for category, term, fold in terms:
+            self._add(words(term), (category, term))
+            if fold:
+                self._add(words(strip_diacritics(term)), (category, term))
+        self._link()
+        self.term_count = len(terms)
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(load_terms(path))
+
+    def _add(self, sequence, label):
+        if not sequence:
+            return
+        state = 0
+        for word in sequence:
+            next_state = self._goto[state].get(word)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+                self._goto[state][word] = next_state
+            state = next_state
+        if label not in self._output[state]:
+            self._output[state] += (label,)
+
+    def _link(self):
+        # Breadth-first, so a state's failure target is finished before its children
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for word, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and word not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(word, 0)
+                self._fail[child] = target if target != child else 0
+                self._output[child] += tuple(o for o in self._output[self._fail[child]] if o not in self._output[child])
+
+    def scan(self, text):
+        """TermMatch for every term found in `text`, or None"""
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        found = None
+        for word in words(text):
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            if output[state]:
+                if found is None:
+                    found = []
+                found.extend(output[state])
+        if not found:
+            return None
+        categories = sorted({category for category, _ in found})
+        terms = sorted({term for _, term in found})
+        return TermMatch(categories, terms)
+
+
+_detector = None
+_detector_lock = threading.Lock()
+
+
+def get_crisis_detector():
+    """Return the process-wide detector, or None when CHAT_CRISIS_DETECTION=0"""
+    global _detector
+    if os.getenv("CHAT_CRISIS_DETECTION", "1") == "0":
+        return None
+    if _detector is not None:
+        return _detector
+    with _detector_lock:
+        if _detector is None:
+            _detector = TermMatcher.from_file(DEFAULT_TERMS_PATH)
+    return _detector
@@ -0,0 +1,356 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+
+from .client import get_client
+from .context import CHARS_PER_TOKEN
+from .metrics import get_metrics
+from .resilience import CircuitBreaker, ResiliencePolicy, UpstreamUnavailable, first_chunk, is_retryable
+from .shared_state import get_shared_state
+
+_DONE = object()
+MAX_TRACKED_SESSIONS = 4096
+# How often a waiting consumer's heartbeat runs while no chunk arrives
+HEARTBEAT_SECONDS = 0.25
+
+
+class RateLimited(Exception):
+    """Raised when a session sends requests faster than its allowance"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"rate limited, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class QueueFull(Exception):
+    """Raised when too many requests are already waiting upstream"""
+
+
+class GenerationCancelled(BaseException):
+    """Raised to a consumer whose stream was cancelled by someone else, e.g. a newer prompt.
+
+    Like asyncio.CancelledError it derives from BaseException, so handlers
+    meant for upstream errors (fallback answers, error metrics) let it pass.
+    """
+
+
+class _TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated_at")
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def take(self):
+        """Take one token, or return the seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class _Job:
+    __slots__ = ("session_id", "request", "chunks", "submitted_at", "task", "cancelled", "cancel_reason",
+                 "output_chars")
+
+    def __init__(self, session_id, request):
+        self.session_id = session_id
+        self.request = request
+        self.chunks = queue.Queue()
+        self.submitted_at = time.monotonic()
+        self.task = None
+        self.cancelled = False
+        self.cancel_reason = None
+        self.output_chars = 0
+
+    def unused_output_tokens(self):
+        """Output tokens the request was still allowed to generate"""
+        limit = getattr(self.request["config"], "max_output_tokens", None) or 0
+        return max(0, limit - self.output_chars // CHARS_PER_TOKEN)
+
+
+class GenerationService:
+    """Runs Gemini streams on a background asyncio loop with backpressure.
+
+    At most `max_concurrency` streams run at once. Waiting requests are
+    dispatched round-robin across sessions so one busy session cannot starve
+    the others, and each session is held to a token-bucket rate limit.
+    A session has at most one stream in flight: a new request cancels the
+    previous one. Each upstream call runs under `policy` (see chat_core.resilience):
+    first-chunk deadline, hedging, retries and a shared circuit breaker.
+    With a shared `state` (see chat_core.shared_state) the rate limit holds
+    across every worker process.
+    """
+
+    def __init__(self, client, max_concurrency=8, max_queue=64, session_rate=0.1, session_burst=3, metrics=None,
+                 policy=None, state=None):
+        self.client = client
+        self.state = state
+        self.metrics = metrics or get_metrics()
+        self.policy = policy or ResiliencePolicy()
+        self.breaker = CircuitBreaker(self.policy.breaker_failures, self.policy.breaker_cooldown)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.session_rate = session_rate
+        self.session_burst = session_burst
+        self._buckets = {}
+        self._waiting = OrderedDict()
+        self._latest = {}
+        self._queued = 0
+        self._active = 0
+        self._wait_times = deque(maxlen=200)
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "superseded": 0,
+                          "rate_limited": 0, "rejected": 0,
+                          "unavailable": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "first_chunk_timeouts": 0}
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._wakeup = None
+        thread = threading.Thread(target=self._run_loop, name="generation-service", daemon=True)
+        thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._wakeup = asyncio.Event()
+        self._loop.create_task(self._dispatch())
+        self._loop.run_forever()
+
+    def stream(self, session_id, model, config, contents, heartbeat=None):
+        """Queue a request and return a blocking iterator over its chunks.
+
+        While no chunk arrives, `heartbeat()` is called every HEARTBEAT_SECONDS;
+        whatever it raises abandons the stream. Raises UpstreamUnavailable
+        straight away while the circuit breaker is open.
+        """
+        retry_after = self.breaker.retry_after()
+        if retry_after:
+            self._record("unavailable")
+            raise UpstreamUnavailable(retry_after)
+        if self.state is not None:
+            # Shared by every worker, so reloading onto another process doesn't reset the limit
+            retry_after = self.state.take_token(f"rate:{session_id}", self.session_rate, self.session_burst)
+        with self._lock:
+            if self.state is None:
+                if len(self._buckets) > MAX_TRACKED_SESSIONS:
+                    self._prune_buckets()
+                bucket = self._buckets.get(session_id)
+                if bucket is None:
+                    bucket = self._buckets[session_id] = _TokenBucket(self.session_rate, self.session_burst)
+                retry_after = bucket.take()
+            if retry_after:
+                self._counters["rate_limited"] += 1
+                raise RateLimited(retry_after)
+            if self._queued >= self.max_queue:
+                self._counters["rejected"] += 1
+                raise QueueFull(f"{self._queued} requests already waiting")
+            job = _Job(session_id, {"model": model, "config": config, "contents": contents})
+            self._waiting.setdefault(session_id, deque()).append(job)
+            self._queued += 1
+            self._counters["submitted"] += 1
+            previous = self._latest.get(session_id)
+            self._latest[session_id] = job
+        if previous is not None:
+            # Nobody reads an answer to a prompt the user has moved on from
+            self.cancel(previous, reason="superseded")
+        self._loop.call_soon_threadsafe(self._notify)
+        return self._consume(job, heartbeat)
+
+    def _prune_buckets(self):
+        # A bucket idle long enough to refill completely carries no state
+        refill_seconds = self.session_burst / self.session_rate
+        now = time.monotonic()
+        for session_id, bucket in list(self._buckets.items()):
+            if now - bucket.updated_at > refill_seconds:
+                del self._buckets[session_id]
+
+    def _consume(self, job, heartbeat=None):
+        timeout = HEARTBEAT_SECONDS if heartbeat is not None else None
+        try:
+            while True:
+                try:
+                    item = job.chunks.get(timeout=timeout)
+                except queue.Empty:
+                    heartbeat()
+                    continue
+                if item is _DONE:
+                    if job.cancelled:
+                        raise GenerationCancelled(job.cancel_reason)
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # Consumer stopped early: abort the upstream stream as well
+            self.cancel(job)
+
+    def cancel(self, job, reason="closed"):
+        """Stop a job, whether still queued or streaming; its HTTP stream is closed"""
+        with self._lock:
+            if self._latest.get(job.session_id) is job:
+                del self._latest[job.session_id]
+            if job.cancelled:
+                return
+            job.cancelled = True
+            job.cancel_reason = reason
+            waiting = self._waiting.get(job.session_id)
+            if waiting and job in waiting:
+                waiting.remove(job)
+                self._queued -= 1
+                if not waiting:
+                    del self._waiting[job.session_id]
+                self._counters["cancelled"] += 1
+                self._counters["superseded"] += reason == "superseded"
+                job.chunks.put(_DONE)
+                queued = True
+            else:
+                queued = False
+        if queued:
+            self._record_cancel(job)
+        elif job.task is not None:
+            self._loop.call_soon_threadsafe(job.task.cancel)
+
+    def _record_cancel(self, job):
+        self.metrics.inc("chat_cancelled_streams_total", reason=job.cancel_reason, model=job.request["model"])
+        self.metrics.inc("chat_cancelled_output_tokens_total", job.unused_output_tokens(), model=job.request["model"])
+
+    def _notify(self):
+        self._wakeup.set()
+
+    def _next_job(self):
+        with self._lock:
+            if self._active >= self.max_concurrency or not self._waiting:
+                return None
+            session_id, jobs = next(iter(self._waiting.items()))
+            job = jobs.popleft()
+            del self._waiting[session_id]
+            if jobs:
+                # Back of the line for this session's next request
+                self._waiting[session_id] = jobs
+            self._queued -= 1
+            self._active += 1
+            wait = time.monotonic() - job.submitted_at
+            self._wait_times.append(wait)
+        self.metrics.observe("chat_queue_wait_seconds", wait, model=job.request["model"])
+        return job
+
+    async def _dispatch(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while (job := self._next_job()) is not None:
+                job.task = self._loop.create_task(self._run(job))
+
+    async def _run(self, job):
+        outcome = "completed"
+        try:
+            if job.cancelled:
+                raise asyncio.CancelledError
+            if not self.breaker.allow():
+                # Opened while this job was queued
+                outcome = "unavailable"
+                self.metrics.inc("chat_upstream_events_total", event=outcome)
+                job.chunks.put(UpstreamUnavailable(self.breaker.retry_after()))
+                return
+            await self._generate(job)
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            self._record_cancel(job)
+        except Exception as e:
+            outcome = "failed"
+            job.chunks.put(e)
+        finally:
+            job.chunks.put(_DONE)
+            with self._lock:
+                self._active -= 1
+                self._counters[outcome] += 1
+                self._counters["superseded"] += job.cancel_reason == "superseded"
+                if self._latest.get(job.session_id) is job:
+                    del self._latest[job.session_id]
+            self._wakeup.set()
+
+    async def _generate(self, job):
+        """Stream one job's chunks into its queue under the resilience policy"""
+        policy = self.policy
+
+        def open_stream():
+            return self.client.aio.models.generate_content_stream(**job.request)
+
+        attempt = 0
+        while True:
+            try:
+                stream, chunk = await first_chunk(open_stream, policy, self._record)
+                break
+            except Exception as e:
+                # Nothing has reached the caller yet, so another attempt is invisible to them
+                if not is_retryable(e):
+                    # Upstream answered, it just refused this request
+                    self.breaker.record_success()
+                    raise
+                if attempt >= policy.max_retries:
+                    self.breaker.record_failure()
+                    raise
+                attempt += 1
+                self._record("retries")
+                await asyncio.sleep(policy.backoff(attempt))
+        self.breaker.record_success()
+        try:
+            if chunk is None:
+                return
+            job.output_chars += len(getattr(chunk, "text", None) or "")
+            job.chunks.put(chunk)
+            async for chunk in stream:
+                job.output_chars += len(getattr(chunk, "text", None) or "")
+                job.chunks.put(chunk)
+        finally:
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    def _record(self, event):
+        with self._lock:
+            self._counters[event] += 1
+        self.metrics.inc("chat_upstream_events_total", event=event)
+
+    def stats(self):
+        with self._lock:
+            waits = list(self._wait_times)
+            return dict(
+                self._counters,
+                breaker=self.breaker.stats(),
+                queue_depth=self._queued,
+                active_streams=self._active,
+                max_concurrency=self.max_concurrency,
+                avg_wait_ms=round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+                max_wait_ms=round(max(waits) * 1000, 1) if waits else 0.0,
+            )
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_generation_service():
+    """Return the process-wide generation service, configured from the environment"""
+    global _service
+    if _service is not None:
+        return _service
+    with _service_lock:
+        if _service is None:
+            _service = GenerationService(
+                get_client(),
+                max_concurrency=int(os.getenv("CHAT_MAX_CONCURRENCY", "8")),
+                max_queue=int(os.getenv("CHAT_MAX_QUEUE", "64")),
+                # Requests per minute per session, with a small burst allowance
+                session_rate=float(os.getenv("CHAT_SESSION_RATE", "6")) / 60,
+                session_burst=int(os.getenv("CHAT_SESSION_BURST", "3")),
+                policy=ResiliencePolicy.from_env(),
+                state=get_shared_state(),
+            )
+    return _service
@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+import uuid
+import weakref
+
+from .context import SUMMARIZE, ConversationContext, brief_summary
+from .persistence import RESUME_MESSAGES
+from .store import DEFAULT_MAX_MESSAGES, MessageStore
+
+DEFAULT_IDLE_SECONDS = float(os.getenv("CHAT_SESSION_IDLE_SECONDS", "1800"))
+# A crisis flag affects routing and suggestions for this many questions, the flagged one included
+FLAG_TURNS = int(os.getenv("CHAT_CRISIS_FLAG_TURNS", "3"))
+EVICT_CHECK_INTERVAL = 60.0
+
+
+class ChatSession:
+    """One user's conversation: visible transcript plus the model context.
+
+    The persona (and its system prompt) is shared by reference, never copied
+    into the session. Idle sessions can be hibernated: the transcript moves
+    to disk and the context is dropped until the next access. With an
+    `archive` every message is also persisted, and the session can later be
+    resumed by ID.
+    """
+
+    def __init__(self, persona, session_id=None, context=None, max_messages=DEFAULT_MAX_MESSAGES, archive=None):
+        self.persona = persona
+        self.session_id = session_id or uuid.uuid4().hex
+        self.archive = archive
+        self.store = MessageStore(self.session_id, max_messages=max_messages, archive=archive)
+        self.context = context or ConversationContext(summarizer=brief_summary if SUMMARIZE else None)
+        self.last_active = time.monotonic()
+        self.hibernated = False
+        # Crisis categories seen in this session, with counts, and the transcript length at the last one
+        self.flags = {}
+        self.flagged_at = None
+        _registry.add(self)
+        # Spilled transcript files go away with the session
+        weakref.finalize(self, MessageStore.clear, self.store)
+
+    @classmethod
+    def resume(cls, persona, session_id, archive, recent=RESUME_MESSAGES, **kwargs):
+        """Reopen a persisted session, loading only its last `recent` messages"""
+        session = cls(persona, session_id=session_id, archive=archive, **kwargs)
+        total = archive.count(session_id)
+        start = max(0, total - recent)
+        session.store.load(archive.load_range(session_id, start, total), spilled=start)
+        session._rebuild_context()
+        return session
+
+    def __len__(self):
+        return self.store.total
+
+    @property
+    def messages(self):
+        self._touch()
+        return self.store
+
+    def add_user(self, text):
+        self._append("user", text)
+        self.context.add_user(text)
+
+    def add_assistant(self, text):
+        self._append("assistant", text)
+        self.context.add_model(text)
+
+    def _append(self, role, text):
+        self._touch()
+        if self.archive is not None:
+            self.archive.append(self.session_id, self.persona.key, role, text)
+        self.store.append(role, text)
+
+    def flag(self, categories):
+        for category in categories:
+            self.flags[category] = self.flags.get(category, 0) + 1
+        self.flagged_at = self.store.total
+
+    def recently_flagged(self, turns=FLAG_TURNS):
+        """Whether a crisis term was seen within the last `turns` questions"""
+        return self.flagged_at is not None and self.store.total - self.flagged_at < 2 * turns
+
+    def older_messages(self, limit):
+        """Up to `limit` messages preceding the in-memory transcript, oldest first"""
+        return self.store.older_tail(limit)
+
+    def clear(self):
+        self._touch()
+        self.store.clear()
+        self.context.clear()
+        self.flagged_at = None
+        if self.archive is not None:
+            self.archive.delete_session(self.session_id)
+
+    def hibernate(self):
+        if self.hibernated:
+            return
+        self.store.spill_all()
+        self.context.clear()
+        self.hibernated = True
+
+    def _touch(self):
+        self.last_active = time.monotonic()
+        if self.hibernated:
+            self.hibernated = False
+            self.store.restore(self.store.max_messages)
+            self._rebuild_context()
+
+    def _rebuild_context(self):
+        # Replay the in-memory tail; the context's token budget trims it
+        for message in self.store:
+            if message.role == "user":
+                self.context.add_user(message.content)
+            else:
+                self.context.add_model(message.content)
+
+
+class SessionRegistry:
+    """Weak registry of live sessions in this process, for eviction and reporting"""
+
+    def __init__(self):
+        self._sessions = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self._last_check = time.monotonic()
+        self.evicted = 0
+
+    def add(self, session):
+        with self._lock:
+            self._sessions[session.session_id] = session
+
+    def get(self, session_id):
+        return self._sessions.get(session_id)
+
+    def sessions(self):
+        with self._lock:
+            return list(self._sessions.values())
+
+    def evict_idle(self, max_idle=DEFAULT_IDLE_SECONDS):
+        """Hibernate sessions idle for longer than `max_idle` seconds"""
+        now = time.monotonic()
+        evicted = 0
+        for session in self.sessions():
+            if not session.hibernated and now - session.last_active > max_idle:
+                session.hibernate()
+                evicted += 1
+        self.evicted += evicted
+        return evicted
+
+    def maybe_evict(self, max_idle=DEFAULT_IDLE_SECONDS):
+        """Run `evict_idle` at most once per EVICT_CHECK_INTERVAL"""
+        now = time.monotonic()
+        if now - self._last_check < EVICT_CHECK_INTERVAL:
+            return 0
+        self._last_check = now
+        return self.evict_idle(max_idle)
+
+    def memory_report(self):
+        sessions = self.sessions()
+        hibernated = sum(1 for s in sessions if s.hibernated)
+        return {
+            "sessions": len(sessions),
+            "hibernated": hibernated,
+            "flagged": sum(1 for s in sessions if s.flags),
+            "evicted_total": self.evicted,
+            "messages_in_memory": sum(len(s.store) for s in sessions),
+            "messages_spilled": sum(s.store.spilled for s in sessions),
+            "transcript_bytes": sum(s.store.memory_bytes() for s in sessions),
+            "context_tokens": sum(s.context.total_tokens for s in sessions),
+            "process_rss_kb": process_rss_kb(),
+        }
+
+
+def process_rss_kb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+_registry = SessionRegistry()
+
+
+def get_registry():
+    return _registry
@@ -0,0 +1,232 @@
+"""State shared by every worker process: transcripts, cached answers and rate limits.
+
+Set CHAT_STATE_URL to run several Streamlit workers behind a load balancer
+without sticky sessions:
+
+- ``redis://host:6379/0`` (or ``rediss://``, ``unix://``): a Redis server or
+  anything speaking its protocol; needs the `redis` package
+- ``local://``: an in-process stand-in with the same behaviour, for tests and
+  single-process runs
+
+Unset, each process keeps its own state as before. Keys are namespaced with
+CHAT_STATE_PREFIX so several deployments can share one server.
+"""
+import os
+import threading
+import time
+
+DEFAULT_URL = os.getenv("CHAT_STATE_URL")
+DEFAULT_PREFIX = os.getenv("CHAT_STATE_PREFIX", "chat:")
+
+# Token bucket kept in a hash; the server's clock is used so workers with skewed clocks agree
+_TAKE_TOKEN = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class SharedState:
+    """Interface for the shared backend: strings with TTL, lists, sets and token buckets.
+
+    List ranges are Python-style: `stop` is exclusive.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def rpush(self, key, *values):
+        """Append to a list and return its new length"""
+        raise NotImplementedError
+
+    def lrange(self, key, start, stop):
+        raise NotImplementedError
+
+    def llen(self, key):
+        raise NotImplementedError
+
+    def sadd(self, key, *members):
+        raise NotImplementedError
+
+    def srem(self, key, *members):
+        raise NotImplementedError
+
+    def smembers(self, key):
+        raise NotImplementedError
+
+    def delete(self, *keys):
+        raise NotImplementedError
+
+    def take_token(self, key, rate, burst):
+        """Take one token from a shared bucket; 0.0 if granted, else seconds until one is available"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class LocalSharedState(SharedState):
+    """In-process stand-in for Redis, for tests and single-process runs"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._strings = {}
+        self._lists = {}
+        self._sets = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._strings.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= self.clock():
+                del self._strings[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._strings[key] = (value, self.clock() + ttl if ttl else None)
+
+    def rpush(self, key, *values):
+        with self._lock:
+            items = self._lists.setdefault(key, [])
+            items.extend(values)
+            return len(items)
+
+    def lrange(self, key, start, stop):
+        with self._lock:
+            return list(self._lists.get(key, ())[start:stop])
+
+    def llen(self, key):
+        with self._lock:
+            return len(self._lists.get(key, ()))
+
+    def sadd(self, key, *members):
+        with self._lock:
+            self._sets.setdefault(key, set()).update(members)
+
+    def srem(self, key, *members):
+        with self._lock:
+            self._sets.get(key, set()).difference_update(members)
+
+    def smembers(self, key):
+        with self._lock:
+            return set(self._sets.get(key, ()))
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                for store in (self._strings, self._lists, self._sets, self._buckets):
+                    store.pop(key, None)
+
+    def take_token(self, key, rate, burst):
+        with self._lock:
+            now = self.clock()
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            return wait
+
+
+class RedisSharedState(SharedState):
+    """Shared state on a Redis server (or anything speaking the Redis protocol)"""
+
+    def __init__(self, url, prefix=DEFAULT_PREFIX):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CHAT_STATE_URL points at Redis, which needs the `redis` package") from None
+        self.prefix = prefix
+        # One pooled client per process, shared by every session thread
+        self._redis = redis.Redis.from_url(url, decode_responses=True, health_check_interval=30)
+        self._take_token = self._redis.register_script(_TAKE_TOKEN)
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def get(self, key):
+        return self._redis.get(self._key(key))
+
+    def set(self, key, value, ttl=None):
+        self._redis.set(self._key(key), value, px=int(ttl * 1000) if ttl else None)
+
+    def rpush(self, key, *values):
+        return self._redis.rpush(self._key(key), *values)
+
+    def lrange(self, key, start, stop):
+        if stop is not None and stop <= start:
+            return []
+        return self._redis.lrange(self._key(key), start, -1 if stop is None else stop - 1)
+
+    def llen(self, key):
+        return self._redis.llen(self._key(key))
+
+    def sadd(self, key, *members):
+        self._redis.sadd(self._key(key), *members)
+
+    def srem(self, key, *members):
+        self._redis.srem(self._key(key), *members)
+
+    def smembers(self, key):
+        return self._redis.smembers(self._key(key))
+
+    def delete(self, *keys):
+        if keys:
+            self._redis.delete(*(self._key(key) for key in keys))
+
+    def take_token(self, key, rate, burst):
+        return float(self._take_token(keys=[self._key(key)], args=[rate, burst]))
+
+    def close(self):
+        self._redis.close()
+
+
+def open_shared_state(url):
+    if url.startswith("local://"):
+        return LocalSharedState()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSharedState(url)
+    raise ValueError(f"unsupported CHAT_STATE_URL {url!r}")
+
+
+_state = None
+_state_lock = threading.Lock()
+
+
+def get_shared_state():
+    """Return the process-wide shared state, or None when CHAT_STATE_URL is unset"""
+    global _state
+    if not DEFAULT_URL:
+        return None
+    if _state is not None:
+        return _state
+    with _state_lock:
+        if _state is None:
+            _state = open_shared_state(DEFAULT_URL)
+    return _state
@@ -0,0 +1,156 @@
+import json
+import os
+import sys
+import tempfile
+from collections import deque
+
+DEFAULT_MAX_MESSAGES = int(os.getenv("CHAT_SESSION_MAX_MESSAGES", "200"))
+DEFAULT_SPILL_DIR = os.getenv("CHAT_SPILL_DIR") or os.path.join(tempfile.gettempdir(), "chat_core_spill")
+
+
+class Message:
+    """One transcript entry; slots keep per-message overhead to two pointers"""
+    __slots__ = ("role", "content")
+
+    def __init__(self, role, content):
+        self.role = role
+        self.content = content
+
+    def __repr__(self):
+        return f"Message({self.role!r}, {self.content[:40]!r})"
+
+
+_MESSAGE_SIZE = sys.getsizeof(Message("", ""))
+
+
+def _size(message):
+    return _MESSAGE_SIZE + sys.getsizeof(message.content)
+
+
+class MessageStore:
+    """Bounded transcript for one session.
+
+    Only the newest `max_messages` stay in memory; older ones are appended to
+    a per-session JSONL file in `spill_dir` and can be read back with `older()`.
+    With an `archive` (a ConversationStore that already holds every message)
+    nothing is written here: evicted messages are simply dropped from memory
+    and paged back from the archive.
+    """
+
+    def __init__(self, session_id, max_messages=DEFAULT_MAX_MESSAGES, spill_dir=DEFAULT_SPILL_DIR, archive=None):
+        self.session_id = session_id
+        self.max_messages = max_messages
+        self.spill_dir = spill_dir
+        self.archive = archive
+        self.spilled = 0
+        self._messages = deque()
+        # Kept up to date as messages come and go, so reports never walk the transcript
+        self._bytes = 0
+
+    @property
+    def spill_path(self):
+        return os.path.join(self.spill_dir, f"{self.session_id}.jsonl")
+
+    def __iter__(self):
+        return iter(self._messages)
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __bool__(self):
+        return bool(self._messages) or self.spilled > 0
+
+    @property
+    def total(self):
+        return self.spilled + len(self._messages)
+
+    def append(self, role, content):
+        message = Message(role, content)
+        self._messages.append(message)
+        self._bytes += _size(message)
+        # Spill in batches so the file is opened once per quarter of the cap
+        if len(self._messages) > self.max_messages:
+            batch = max(1, self.max_messages // 4)
+            evicted = [self._messages.popleft() for _ in range(batch)]
+            self._bytes -= sum(map(_size, evicted))
+            self._spill(evicted)
+
+    def last(self):
+        return self._messages[-1] if self._messages else None
+
+    def load(self, messages, spilled):
+        """Start from a resumed tail, with `spilled` older messages in the archive"""
+        self._messages = deque(messages)
+        self._bytes = sum(map(_size, self._messages))
+        self.spilled = spilled
+
+    def _spill(self, messages):
+        if not messages:
+            return
+        if self.archive is not None:
+            self.spilled += len(messages)
+            return
+        os.makedirs(self.spill_dir, exist_ok=True)
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            for message in messages:
+                f.write(json.dumps([message.role, message.content], ensure_ascii=False) + "\n")
+        self.spilled += len(messages)
+
+    def older(self):
+        """Yield spilled messages, oldest first"""
+        if not self.spilled:
+            return
+        if self.archive is not None:
+            yield from self.archive.iter_messages(self.session_id, 0, self.spilled)
+            return
+        with open(self.spill_path, encoding="utf-8") as f:
+            for line in f:
+                role, content = json.loads(line)
+                yield Message(role, content)
+
+    def older_tail(self, limit):
+        """The newest `limit` spilled messages, oldest first"""
+        if self.archive is not None:
+            return self.archive.load_range(self.session_id, max(0, self.spilled - limit), self.spilled)
+        return list(deque(self.older(), maxlen=limit))
+
+    def spill_all(self):
+        """Move every in-memory message to disk"""
+        self._spill(list(self._messages))
+        self._messages.clear()
+        self._bytes = 0
+
+    def restore(self, count):
+        """Bring the newest `count` spilled messages back into memory"""
+        if not self.spilled or count <= 0:
+            return
+        if self.archive is not None:
+            back = self.archive.load_range(self.session_id, max(0, self.spilled - count), self.spilled)
+            self.spilled -= len(back)
+            self._messages.extendleft(reversed(back))
+            self._bytes += sum(map(_size, back))
+            return
+        messages = list(self.older())
+        keep, back = messages[:-count], messages[-count:]
+        # Rewrite the file without the restored tail so nothing is spilled twice
+        self._remove_file()
+        self.spilled = 0
+        self._spill(keep)
+        self._messages.extendleft(reversed(back))
+        self._bytes += sum(map(_size, back))
+
+    def clear(self):
+        self._messages.clear()
+        self._bytes = 0
+        self._remove_file()
+        self.spilled = 0
+
+    def _remove_file(self):
+        try:
+            os.remove(self.spill_path)
+        except FileNotFoundError:
+            pass
+
+    def memory_bytes(self):
+        """Approximate bytes held in memory by the transcript"""
+        return self._bytes
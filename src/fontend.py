@@ -1,64 +1,18 @@
-import os
+import time
+
 import streamlit as st
-from dotenv import load_dotenv
-from google import genai
-from google.genai import types
-
-# Load environment variables
-load_dotenv()
-gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-
-# Medical chatbot system prompt
-MEDICAL_SYSTEM_PROMPT = """
-You are MediAssist, a helpful medical assistant chatbot designed to provide general medical information and guidance.
-Follow these principles:
-
-1. Provide accurate, evidence-based medical information from reliable sources.
-2. Always maintain a professional, empathetic tone in your responses.
-3. For any specific symptoms or health concerns, remind users to consult with a qualified healthcare professional.
-4. Never provide specific diagnoses, treatment plans, or prescriptions.
-5. Clarify when information is general and not tailored to individual circumstances.
-6. Be transparent about limitations of AI-based medical assistance.
-7. Focus on educational content about medical conditions, general wellness, and preventive care.
-8. When discussing medications, only provide general information about common uses and side effects.
-9. For emergency situations, always advise users to contact emergency services immediately.
-10. Respect medical privacy and maintain a respectful approach to all health topics.
-11. Response the answer with VietNamese language.
-"""
-
-# Chat history stored in session state
-if "messages" not in st.session_state:
-    st.session_state.messages = []
-
-def stream_gemini_response(prompt):
-    """Stream response from Gemini model"""
-    # Include chat history in the prompt for context
-    chat_history = ""
-    if len(st.session_state.messages) > 1:  # Skip first system message
-        for message in st.session_state.messages[1:]:
-            role = "User: " if message["role"] == "user" else "Assistant: "
-            chat_history += f"{role}{message['content']}\n\n"
-
-    # Complete prompt with chat history
-    full_prompt = f"Previous conversation:\n{chat_history}\nUser: {prompt}\n\nAssistant: "
-
-    try:
-        response = gemini_client.models.generate_content_stream(
-            model="gemini-2.0-flash",
-            config=types.GenerateContentConfig(
-                system_instruction=MEDICAL_SYSTEM_PROMPT,
-                temperature=0.3,
-                top_p=0.95,
-                top_k=40,
-                max_output_tokens=1024,
-            ),
-            contents=full_prompt
-        )
-
-        return response
-    except Exception as e:
-        st.error(f"Error generating response: {e}")
-        return None
+
+from chat_core.profiling import RerunProfiler
+from chat_core.resources import (SHOW_DIAGNOSTICS, follow_up_chips, get_session, load_engine, older_messages,
+                                 render_stream, stream_response)
+
+# CHAT_PROFILE=1 or ?profile=1 prints per-phase timings for every rerun
+profiler = RerunProfiler(enabled=st.query_params.get("profile") == "1" or None, label="mediassist")
+
+# Persona, client, queue and cache are built once per process
+engine = load_engine("mediassist")
+chat = get_session(engine)
+profiler.mark("setup")
 
 # Streamlit UI
 st.set_page_config(
@@ -92,27 +46,34 @@ with st.sidebar:
 
     # Clear chat button
     if st.button("Clear Conversation"):
-        st.session_state.messages = []
+        chat.clear()
+        if engine.prefetcher is not None:
+            engine.prefetcher.discard(chat.session_id)
+        st.session_state.older_shown = 0
+        st.session_state.follow_ups = ()
         st.rerun()
 
-# Initialize chat with system message if empty
-if not st.session_state.messages:
-    # Add system message (not visible to user)
-    st.session_state.messages.append({"role": "system", "content": MEDICAL_SYSTEM_PROMPT})
-
-# Display chat messages
-for message in st.session_state.messages:
-    if message["role"] != "system":  # Don't show system messages
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
-
-# User input
+    # Shared pool, queue and cache counters; only with CHAT_DIAGNOSTICS=1
+    if SHOW_DIAGNOSTICS:
+        with st.expander("Diagnostics"):
+            st.json(engine.stats())
+    if "render_stats" in st.session_state:
+        with st.expander("Last response timing"):
+            st.json(st.session_state.render_stats)
+profiler.mark("sidebar")
+
+# Display chat messages, with earlier ones paged in from storage on request
+for message in [*older_messages(chat, "Show earlier messages"), *chat.messages]:
+    with st.chat_message(message.role):
+        st.markdown(message.content)
+profiler.mark("transcript")
+
+# User input, or a suggested question clicked on the previous run
 user_input = st.chat_input("Ask a medical question...")
+suggested = st.session_state.pop("pending_prompt", None)
+user_input = user_input or suggested
 
 if user_input:
-    # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "content": user_input})
-
     # Display user message
     with st.chat_message("user"):
         st.markdown(user_input)
@@ -120,24 +81,32 @@ if user_input:
     # Display assistant response with a spinner
     with st.chat_message("assistant"):
         message_placeholder = st.empty()
-        full_response = ""
+
+        # Clicking it reruns the page, which interrupts the answer; the partial text is kept
+        stop_slot = st.empty()
+        stop_slot.button("⏹️ Stop", key="stop_generation")
 
         # Get streamed response
-        response_stream = stream_gemini_response(user_input)
+        request_started = time.perf_counter()
+        st.session_state.follow_ups = ()
+        response_stream = stream_response(engine, chat, user_input)
 
         if response_stream:
-            for chunk in response_stream:
-                if hasattr(chunk, 'text') and chunk.text:
-                    full_response += chunk.text
-                    message_placeholder.markdown(full_response + "▌")
+            def render(text, done):
+                message_placeholder.markdown(text if done else text + "▌")
 
-            # Final response without cursor
-            message_placeholder.markdown(full_response)
-
-            # Add assistant response to chat history
-            st.session_state.messages.append({"role": "assistant", "content": full_response})
+            answer = render_stream(chat, response_stream, render, started_at=request_started)
+            st.session_state.follow_ups = engine.follow_ups(chat, user_input, answer)
         else:
-            message_placeholder.markdown("I'm sorry, I couldn't generate a response. Please try again.")
+            message_placeholder.markdown(engine.persona.error_message)
+        stop_slot.empty()
+    profiler.mark("generation")
+
+# Suggested next questions; their answers are usually ready before the click
+if follow_up_chips(st.session_state.get("follow_ups", ())):
+    st.rerun()
 
 # Footer
-st.caption("MediAssist is powered by Google's Gemini AI. Always consult with healthcare professionals for medical advice.")
\ No newline at end of file
+st.caption("MediAssist is powered by Google's Gemini AI. Always consult with healthcare professionals for medical advice.")
+profiler.mark("footer")
+profiler.report()
@@ -1,37 +1,23 @@
-import os
-import streamlit as st
-from dotenv import load_dotenv
-from google import genai
-from google.genai import types
 import time
 
-# Load environment variables
-load_dotenv()
-gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-
-# Medical chatbot system prompt
-MEDICAL_SYSTEM_PROMPT = """
-You are LyLy, a friendly and empathetic school psychological counseling assistant developed by students from Thống Nhất Secondary and High School.
-
-Follow these principles:
-    1. Cung cấp thông tin và lời khuyên về tâm lý học đường một cách chính xác, dựa trên cơ sở khoa học và nguồn tài liệu đáng tin cậy.
-    2. Luôn giữ giọng điệu thân thiện, lắng nghe và đồng cảm trong mọi phản hồi.
-    3. Với các vấn đề tâm lý phức tạp hoặc khẩn cấp, hãy luôn nhắc nhở người dùng tìm đến chuyên gia tâm lý hoặc người lớn đáng tin cậy để được hỗ trợ trực tiếp.
-    4. Không chẩn đoán hay đưa ra kế hoạch trị liệu cá nhân hóa.
-    5. Luôn làm rõ rằng thông tin chỉ mang tính chất tham khảo chung, không thay thế cho tư vấn chuyên môn.
-    6. Minh bạch về giới hạn của một trợ lý AI trong lĩnh vực tâm lý học đường.
-    7. Tập trung vào việc giáo dục về sức khỏe tâm thần, kỹ năng sống, ứng phó cảm xúc, và xây dựng mối quan hệ tích cực.
-    8. Khi nói đến vấn đề liên quan đến cảm xúc, stress, hoặc áp lực học tập, chỉ cung cấp thông tin và hướng dẫn chung.
-    9. Trong trường hợp khẩn cấp (ví dụ: có dấu hiệu nguy cơ tự làm hại bản thân hoặc người khác), hãy luôn khuyên người dùng liên hệ ngay với thầy cô, cha mẹ, hoặc các dịch vụ hỗ trợ khẩn cấp.
-    10. Tôn trọng sự riêng tư và luôn thể hiện sự tôn trọng với tất cả vấn đề liên quan đến tâm lý học sinh.
-    11. Tất cả phản hồi đều bằng tiếng Việt.
-    12. Trong trường hợp người dùng hỏi các câu hỏi không có liên quan gì về y tế hãy từ chối trả lời theo hướng: tôi là một trợ lý được phát triển để trả lời các thông tin về y tế. Tôi không thể cung cấp bất kỳ thông tin nào liên quan tới các lĩnh vực khác ngoài chuyên môn.
-"""
-
-# Thiết lập chế độ mặc định là Light Mode
-# Đặt biến môi trường trước khi set_page_config
-os.environ['STREAMLIT_THEME'] = 'light'
+import streamlit as st
+
+import assets
+from chat_core.profiling import RerunProfiler
+from chat_core import Message
+from chat_core.markdown import IncrementalMarkdown, markdown_html
+from chat_core.resources import (SHOW_DIAGNOSTICS, follow_up_chips, get_session, load_engine, message_html,
+                                 older_messages, remember_message_html, render_stream, stream_response)
+
+# CHAT_PROFILE=1 or ?profile=1 prints per-phase timings for every rerun
+profiler = RerunProfiler(enabled=st.query_params.get("profile") == "1" or None, label="lyly")
 
+# Persona, client, queue and cache are built once per process
+engine = load_engine("lyly")
+chat = get_session(engine)
+profiler.mark("setup")
+
+# Light mode is the default theme via .streamlit/config.toml
 # Set page configuration
 st.set_page_config(
     page_title="LyLy - Trợ lý tâm lý học đường",
@@ -45,211 +31,32 @@ st.set_page_config(
     }
 )
 
-# Thiết lập Light Mode mặc định thông qua CSS
-st.markdown("""
-<script>
-    // Đặt theme mặc định là light mode
-    localStorage.setItem('color-theme', 'light');
-
-    // Đảm bảo giao diện hiển thị ở light mode
-    document.documentElement.classList.remove('dark');
-    document.documentElement.classList.add('light');
-</script>
-""", unsafe_allow_html=True)
-
-# Apply custom CSS for better styling
-st.markdown("""
-<style>
-    /* Light mode styling */
-    .light {
-        --background-color: #ffffff;
-        --text-color: #333333;
-        --highlight-color: #6a98fb;
-        --user-message-bg: #e6f2ff;
-        --assistant-message-bg: #f0f8ff;
-        --border-color: #dedede;
-    }
-
-    /* Overrides for light mode */
-    .stApp {
-        background-color: #f8f9fa !important;
-    }
-
-    .main-header {
-        font-size: 2.5rem;
-        color: #1E88E5;
-        text-align: center;
-        margin-bottom: 1rem;
-        font-weight: 600;
-    }
-
-    .sub-header {
-        color: #0D47A1;
-        font-weight: 600;
-    }
-
-    .chat-container {
-        border-radius: 10px;
-        padding: 20px;
-        margin-bottom: 20px;
-        background-color: white;
-        box-shadow: 0 1px 3px rgba(0,0,0,0.1);
-    }
-
-    .disclaimer {
-        font-size: 0.9rem;
-        color: #D32F2F;
-        margin-top: 10px;
-    }
-
-    .sidebar-content {
-        padding: 15px;
-        background-color: #ffffff;
-        border-radius: 8px;
-        box-shadow: 0 1px 2px rgba(0,0,0,0.05);
-    }
-
-    .chat-message-user {
-        background-color: #E3F2FD;
-        border-radius: 15px 15px 15px 5px;
-        padding: 12px 18px;
-        margin-bottom: 15px;
-        border-left: 5px solid #1E88E5;
-        box-shadow: 0 1px 2px rgba(0,0,0,0.05);
-    }
-
-    .chat-message-assistant {
-        background-color: #F1F8E9;
-        border-radius: 15px 15px 5px 15px;
-        padding: 12px 18px;
-        margin-bottom: 15px;
-        border-left: 5px solid #689F38;
-        box-shadow: 0 1px 2px rgba(0,0,0,0.05);
-    }
-
-    .stTextInput>div>div>input {
-        border-radius: 20px;
-        padding: 10px 15px;
-        border: 1px solid #dde1e5;
-    }
-
-    .stButton>button {
-        border-radius: 20px;
-        background-color: #1E88E5;
-        color: white;
-        font-weight: 500;
-        padding: 8px 16px;
-        transition: all 0.2s ease;
-    }
-
-    .stButton>button:hover {
-        background-color: #1565C0;
-        box-shadow: 0 2px 5px rgba(0,0,0,0.2);
-    }
-
-    .info-box {
-        background-color: #F1F8E9;
-        border-radius: 10px;
-        padding: 15px;
-        margin: 10px 0;
-        border-left: 5px solid #689F38;
-    }
-
-    .emergency-box {
-        background-color: #FFEBEE;
-        border-radius: 10px;
-        padding: 15px;
-        margin: 10px 0;
-        border-left: 5px solid #D32F2F;
-    }
-
-    footer {
-        text-align: center;
-        margin-top: 30px;
-        font-size: 0.8rem;
-        color: #757575;
-        padding: 15px;
-        background-color: #f8f9fa;
-        border-top: 1px solid #e9ecef;
-        border-radius: 0 0 8px 8px;
-    }
-
-    /* Nút thay đổi theme */
-    .theme-toggle {
-        display: flex;
-        justify-content: center;
-        margin: 10px 0;
-    }
-
-    /* Thanh trượt theme */
-    .theme-slider {
-        padding: 5px;
-        background-color: #f0f2f5;
-        border-radius: 20px;
-        width: 100%;
-        display: flex;
-        justify-content: space-between;
-    }
-</style>
-""", unsafe_allow_html=True)
-
-# Chat history stored in session state
-if "messages" not in st.session_state:
-    st.session_state.messages = []
-    # Add system message (not visible to user)
-    st.session_state.messages.append({"role": "system", "content": MEDICAL_SYSTEM_PROMPT})
+# Stylesheet is served from src/static and cached by the browser
+st.markdown(assets.stylesheet("lyly.css"), unsafe_allow_html=True)
+profiler.mark("styles")
 
 # Configuration in session state
 if "config" not in st.session_state:
     st.session_state.config = {
         "temperature": 0.3,
         "language": "Vietnamese",
-        "model": "gemini-2.0-flash",
+        "model": "auto",
         "theme": "light"  # Thêm cài đặt theme mặc định
     }
 
-def stream_gemini_response(prompt):
-    """Stream response from Gemini model"""
-    # Include chat history in the prompt for context
-    chat_history = ""
-    if len(st.session_state.messages) > 1:  # Skip first system message
-        for message in st.session_state.messages[1:]:
-            role = "User: " if message["role"] == "user" else "Assistant: "
-            chat_history += f"{role}{message['content']}\n\n"
-
-    # Complete prompt with chat history
-    full_prompt = f"Previous conversation:\n{chat_history}\nUser: {prompt}\n\nAssistant: "
-
-    try:
-        response = gemini_client.models.generate_content_stream(
-            model=st.session_state.config["model"],
-            config=types.GenerateContentConfig(
-                system_instruction=MEDICAL_SYSTEM_PROMPT,
-                temperature=st.session_state.config["temperature"],
-                top_p=0.95,
-                top_k=40,
-                max_output_tokens=1024,
-            ),
-            contents=full_prompt
-        )
-
-        return response
-    except Exception as e:
-        st.error(f"Error generating response: {e}")
-        return None
-
 # Main layout
 col1, col2, col3 = st.columns([1, 3, 1])
 with col2:
     st.markdown("<h1 class='main-header'>👩‍💼 Trợ lý LyLy</h1>", unsafe_allow_html=True)
     st.markdown("<p style='text-align: center; font-size: 1.2rem;'>Trợ lý tư vấn sức khoẻ và tâm lý học đường được tạo bởi lớp 3A1 trường THTHCS Thống Nhất</p>", unsafe_allow_html=True)
+profiler.mark("header")
 
 # Sidebar for configurations and information
 with st.sidebar:
     st.markdown("<div class='sidebar-content'>", unsafe_allow_html=True)
 
     # Logo and title
-    st.image("https://cdn-icons-png.flaticon.com/512/4320/4320371.png", width=100)
+    st.markdown(assets.image("logo.svg", width=100), unsafe_allow_html=True)
     st.markdown("<h2 class='sub-header'>Cài đặt LyLy</h2>", unsafe_allow_html=True)
 
     # Theme selection
@@ -264,32 +71,16 @@ with st.sidebar:
     )
     st.session_state.config["theme"] = selected_theme
 
-    # Hiển thị đoạn mã JavaScript để thay đổi theme
-    if selected_theme == "Dark":
-        st.markdown("""
-        <script>
-            localStorage.setItem('color-theme', 'dark');
-            document.documentElement.classList.remove('light');
-            document.documentElement.classList.add('dark');
-        </script>
-        """, unsafe_allow_html=True)
-    else:
-        st.markdown("""
-        <script>
-            localStorage.setItem('color-theme', 'light');
-            document.documentElement.classList.remove('dark');
-            document.documentElement.classList.add('light');
-        </script>
-        """, unsafe_allow_html=True)
-
     # Configuration options
     st.markdown("<h3>⚙️ Tuỳ chỉnh mô hình AI</h3>", unsafe_allow_html=True)
 
-    model_options = ["gemini-2.0-flash"]
+    # "auto" lets the router pick a model per question
+    model_options = ["auto", "gemini-2.0-flash"]
     selected_model = st.selectbox(
         "AI Model:",
         options=model_options,
         index=model_options.index(st.session_state.config["model"]),
+        format_func=lambda option: "Tự động" if option == "auto" else option,
         key="model_select"
     )
     st.session_state.config["model"] = selected_model
@@ -313,116 +104,126 @@ with st.sidebar:
     )
     st.session_state.config["language"] = selected_language
 
+    # Bộ đếm của kết nối, hàng đợi và bộ nhớ đệm dùng chung; chỉ hiện khi CHAT_DIAGNOSTICS=1
+    if SHOW_DIAGNOSTICS:
+        with st.expander("🔌 Thông số hệ thống"):
+            st.json(engine.stats())
+    if "render_stats" in st.session_state:
+        with st.expander("⏱️ Hiệu năng câu trả lời gần nhất"):
+            st.json(st.session_state.render_stats)
+
     st.divider()
 
     # About and Disclaimers
     st.markdown("<h3>ℹ️ Giới thiệu về LyLy</h3>", unsafe_allow_html=True)
-    st.markdown("""
-    <div class='info-box'>
-    LyLy là trợ lý tư vấn tâm lý học đường được phát triển bởi nhóm học sinh trường THTHCS Thống Nhất, nhằm hỗ trợ các bạn học sinh giải quyết các vấn đề tâm lý phổ biến.
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(assets.read("lyly_about.html"), unsafe_allow_html=True)
 
     st.markdown("<h3>⚠️ Lưu ý quan trọng</h3>", unsafe_allow_html=True)
-    st.markdown("""
-    <div class='emergency-box'>
-    <strong>Miễn Trừ Trách Nhiệm</strong><br>
-    LyLy hiện tại đang trong giai đoạn phát triển. Các lời khuyên từ LyLy chỉ mang tính chất tham khảo.
-    </div>
-    <div class='disclaimer'>
-    • Đối với các vấn đề tâm lý nghiêm trọng, vui lòng liên hệ với chuyên gia tâm lý hoặc thầy cô giáo.<br>
-    • Không sử dụng LyLy cho các tình huống khẩn cấp.<br>
-    • Thông tin được cung cấp không thay thế cho tư vấn chuyên môn.
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(assets.read("lyly_disclaimer.html"), unsafe_allow_html=True)
 
     # Clear chat button with confirmation
     st.divider()
     if st.button("🗑️ Xoá Cuộc Hội Thoại", use_container_width=True):
-        st.session_state.messages = [{"role": "system", "content": MEDICAL_SYSTEM_PROMPT}]
-        st.rerun()
+        chat.clear()
+        if engine.prefetcher is not None:
+            engine.prefetcher.discard(chat.session_id)
+        st.session_state.older_shown = 0
+        st.session_state.follow_ups = ()
 
     st.markdown("</div>", unsafe_allow_html=True)
+profiler.mark("sidebar")
 
-# Main chat interface
-chat_container = st.container()
+# User input; pinned to the bottom of the page wherever it is called.
+# The prompt is handed to the transcript fragment through session state so a
+# fragment-only rerun never submits it twice.
+user_input = st.chat_input("Hãy chia sẻ câu hỏi hoặc vấn đề của bạn...")
+if user_input:
+    st.session_state.pending_prompt = user_input
+
+
+def format_message(message, body=None):
+    """A chat bubble; `body` is the content's escaped HTML when it is already converted"""
+    message_class = "chat-message-user" if message.role == "user" else "chat-message-assistant"
+    display_name = "Bạn" if message.role == "user" else "LyLy"
+    body = markdown_html(message.content) if body is None else body
+    # The name leads the first paragraph
+    label = f"<strong>{display_name}:</strong> "
+    body = f"<p>{label}{body[3:]}" if body.startswith("<p>") else f"<p>{label}</p>{body}"
+    return f"<div class='{message_class}'>{body}</div>"
 
-with chat_container:
+
+@st.fragment
+def transcript():
+    """Chat history plus the turn being answered.
+
+    Past messages reuse their cached HTML, and the new turn is drawn in place
+    below them, so a turn needs neither re-formatting the history nor a
+    second full rerun. Paging in older messages only reruns this fragment.
+    """
+    prompt = st.session_state.pop("pending_prompt", None)
     st.markdown("<div class='chat-container'>", unsafe_allow_html=True)
 
     # Display welcome message if no messages
-    if len(st.session_state.messages) <= 1:
-        st.markdown("""
-        <div class='chat-message-assistant'>
-        <p><strong>LyLy:</strong> Xin chào! Mình là LyLy, trợ lý tư vấn tâm lý học đường được phát triển bởi nhóm học sinh trường THTHCS Thống Nhất. Mình có thể giúp bạn giải đáp các thắc mắc về sức khỏe tâm lý, các vấn đề học tập hoặc các mối quan hệ ở trường học. Bạn có điều gì muốn chia sẻ với mình không?</p>
-        </div>
-        """, unsafe_allow_html=True)
-
-    # Display chat messages
-    for message in st.session_state.messages:
-        if message["role"] != "system":  # Don't show system messages
-            message_class = "chat-message-user" if message["role"] == "user" else "chat-message-assistant"
-            display_name = "Bạn" if message["role"] == "user" else "LyLy"
-
-            st.markdown(f"""
-            <div class='{message_class}'>
-            <p><strong>{display_name}:</strong> {message["content"]}</p>
-            </div>
-            """, unsafe_allow_html=True)
+    if not chat.messages and not prompt:
+        st.markdown(assets.read("lyly_welcome.html"), unsafe_allow_html=True)
+
+    # Display chat messages, with earlier ones paged in from storage on request
+    for message in [*older_messages(chat, "⬆️ Xem tin nhắn cũ hơn"), *chat.messages]:
+        st.markdown(message_html(message, format_message), unsafe_allow_html=True)
+    profiler.mark("transcript")
+
+    if prompt:
+        st.markdown(message_html(Message("user", prompt), format_message), unsafe_allow_html=True)
+
+        # Typing notice, replaced by the answer as it streams in
+        response_container = st.empty()
+        typing_text = "LyLy đang suy nghĩ câu trả lời..."
+        response_container.markdown(f"<div class='chat-message-assistant'><p>{typing_text}</p></div>", unsafe_allow_html=True)
+
+        # Get streamed response
+        request_started = time.perf_counter()
+        model = None if st.session_state.config["model"] == "auto" else st.session_state.config["model"]
+        temperature = st.session_state.config["temperature"]
+        st.session_state.follow_ups = ()
+        response_stream = stream_response(engine, chat, prompt, model=model, temperature=temperature)
+
+        if response_stream:
+            # Finished paragraphs are converted once; each redraw only reparses the last one
+            markdown = IncrementalMarkdown()
+
+            def render(text, done):
+                message = Message("assistant", text)
+                if done:
+                    html = remember_message_html(message, format_message(message, markdown.render(text)))
+                else:
+                    html = format_message(message, markdown.render(text + "▌"))
+                response_container.markdown(html, unsafe_allow_html=True)
+
+            answer = render_stream(chat, response_stream, render, started_at=request_started)
+            st.session_state.follow_ups = engine.follow_ups(chat, prompt, answer, model=model, temperature=temperature)
+        else:
+            response_container.markdown(format_message(Message("assistant", engine.persona.error_message)), unsafe_allow_html=True)
+        profiler.mark("generation")
+
+    # Suggested next questions; their answers are usually ready before the click
+    if follow_up_chips(st.session_state.get("follow_ups", ())):
+        st.rerun()
 
     st.markdown("</div>", unsafe_allow_html=True)
 
-# User input area
-user_input = st.chat_input("Hãy chia sẻ câu hỏi hoặc vấn đề của bạn...")
 
-if user_input:
-    # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "content": user_input})
-
-    # Create a placeholder for the assistant's message
-    message_placeholder = st.empty()
-
-    # Display typing animation
-    typing_text = "LyLy đang suy nghĩ câu trả lời..."
-    with st.chat_message("assistant"):
-        message_placeholder.markdown(f"<div class='chat-message-assistant'><p>{typing_text}</p></div>", unsafe_allow_html=True)
-
-    # Get streamed response
-    response_stream = stream_gemini_response(user_input)
-    full_response = ""
-
-    if response_stream:
-        # Replace typing animation with actual response
-        with st.chat_message("assistant"):
-            response_container = st.empty()
-
-            # Process the streaming response
-            for chunk in response_stream:
-                if hasattr(chunk, 'text') and chunk.text:
-                    full_response += chunk.text
-                    response_container.markdown(f"<div class='chat-message-assistant'><p><strong>LyLy:</strong> {full_response}▌</p></div>", unsafe_allow_html=True)
-                    time.sleep(0.01)  # Small delay for smoother appearance
-
-            # Final response without cursor
-            response_container.markdown(f"<div class='chat-message-assistant'><p><strong>LyLy:</strong> {full_response}</p></div>", unsafe_allow_html=True)
-
-            # Add assistant response to chat history
-            st.session_state.messages.append({"role": "assistant", "content": full_response})
-    else:
-        with st.chat_message("assistant"):
-            st.markdown(f"""
-            <div class='chat-message-assistant'>
-            <p><strong>LyLy:</strong> Xin lỗi, mình không thể tạo phản hồi lúc này. Vui lòng thử lại sau nhé.</p>
-            </div>
-            """, unsafe_allow_html=True)
-
-    # Rerun to update the UI
-    st.rerun()
+# Main chat interface
+chat_area = st.container()
+# The stop button lives outside the fragment: only a full-page rerun interrupts
+# the running answer, and render_stream then keeps the partial text
+stop_slot = st.empty()
+if "pending_prompt" in st.session_state:
+    stop_slot.button("⏹️ Dừng", key="stop_generation")
+with chat_area:
+    transcript()
+stop_slot.empty()
 
 # Footer
-st.markdown("""
-<footer>
-    <p>LyLy v1.0 | Được phát triển bởi nhóm học sinh trường THTHCS Thống Nhất | © 2025</p>
-    <p>Luôn sẵn sàng lắng nghe và hỗ trợ các bạn học sinh.</p>
-</footer>
-""", unsafe_allow_html=True)
\ No newline at end of file
+st.markdown(assets.read("lyly_footer.html"), unsafe_allow_html=True)
+profiler.mark("footer")
+profiler.report()